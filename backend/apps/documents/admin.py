@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     DocumentTemplate, Document, DocumentSection, DocumentSectionVersion,
-    Citation, SectionComment, SectionLock, ReviewRequest, DocumentExport, EditHistory
+    Citation, SectionComment, SectionLock, ReviewRequest, DocumentExport, EditHistory,
+    GenerationRun, GenerationSectionRun
 )
 
 @admin.register(DocumentTemplate)
@@ -48,4 +49,15 @@ class DocumentExportAdmin(admin.ModelAdmin):
 @admin.register(EditHistory)
 class EditHistoryAdmin(admin.ModelAdmin):
     list_display = ("section", "version", "edited_by", "action", "created_at")
-    list_filter = ("action",)
\ No newline at end of file
+    list_filter = ("action",)
+
+@admin.register(GenerationRun)
+class GenerationRunAdmin(admin.ModelAdmin):
+    list_display = ("document", "task_id", "status", "attempts", "created_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("task_id",)
+
+@admin.register(GenerationSectionRun)
+class GenerationSectionRunAdmin(admin.ModelAdmin):
+    list_display = ("run", "section", "status", "prompt_hash", "updated_at")
+    list_filter = ("status",)
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:45
+
+import apps.documents.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationRun',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=apps.documents.models.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('task_id', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('user_prompt', models.TextField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=1)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='generation_runs', to='documents.document')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GenerationSectionRun',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=apps.documents.models.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('reused', 'Reused'), ('skipped', 'Skipped')], default='pending', max_length=20)),
+                ('prompt_hash', models.CharField(blank=True, max_length=64)),
+                ('kb_fingerprint', models.CharField(blank=True, help_text='Knowledge base state the draft retrieved from', max_length=64)),
+                ('citations', models.JSONField(blank=True, default=list)),
+                ('base_version', models.ForeignKey(blank=True, help_text='Section version when the run started; a different one means it was edited', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.documentsectionversion')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='section_runs', to='documents.generationrun')),
+                ('section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='generation_runs', to='documents.documentsection')),
+                ('version', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.documentsectionversion')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='generationrun',
+            index=models.Index(fields=['document', 'status'], name='documents_g_documen_75ae2f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generationsectionrun',
+            index=models.Index(fields=['section', 'prompt_hash'], name='documents_g_section_786157_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='generationsectionrun',
+            unique_together={('run', 'section')},
+        ),
+    ]
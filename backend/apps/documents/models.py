@@ -187,4 +187,44 @@ class DocumentExport(TimestampedModel):
 
     class Meta:
         ordering = ["-created_at"]
-        indexes = [models.Index(fields=['document', 'status'])]
\ No newline at end of file
+        indexes = [models.Index(fields=['document', 'status'])]
+
+
+class GenerationRun(TimestampedModel):
+    """One ai_generate_document run, keyed by its Celery task id so retries resume it"""
+    STATUS_CHOICES = [("running", "Running"), ("completed", "Completed"), ("failed", "Failed")]
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="generation_runs")
+    task_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="running")
+    user_prompt = models.TextField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=1)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=['document', 'status'])]
+
+class GenerationSectionRun(TimestampedModel):
+    """Per-section checkpoint of a generation run"""
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("completed", "Completed"),
+        ("reused", "Reused"),
+        ("skipped", "Skipped"),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    run = models.ForeignKey(GenerationRun, on_delete=models.CASCADE, related_name="section_runs")
+    section = models.ForeignKey(DocumentSection, on_delete=models.CASCADE, related_name="generation_runs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    base_version = models.ForeignKey(DocumentSectionVersion, null=True, blank=True, on_delete=models.SET_NULL, related_name="+",
+                                     help_text="Section version when the run started; a different one means it was edited")
+    prompt_hash = models.CharField(max_length=64, blank=True)
+    kb_fingerprint = models.CharField(max_length=64, blank=True, help_text="Knowledge base state the draft retrieved from")
+    version = models.ForeignKey(DocumentSectionVersion, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    citations = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        unique_together = ("run", "section")
+        indexes = [models.Index(fields=['section', 'prompt_hash'])]
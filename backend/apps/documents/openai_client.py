@@ -204,4 +204,22 @@ def refine_document(document_text, instruction, model=None):
 
     except Exception as e:
         logger.error("OpenAI refine error: %s", str(e), exc_info=True)
-        raise Exception(f"OpenAI refine error: {str(e)}")
\ No newline at end of file
+        raise Exception(f"OpenAI refine error: {str(e)}")
+
+def summarize_section(title, content, max_tokens, model=None):
+    """Condense a section for use as context when drafting the sections that build on it."""
+    model = model or settings.DOC_GEN_MODEL or "gpt-4-turbo"
+    messages = [
+        {"role": "system", "content": (
+            "You summarize sections of project proposals so other sections can stay consistent with them. "
+            f"Write at most {max_tokens} tokens of plain prose. Keep names, figures, targets, budgets, "
+            "locations and commitments; drop citations, tables and formatting."
+        )},
+        {"role": "user", "content": f"Section: {title}\n\n{content}"},
+    ]
+    try:
+        response = client.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens)
+        return (response.choices[0].message.content or "").strip()
+    except Exception as e:
+        logger.error("OpenAI summarize error: %s", str(e), exc_info=True)
+        raise Exception(f"OpenAI summarize error: {str(e)}")
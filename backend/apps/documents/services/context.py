@@ -0,0 +1,124 @@
+"""
+Token-budgeted context for section prompts.
+
+Instead of the full text of every related section, a prompt carries the
+document outline plus as much of the related sections as fits in the token
+budget: the nearest ones in full, older ones as summaries, and the rest by
+title only (they are still listed in the outline). Summaries are made once
+per section version and cached in DocumentSectionVersion.metadata["summary"].
+"""
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from apps.knowledge_base import chunker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SectionText:
+    key: str
+    title: str
+    content: str
+    version_id: Optional[object] = None
+    summary: Optional[str] = None  # cached summary of this version, if any
+
+    @classmethod
+    def from_version(cls, key, title, version, summary_tokens: int) -> "SectionText":
+        if version is None:
+            return cls(key, title, "")
+        cached = (version.metadata or {}).get("summary") or {}
+        return cls(key, title, version.content, version.id,
+                   cached.get("text") if cached.get("max_tokens") == summary_tokens else None)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    enc = chunker.get_encoding()
+    ids = enc.encode_ordinary(text)
+    if len(ids) <= max_tokens:
+        return text
+    return enc.decode(ids[:max(max_tokens, 0)]).rstrip()
+
+
+def outline_text(titles: List[str], current: Optional[str] = None) -> str:
+    lines = [f"- {t}" + (" (this section)" if t == current else "") for t in titles]
+    return "Document outline:\n" + "\n".join(lines)
+
+
+class SummaryCache:
+    """
+    Summaries for one generation run. Each section version is summarized at
+    most once, even when several concurrent drafts need it. Summaries made
+    here are kept in .new (version id -> text) until the caller stores them.
+    """
+
+    def __init__(self, summarize: Callable[[str, str, int], str], max_tokens: int):
+        self.summarize = summarize
+        self.max_tokens = max_tokens
+        self.new: Dict[object, str] = {}
+        self._futures: Dict[object, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, section: SectionText) -> str:
+        if section.summary:
+            return section.summary
+        if chunker.count_tokens(section.content) <= self.max_tokens:
+            return section.content
+        key = section.version_id or (section.key, section.content)
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            text = truncate_tokens(self.summarize(section.title, section.content, self.max_tokens), self.max_tokens)
+        except Exception as e:
+            # a missing summary shouldn't fail the draft; fall back to the section's opening
+            logger.warning(f"Could not summarize section '{section.title}', using its opening instead: {e}")
+            future.set_result(truncate_tokens(section.content, self.max_tokens))
+            return future.result()
+        if section.version_id is not None:
+            with self._lock:
+                self.new[section.version_id] = text
+        future.set_result(text)
+        return text
+
+    def pop_new(self) -> Dict[object, str]:
+        with self._lock:
+            new, self.new = self.new, {}
+        return new
+
+
+def build_context(sections: List[SectionText], budget: int, summaries: SummaryCache) -> str:
+    """
+    Sections (in document order) rendered within budget tokens. Later
+    sections are placed first, in full if that still leaves room to
+    summarize the earlier ones, otherwise as a summary.
+    """
+    sections = [s for s in sections if s.content.strip()]
+    sizes = [chunker.count_tokens(s.content) for s in sections]
+    # the longer of the two headers, and the blank line joining parts
+    header_sizes = [chunker.count_tokens(f"## {s.title} (summary)\n") + 2 for s in sections]
+    reserve = [min(n, summaries.max_tokens) + h for n, h in zip(sizes, header_sizes)]
+    remaining = budget
+    parts = [None] * len(sections)
+    for i in reversed(range(len(sections))):
+        s = sections[i]
+        # room kept for the earlier sections, but never so much that this one can't get a summary in
+        held_back = min(sum(reserve[:i]), max(remaining - reserve[i], 0))
+        available = remaining - held_back - header_sizes[i]
+        if sizes[i] <= available:
+            header, body, used = f"## {s.title}\n", s.content, sizes[i]
+        elif available > 0:
+            body = truncate_tokens(summaries.get(s), available)
+            header, used = f"## {s.title} (summary)\n", chunker.count_tokens(body)
+        else:
+            continue
+        parts[i] = header + body
+        remaining -= header_sizes[i] + used
+    return "\n\n".join(p for p in parts if p)
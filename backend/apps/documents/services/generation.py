@@ -0,0 +1,118 @@
+"""
+Dependency-aware scheduling for whole-document generation.
+
+Template sections may declare which sections they build on:
+
+    {"sections": [
+        {"key": "background", "title": "Background", "depends_on": []},
+        {"key": "objectives", "title": "Objectives", "depends_on": []},
+        {"key": "approach", "title": "Approach", "depends_on": ["background", "objectives"]},
+        {"key": "summary", "title": "Executive Summary"}
+    ]}
+
+A section without "depends_on" depends on every section before it, which is
+how documents were always generated. Sections whose dependencies are done
+run concurrently, so wall-clock time follows the longest dependency chain.
+"""
+import logging
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+def section_dependencies(structure: dict, section_keys: List[str]) -> Dict[str, List[str]]:
+    """Map each section key (in document order) to the keys it waits for."""
+    declared = {s.get("key"): s.get("depends_on") for s in (structure or {}).get("sections", []) if s.get("key")}
+    deps = {}
+    for i, key in enumerate(section_keys):
+        wanted = declared.get(key)
+        if wanted is None:
+            deps[key] = section_keys[:i]
+            continue
+        unknown = [k for k in wanted if k not in section_keys]
+        if unknown:
+            logger.warning(f"Section '{key}' depends on unknown sections {unknown}; ignoring them")
+        deps[key] = [k for k in section_keys if k in wanted and k != key]
+    _check_acyclic(deps)
+    return deps
+
+
+def _check_acyclic(deps: Dict[str, List[str]]):
+    state = {}  # key -> "visiting" | "done"
+
+    def visit(key, path):
+        if state.get(key) == "done":
+            return
+        if state.get(key) == "visiting":
+            raise ValueError(f"Section dependencies form a cycle: {' -> '.join(path + [key])}")
+        state[key] = "visiting"
+        for dep in deps.get(key, []):
+            visit(dep, path + [key])
+        state[key] = "done"
+
+    for key in deps:
+        visit(key, [])
+
+
+def critical_path(deps: Dict[str, List[str]]) -> int:
+    """Number of sections on the longest dependency chain."""
+    depth = {}
+
+    def chain(key):
+        if key not in depth:
+            depth[key] = 1 + max((chain(d) for d in deps[key]), default=0)
+        return depth[key]
+
+    return max((chain(k) for k in deps), default=0)
+
+
+def run_dag(deps: Dict[str, List[str]], work: Callable[[str, dict], object], max_workers: int = 4,
+            on_done: Callable[[str, object], None] = None) -> dict:
+    """
+    Run work(key, {dep_key: dep_result}) for every key once its dependencies
+    have finished, up to max_workers at a time. on_done(key, result) runs on
+    the calling thread as each one finishes (e.g. to save it). The first
+    failure stops new work from starting; work already running still ends
+    and goes through on_done (its result is paid for), then the failure is raised.
+    """
+    results = {}
+    waiting = {key: set(d) for key, d in deps.items()}
+    dependents = defaultdict(list)
+    for key, d in deps.items():
+        for dep in d:
+            dependents[dep].append(key)
+    error = None
+
+    max_workers = max(1, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="section") as pool:
+        running = {}
+
+        def start_ready():
+            # never more than the pool runs at once: nothing sits queued that a failure couldn't stop
+            ready = [k for k, pending in waiting.items() if not pending]
+            for key in ready[:max_workers - len(running)]:
+                del waiting[key]
+                running[pool.submit(work, key, {d: results[d] for d in deps[key]})] = key
+
+        start_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                try:
+                    results[key] = future.result()
+                    if on_done:
+                        on_done(key, results[key])
+                except Exception as e:
+                    logger.warning(f"Section '{key}' failed: {e}")
+                    error = error or e
+                    continue
+                for dependent in dependents[key]:
+                    waiting[dependent].discard(key)
+            if error is None:
+                start_ready()
+    if error is not None:
+        raise error
+    return results
@@ -0,0 +1,54 @@
+"""
+Knowledge base retrieval for a section being drafted.
+
+The retrieval query is built from what the section is about (its title and
+template key, the document title and the user's instructions), not from the
+assembled generation prompt, whose system prompt and neighbouring sections
+would dominate the embedding. The few sub-queries are embedded in one
+batched, cached call and their hits merged.
+"""
+import re
+from typing import List, Optional
+from apps.knowledge_base.openai_client import cached_embed_texts
+from apps.knowledge_base.retrieval import SearchHit, search
+from .context import truncate_tokens
+
+MAX_QUERY_TOKENS = 64
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def build_section_queries(doc_title: str, section_title: str, section_key: str = "",
+                          user_prompt: Optional[str] = None, max_queries: int = 3) -> List[str]:
+    """A handful of short queries describing the section, most specific first."""
+    candidates = [f"{section_title} for {doc_title}" if doc_title else section_title]
+    key_text = re.sub(r"[_\-]+", " ", section_key or "").strip()
+    if key_text and not _words(key_text) <= _words(section_title):
+        candidates.append(f"{key_text} {doc_title}".strip())
+    if user_prompt and user_prompt.strip():
+        candidates.append(f"{section_title}: {user_prompt.strip()}")
+
+    queries, seen = [], set()
+    for q in candidates:
+        q = truncate_tokens(" ".join(q.split()), MAX_QUERY_TOKENS)
+        if q.lower() not in seen:
+            seen.add(q.lower())
+            queries.append(q)
+    return queries[:max_queries]
+
+
+def search_queries(org, queries: List[str], top_k: int = 6, snippet_chars=None) -> List[SearchHit]:
+    """
+    Top-k hits over all queries: one embeddings request for every query,
+    one search per query, each chunk kept once with its best (lowest) score.
+    """
+    if not queries:
+        return []
+    best = {}
+    for vec in cached_embed_texts(queries):
+        for hit in search(org, vec, top_k=top_k, snippet_chars=snippet_chars):
+            if hit.chunk_id not in best or hit.score < best[hit.chunk_id].score:
+                best[hit.chunk_id] = hit
+    return sorted(best.values(), key=lambda h: h.score)[:top_k]
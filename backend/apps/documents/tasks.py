@@ -1,22 +1,130 @@
+import hashlib
 import logging
 import difflib
 import re
 from celery import shared_task
 from django.conf import settings
 from django.core.files.base import ContentFile
-from django.db import transaction, connection
+from django.db import connection, transaction
 from django.utils import timezone
-from .models import DocumentSection, DocumentSectionVersion, Citation, Document, DocumentExport
+from .models import (
+    DocumentSection, DocumentSectionVersion, Citation, Document, DocumentExport,
+    GenerationRun, GenerationSectionRun,
+)
 from .services.exporters.docx_exporter import export_document_to_docx
 from .services.exporters.pdf_exporter import export_document_to_pdf
 from .services.exporters.excel_exporter import export_document_to_excel
-from .openai_client import generate_draft, refine_document
-from apps.knowledge_base.openai_client import embed_texts
+from .openai_client import generate_draft, refine_document, summarize_section
+from .services.context import SectionText, SummaryCache, build_context, outline_text
+from .services.generation import critical_path, run_dag, section_dependencies
+from .services.section_queries import build_section_queries, search_queries
+from apps.knowledge_base.embedding_store import embed_chunks
 from apps.knowledge_base.models import KnowledgeDocument, DocumentChunk
-from apps.knowledge_base.chunker import chunk_text, count_tokens
+from apps.knowledge_base.chunker import chunk_text_with_tokens, count_tokens
+from apps.knowledge_base.retrieval import kb_fingerprint
+from apps.knowledge_base.partitions import ensure_partition
+from apps.knowledge_base.chunk_loader import load_chunks
+from apps.knowledge_base.result_cache import bump_kb_generation
 
 logger = logging.getLogger(__name__)
 
+
+def _kb_chunks(hits):
+    """Retrieval hits in the shape generate_draft() expects."""
+    return [
+        {"id": str(h.chunk_id), "document_id": str(h.document_id), "chunk_index": h.chunk_index,
+         "text": h.snippet, "title": h.document_title, "score": h.score}
+        for h in hits
+    ]
+
+_UNCHECKED = object()
+
+
+def _save_generated_version(section_id, doc, content, citations, expect_version=_UNCHECKED):
+    """
+    Store AI output as the section's new current version, with its citations.
+
+    Runs in one short transaction holding the section row lock. With
+    expect_version, the output is dropped (None is returned) if the section
+    has been locked or edited since generation started.
+    """
+    with transaction.atomic():
+        sec = DocumentSection.objects.select_for_update().get(id=section_id)
+        if expect_version is not _UNCHECKED and (sec.is_locked or sec.current_version_id != expect_version):
+            return None
+        v = DocumentSectionVersion.objects.create(
+            section=sec, content=content,
+            created_by=doc.created_by, ai_generated=True
+        )
+        sec.current_version = v
+        sec.save(update_fields=["current_version"])
+
+        for cit in citations:
+            Citation.objects.create(
+                section=sec, marker=cit["marker"], reference_text=cit["reference_text"],
+                kb_document_id=cit.get("kb_document_id"), confidence_score=cit.get("confidence_score")
+            )
+    return v
+
+
+def _context_budget(*prompt_parts):
+    """Tokens left for section context once the rest of the prompt is counted."""
+    return settings.DOC_PROMPT_TOKEN_BUDGET - sum(count_tokens(p) for p in prompt_parts)
+
+
+def _store_summaries(summaries):
+    """Cache new section summaries on the versions they summarize."""
+    for version_id, text in summaries.pop_new().items():
+        v = DocumentSectionVersion.objects.filter(id=version_id).first()
+        if v is None:
+            continue
+        v.metadata = {**(v.metadata or {}), "summary": {"text": text, "max_tokens": summaries.max_tokens}}
+        v.save(update_fields=["metadata"])
+
+
+def _prompt_hash(prompt, top_k):
+    model = settings.DOC_GEN_MODEL or "gpt-4-turbo"
+    return hashlib.sha256(f"{model}|{top_k}|{prompt}".encode("utf-8")).hexdigest()
+
+
+def _start_generation_run(doc, task_id, user_prompt, sections):
+    """
+    The GenerationRun for this task, resumed if a previous attempt with the
+    same task id exists, and its per-section checkpoints keyed by section key.
+    """
+    with transaction.atomic():
+        run = GenerationRun.objects.select_for_update().filter(task_id=task_id).first() if task_id else None
+        if run is None:
+            run = GenerationRun.objects.create(document=doc, task_id=task_id, user_prompt=user_prompt)
+        elif run.status != "completed":
+            run.attempts += 1
+            run.status, run.error = "running", None
+            run.save(update_fields=["attempts", "status", "error", "updated_at"])
+        existing = set(run.section_runs.values_list("section_id", flat=True))
+        GenerationSectionRun.objects.bulk_create([
+            GenerationSectionRun(run=run, section=sec, base_version_id=sec.current_version_id)
+            for sec in sections.values() if sec.id not in existing
+        ])
+    by_section = {cp.section_id: cp for cp in run.section_runs.all()}
+    return run, {key: by_section[sec.id] for key, sec in sections.items()}
+
+
+def _reusable_outputs(doc, run, fingerprint):
+    """(section id, prompt hash) -> the latest earlier checkpoint drafted against the same KB state."""
+    prior = (
+        GenerationSectionRun.objects
+        .filter(section__document=doc, status__in=["completed", "reused"], kb_fingerprint=fingerprint,
+                version__isnull=False)
+        .exclude(run=run)
+        .select_related("version")
+        .order_by("-created_at")
+    )
+    reusable = {}
+    for cp in prior:
+        reusable.setdefault((cp.section_id, cp.prompt_hash), cp)
+    return reusable
+
+
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
 def ai_generate_section(self, section_id, system_prompt=None, user_prompt=None, top_k=6):
     """Regenerate a single section, optionally aware of the rest of the document."""
@@ -28,66 +136,40 @@ def ai_generate_section(self, section_id, system_prompt=None, user_prompt=None,
         # Build base system prompt
         system_prompt = system_prompt or settings.DOC_SYSTEM_PROMPT
 
-        # Gather context from other sections (to avoid disjointed edits)
-        other_sections_context = "\n\n".join(
-            f"## {s.title}\n{s.current_version.content}"
-            for s in doc.sections.exclude(id=sec.id)
-            if s.current_version
-        )
-
-        # Build final prompt
-        prompt = (
+        # Gather context from other sections (to avoid disjointed edits), within the token budget
+        all_sections = list(doc.sections.select_related("current_version").order_by("order"))
+        summaries = SummaryCache(summarize_section, settings.DOC_SECTION_SUMMARY_TOKENS)
+        head = (
             f"{system_prompt}\n\n"
             f"Document title: {doc.title}\n"
-            f"Existing content from other sections:\n{other_sections_context}\n\n"
-            f"Now regenerate the section '{sec.title}'. "
+            f"{outline_text([s.title for s in all_sections], current=sec.title)}\n\n"
+            f"Existing content from other sections:\n"
+        )
+        tail = (
+            f"\n\nNow regenerate the section '{sec.title}'. "
             f"{user_prompt or 'Draft content for this section.'}\n"
             "Ensure markdown formatting for tables if specified in template."
         )
+        other_sections_context = build_context(
+            [SectionText.from_version(s.key, s.title, s.current_version, summaries.max_tokens)
+             for s in all_sections if s.id != sec.id],
+            _context_budget(head, tail), summaries,
+        )
+        _store_summaries(summaries)
+
+        # Build final prompt
+        prompt = head + other_sections_context + tail
         logger.debug(f"Prompt for section {sec.id}: {prompt}")
 
-        # Embed query
-        q_emb = embed_texts([prompt])[0]
-
-        # Vector search in KB
-        with connection.cursor() as cur:
-            cur.execute(
-                """
-                SELECT dc.id, dc.document_id, dc.chunk_index, dc.text, kd.title,
-                       dc.embedding <=> %s::vector as score
-                FROM knowledge_base_documentchunk dc
-                JOIN knowledge_base_knowledgedocument kd ON dc.document_id = kd.id
-                WHERE kd.organization_id = %s AND kd.is_active = true
-                ORDER BY score ASC
-                LIMIT %s
-                """,
-                [q_emb, doc.organization.id if doc.organization else None, top_k]
-            )
-            rows = cur.fetchall()
-
-        kb_chunks = [
-            {"id": str(r[0]), "document_id": str(r[1]), "chunk_index": r[2],
-             "text": r[3], "title": r[4], "score": float(r[5])}
-            for r in rows
-        ]
+        # Search the KB with short queries about this section, not the whole prompt
+        queries = build_section_queries(doc.title, sec.title, sec.key, user_prompt)
+        kb_chunks = _kb_chunks(search_queries(doc.organization_id, queries, top_k=top_k))
 
         # AI generation
         result = generate_draft(prompt, template=sec.title, kb_chunks=kb_chunks)
         content, citations = result["content"], result["citations"]
 
-        with transaction.atomic():
-            v = DocumentSectionVersion.objects.create(
-                section=sec, content=content,
-                created_by=doc.created_by, ai_generated=True
-            )
-            sec.current_version = v
-            sec.save(update_fields=["current_version"])
-
-            for cit in citations:
-                Citation.objects.create(
-                    section=sec, marker=cit["marker"], reference_text=cit["reference_text"],
-                    kb_document_id=cit.get("kb_document_id"), confidence_score=cit.get("confidence_score")
-                )
+        v = _save_generated_version(sec.id, doc, content, citations)
 
         logger.info(f"Completed ai_generate_section for section_id: {section_id}")
         return {"section_id": str(sec.id), "version_id": str(v.id)}
@@ -98,78 +180,131 @@ def ai_generate_section(self, section_id, system_prompt=None, user_prompt=None,
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
 def ai_generate_document(self, document_id, user_prompt=None, top_k=8):
-    """Generate document sequentially: each section in order, with context from prior sections."""
-    logger.info(f"Starting ai_generate_document (sequential) for document_id: {document_id}")
+    """
+    Generate every section, each with the content of the sections it depends
+    on (see services/generation.py). Independent sections are drafted
+    concurrently, with no transaction open while embedding, searching or
+    calling the LLM; each section is saved in its own short transaction as
+    soon as it is done.
+
+    Each run is a GenerationRun keyed by the Celery task id, with one
+    GenerationSectionRun checkpoint per section. A retry of the same task
+    keeps the sections already saved and only drafts the rest. A section
+    whose prompt and knowledge base state match an earlier run's reuses that
+    output instead of calling the LLM again. Sections that are locked, or
+    that someone edits while generation runs, keep their content and are
+    used as-is by the sections depending on them.
+    """
+    logger.info(f"Starting ai_generate_document for document_id: {document_id}")
+    run = None
     try:
-        doc = Document.objects.prefetch_related("sections").get(id=document_id)
+        doc = Document.objects.select_related("template").get(id=document_id)
         template = doc.template
         if not template:
             raise ValueError("Document has no template")
 
-        prior_sections_text = ""  # will accumulate generated content
-
-        with transaction.atomic():
-            for sec in doc.sections.order_by("order"):
-                # Build prompt with context
-                prompt = (
-                    f"You are drafting '{doc.title}'.\n\n"
-                    f"Previously written sections:\n{prior_sections_text or 'None yet'}\n\n"
-                    f"Now generate the next section: '{sec.title}'.\n"
-                    f"Follow template requirements, preserve markdown tables, "
-                    f"use inline citations [1], [2].\n\n"
-                    f"{user_prompt or ''}"
-                )
-
-                # Embed + retrieve KB
-                q_emb = embed_texts([prompt])[0]
-                with connection.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT dc.id, dc.document_id, dc.chunk_index, dc.text, kd.title,
-                               dc.embedding <=> %s::vector as score
-                        FROM knowledge_base_documentchunk dc
-                        JOIN knowledge_base_knowledgedocument kd ON dc.document_id = kd.id
-                        WHERE kd.organization_id = %s AND kd.is_active = true
-                        ORDER BY score ASC
-                        LIMIT %s
-                        """,
-                        [q_emb, doc.organization.id if doc.organization else None, top_k]
-                    )
-                    rows = cur.fetchall()
-
-                kb_chunks = [
-                    {"id": str(r[0]), "document_id": str(r[1]), "chunk_index": r[2],
-                     "text": r[3], "title": r[4], "score": float(r[5])}
-                    for r in rows
-                ]
+        sections = {sec.key: sec for sec in doc.sections.select_related("current_version").order_by("order")}
+        deps = section_dependencies(template.structure, list(sections))
+
+        run, checkpoints = _start_generation_run(doc, self.request.id, user_prompt, sections)
+        if run.status == "completed":
+            logger.info(f"Generation run {run.id} for document {document_id} already completed")
+            return {"document_id": str(doc.id), "run_id": str(run.id)}
+
+        locked = [checkpoints[key].id for key, sec in sections.items()
+                  if sec.is_locked and checkpoints[key].status == "pending"]
+        GenerationSectionRun.objects.filter(id__in=locked).update(status="skipped")
+        summaries = SummaryCache(summarize_section, settings.DOC_SECTION_SUMMARY_TOKENS)
+
+        def section_text(key, version):
+            return SectionText.from_version(key, sections[key].title, version, summaries.max_tokens)
+
+        # sections whose current content is final for this run
+        settled = {
+            key: {"content": sec.get_content(), "citations": [], "text": section_text(key, sec.current_version)}
+            for key, sec in sections.items()
+            if sec.is_locked or checkpoints[key].status != "pending"
+        }
+        fingerprint = kb_fingerprint(doc.organization_id)
+        reusable = _reusable_outputs(doc, run, fingerprint)
+        logger.info(
+            f"Generating {len(sections) - len(settled)} of {len(sections)} sections for document {document_id} "
+            f"(run {run.id}, attempt {run.attempts}), longest dependency chain {critical_path(deps)}"
+        )
+
+        def draft(key, dep_results):
+            if key in settled:
+                return settled[key]
+            sec = sections[key]
+            # Build prompt with the outline and as much of the sections it builds on as the budget allows
+            head = (
+                f"You are drafting '{doc.title}'.\n\n"
+                f"{outline_text([s.title for s in sections.values()], current=sec.title)}\n\n"
+                f"Previously written sections:\n"
+            )
+            tail = (
+                f"\n\nNow generate the next section: '{sec.title}'.\n"
+                f"Follow template requirements, preserve markdown tables, "
+                f"use inline citations [1], [2].\n\n"
+                f"{user_prompt or ''}"
+            )
+            prior_sections_text = build_context(
+                [dep_results[d]["text"] for d in deps[key]], _context_budget(head, tail), summaries
+            )
+            prompt = head + (prior_sections_text or "None yet") + tail
+            prompt_hash = _prompt_hash(prompt, top_k)
+            prior = reusable.get((sec.id, prompt_hash))
+            if prior:
+                return {"content": prior.version.content, "citations": prior.citations,
+                        "prompt_hash": prompt_hash, "reused_version": prior.version}
+
+            try:
+                # Retrieve KB with short queries about this section
+                queries = build_section_queries(doc.title, sec.title, sec.key, user_prompt)
+                kb_chunks = _kb_chunks(search_queries(doc.organization_id, queries, top_k=top_k))
 
                 # Generate content for this section
                 result = generate_draft(prompt, template=sec.title, kb_chunks=kb_chunks)
-                content, citations = result["content"], result["citations"]
-
-                # Save section version
-                v = DocumentSectionVersion.objects.create(
-                    section=sec, content=content,
-                    created_by=doc.created_by, ai_generated=True
-                )
-                sec.current_version = v
-                sec.save(update_fields=["current_version"])
+            finally:
+                connection.close()  # retrieval opened a connection for this worker thread
+            return {**result, "prompt_hash": prompt_hash}
 
-                # Save citations
-                for cit in citations:
-                    Citation.objects.create(
-                        section=sec, marker=cit["marker"], reference_text=cit["reference_text"],
-                        kb_document_id=cit.get("kb_document_id"), confidence_score=cit.get("confidence_score")
-                    )
+        def save(key, result):
+            if key in settled:
+                return
+            sec, checkpoint = sections[key], checkpoints[key]
+            reused = result.get("reused_version")
+            with transaction.atomic():
+                if reused and reused.id == sec.current_version_id:
+                    v, status = reused, "reused"
+                else:
+                    v = _save_generated_version(sec.id, doc, result["content"], result["citations"],
+                                                expect_version=checkpoint.base_version_id)
+                    status = "reused" if reused else "completed"
+                if v is None:
+                    logger.info(f"Section '{key}' of document {document_id} was locked or edited during generation; keeping it")
+                    current = DocumentSection.objects.select_related("current_version").get(id=sec.id)
+                    result.update(content=current.get_content(), citations=[])
+                    v, status = current.current_version, "skipped"
+                checkpoint.status, checkpoint.version = status, v
+                checkpoint.prompt_hash, checkpoint.kb_fingerprint = result["prompt_hash"], fingerprint
+                checkpoint.citations = result["citations"]
+                checkpoint.save(update_fields=["status", "version", "prompt_hash", "kb_fingerprint", "citations", "updated_at"])
+            result["text"] = section_text(key, v)
+            _store_summaries(summaries)
 
-                # Add to rolling context
-                prior_sections_text += f"\n\n## {sec.title}\n{content}"
+        run_dag(deps, draft, max_workers=getattr(settings, "DOC_GENERATION_MAX_WORKERS", 4), on_done=save)
+        _store_summaries(summaries)
 
-        logger.info(f"Completed ai_generate_document (sequential) for document_id: {document_id}")
-        return {"document_id": str(doc.id)}
+        run.status, run.finished_at = "completed", timezone.now()
+        run.save(update_fields=["status", "finished_at", "updated_at"])
+        logger.info(f"Completed ai_generate_document for document_id: {document_id}")
+        return {"document_id": str(doc.id), "run_id": str(run.id)}
 
     except Exception as e:
-        logger.error(f"Error in ai_generate_document (sequential) for {document_id}: {str(e)}", exc_info=True)
+        logger.error(f"Error in ai_generate_document for {document_id}: {str(e)}", exc_info=True)
+        if run is not None:
+            GenerationRun.objects.filter(id=run.id).update(status="failed", error=str(e), updated_at=timezone.now())
         raise
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
@@ -224,7 +359,7 @@ def upload_document_to_kb(self, document_id, success=None):
         combined = "\n\n".join([f"{sec.title}\n\n{sec.get_content()}" for sec in doc.sections.order_by("order") if sec.get_content()])
         chunk_tokens = settings.KB_CHUNK_TOKENS or 900
         overlap = settings.KB_CHUNK_OVERLAP or 150
-        chunks = chunk_text(combined, chunk_size=chunk_tokens, overlap=overlap)
+        chunks = chunk_text_with_tokens(combined, chunk_size=chunk_tokens, overlap=overlap)
         if not chunks:
             logger.warning(f"No chunks generated for document_id: {document_id}")
             return {"status": "no_chunks"}
@@ -239,20 +374,25 @@ def upload_document_to_kb(self, document_id, success=None):
             status="processing",
         )
 
-        embeddings = embed_texts(chunks, batch_size=64)
+        embeddings, hashes, embed_stats = embed_chunks([text for text, _ in chunks])
+        logger.info(f"Embeddings for KB upload of document {document_id}: {embed_stats.as_dict()}")
+        ensure_partition(kb_doc.organization_id)
         objs = [
             DocumentChunk(
                 document=kb_doc,
+                organization=kb_doc.organization,
                 chunk_index=idx,
                 text=chunk_text,
                 embedding=emb,
-                tokens=count_tokens(chunk_text)
-            ) for idx, (chunk_text, emb) in enumerate(zip(chunks, embeddings))
+                content_hash=digest,
+                tokens=tokens
+            ) for idx, ((chunk_text, tokens), emb, digest) in enumerate(zip(chunks, embeddings, hashes))
         ]
-        DocumentChunk.objects.bulk_create(objs, batch_size=200)
+        load_chunks(objs)
         kb_doc.status = "ready"
         kb_doc.processed_at = timezone.now()
         kb_doc.save(update_fields=["status", "processed_at"])
+        bump_kb_generation(kb_doc.organization_id)
         if success is not None:
             kb_doc.additional_metadata = {"success": success}
             kb_doc.save(update_fields=["additional_metadata"])
@@ -1,3 +1,280 @@
-from django.test import TestCase
+import threading
+import time
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from apps.knowledge_base import chunker
+from apps.knowledge_base.models import KnowledgeDocument
+from apps.knowledge_base.retrieval import SearchHit
+from apps.knowledge_base.tests.helpers import WordEncoding
+from .models import Document, DocumentSectionVersion, DocumentTemplate, GenerationRun, GenerationSectionRun
+from .services.context import SectionText, SummaryCache, build_context
+from .services.generation import critical_path, run_dag, section_dependencies
+from .services import section_queries
+from .services.section_queries import build_section_queries, search_queries
+from . import tasks
 
-# Create your tests here.
+User = get_user_model()
+
+STRUCTURE = {"sections": [
+    {"key": "background", "title": "Background", "order": 1, "depends_on": []},
+    {"key": "objectives", "title": "Objectives", "order": 2, "depends_on": []},
+    {"key": "approach", "title": "Approach", "order": 3, "depends_on": ["background", "objectives"]},
+    {"key": "summary", "title": "Executive Summary", "order": 4},
+]}
+KEYS = ["background", "objectives", "approach", "summary"]
+
+
+def words(n, word="word"):
+    return " ".join([word] * n)
+
+
+class SectionDependenciesTest(SimpleTestCase):
+    def test_declared_and_default_dependencies(self):
+        deps = section_dependencies(STRUCTURE, KEYS)
+        self.assertEqual(deps["background"], [])
+        self.assertEqual(deps["approach"], ["background", "objectives"])
+        self.assertEqual(deps["summary"], ["background", "objectives", "approach"])
+        self.assertEqual(critical_path(deps), 3)
+
+    def test_legacy_template_is_sequential(self):
+        deps = section_dependencies({"sections": [{"key": "a"}, {"key": "b"}]}, ["a", "b"])
+        self.assertEqual(deps, {"a": [], "b": ["a"]})
+
+    def test_cycle_rejected(self):
+        structure = {"sections": [{"key": "a", "depends_on": ["b"]}, {"key": "b", "depends_on": ["a"]}]}
+        with self.assertRaises(ValueError):
+            section_dependencies(structure, ["a", "b"])
+
+
+@patch.object(chunker, "get_encoding", lambda name=None: WordEncoding())
+class BuildContextTest(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+
+        def summarize(title, content, max_tokens):
+            self.calls.append(title)
+            return f"gist of {title.lower()}"
+
+        self.summaries = SummaryCache(summarize, max_tokens=5)
+        self.sections = [SectionText(t.lower(), t, words(30, t.lower()), version_id=i)
+                         for i, t in enumerate(["Background", "Objectives", "Approach"])]
+
+    def test_everything_fits(self):
+        context = build_context(self.sections, budget=200, summaries=self.summaries)
+        self.assertEqual(context.count("approach"), 30)
+        self.assertEqual(context.count("background"), 30)
+        self.assertEqual(self.calls, [])
+
+    def test_older_sections_are_summarized_within_budget(self):
+        context = build_context(self.sections, budget=60, summaries=self.summaries)
+
+        self.assertLessEqual(chunker.count_tokens(context), 60)
+        self.assertIn(words(30, "approach"), context)
+        self.assertIn("## Background (summary)\ngist of background", context)
+        self.assertLess(context.index("Background"), context.index("Objectives"))
+        self.assertEqual(sorted(self.calls), ["Background", "Objectives"])
+
+        build_context(self.sections, budget=60, summaries=self.summaries)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.summaries.pop_new(), {0: "gist of background", 1: "gist of objectives"})
+
+    def test_cached_summary_is_used(self):
+        self.sections[0].summary = "stored gist"
+        context = build_context(self.sections, budget=60, summaries=self.summaries)
+        self.assertIn("stored gist", context)
+        self.assertEqual(self.calls, ["Objectives"])
+
+
+@patch.object(chunker, "get_encoding", lambda name=None: WordEncoding())
+class SectionQueriesTest(SimpleTestCase):
+    def test_queries_are_short_and_distinct(self):
+        queries = build_section_queries("Water project", "Budget", "budget", user_prompt="  ")
+        self.assertEqual(queries, ["Budget for Water project"])
+
+        queries = build_section_queries("Water project", "M&E", "monitoring_evaluation",
+                                        user_prompt=words(200, "boreholes"))
+        self.assertEqual(queries[:2], ["M&E for Water project", "monitoring evaluation Water project"])
+        self.assertTrue(queries[2].startswith("M&E: boreholes"))
+        self.assertLessEqual(chunker.count_tokens(queries[2]), section_queries.MAX_QUERY_TOKENS)
+
+    def test_hits_merged_by_best_score(self):
+        def hit(chunk_id, score):
+            return SearchHit(chunk_id=chunk_id, document_id="d", document_title="Report", chunk_index=0,
+                             snippet="", score=score)
+
+        results = {1.0: [hit("a", 0.3), hit("b", 0.4)], 2.0: [hit("b", 0.1), hit("c", 0.5)]}
+        with patch.object(section_queries, "cached_embed_texts", return_value=[[1.0], [2.0]]) as mock_embed, \
+                patch.object(section_queries, "search", side_effect=lambda org, vec, **kw: results[vec[0]]):
+            hits = search_queries("org", ["q1", "q2"], top_k=2)
+
+        mock_embed.assert_called_once_with(["q1", "q2"])
+        self.assertEqual([(h.chunk_id, h.score) for h in hits], [("b", 0.1), ("a", 0.3)])
+
+
+class RunDagTest(SimpleTestCase):
+    def test_independent_work_overlaps(self):
+        deps = section_dependencies(STRUCTURE, KEYS)
+        finished = []
+        lock = threading.Lock()
+
+        def work(key, dep_results):
+            time.sleep(0.1)
+            with lock:
+                finished.append(key)
+            return key.upper() + "".join(sorted(dep_results.values()))
+
+        started = time.perf_counter()
+        results = run_dag(deps, work, max_workers=4, on_done=lambda key, result: None)
+        elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.38)  # three levels, not four sequential sections
+        self.assertEqual(set(finished[:2]), {"background", "objectives"})
+        self.assertEqual(results["approach"], "APPROACHBACKGROUNDOBJECTIVES")
+
+    def test_failure_stops_dependents(self):
+        ran = []
+
+        def work(key, dep_results):
+            ran.append(key)
+            if key == "a":
+                raise RuntimeError("LLM error")
+            return key
+
+        with self.assertRaises(RuntimeError):
+            run_dag({"a": [], "b": ["a"]}, work)
+        self.assertEqual(ran, ["a"])
+
+    def test_failure_keeps_results_of_running_siblings(self):
+        a_failed = threading.Event()
+        saved, ran = [], []
+
+        def work(key, dep_results):
+            ran.append(key)
+            if key == "a":
+                a_failed.set()
+                raise RuntimeError("LLM error")
+            a_failed.wait(1)
+            time.sleep(0.05)  # still running when a's failure is seen
+            return key.upper()
+
+        deps = {"a": [], "b": [], "c": [], "d": ["b"]}
+        with self.assertRaises(RuntimeError):
+            run_dag(deps, work, max_workers=2, on_done=lambda key, result: saved.append((key, result)))
+        self.assertEqual(saved, [("b", "B")])
+        self.assertEqual(sorted(ran), ["a", "b"])  # c (queued) and d (dependent) never start
+
+
+@patch.object(chunker, "get_encoding", lambda name=None: WordEncoding())
+@patch.object(tasks, "search_queries", return_value=[])
+class AIGenerateDocumentTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="writer@example.com", password="pass")
+        template = DocumentTemplate.objects.create(name="Proposal", structure=STRUCTURE, created_by=self.user)
+        self.doc = Document.objects.create(template=template, title="Water project", created_by=self.user)
+
+    def generate(self, task_id=None, fail_once=(), body=""):
+        prompts = {}
+        failing = set(fail_once)
+
+        def fake_draft(prompt, template=None, kb_chunks=None):
+            prompts.setdefault(template, []).append(prompt)
+            if template in failing:
+                failing.discard(template)
+                raise RuntimeError("LLM timeout")
+            return {"content": f"{template} text{body}", "citations": [
+                {"marker": "[1]", "reference_text": "KB: Annual report", "kb_document_id": None}
+            ]}
+
+        with patch.object(tasks, "generate_draft", side_effect=fake_draft):
+            tasks.ai_generate_document.apply(args=[str(self.doc.id)], task_id=task_id).get()
+        return {title: calls[-1] for title, calls in prompts.items()}, {t: len(c) for t, c in prompts.items()}
+
+    def checkpoints(self, task_id):
+        run = GenerationRun.objects.get(task_id=task_id)
+        return run, {cp.section.key: cp for cp in run.section_runs.select_related("section")}
+
+    def set_content(self, key, content):
+        sec = self.doc.sections.get(key=key)
+        sec.current_version = DocumentSectionVersion.objects.create(section=sec, content=content)
+        sec.save(update_fields=["current_version"])
+
+    def test_sections_get_dependency_context_and_are_saved(self, mock_search):
+        prompts, _ = self.generate(task_id="task-1")
+
+        self.assertIn("Background text", prompts["Approach"])
+        self.assertNotIn("Executive Summary text", prompts["Approach"])
+        self.assertIn("Approach text", prompts["Executive Summary"])
+        self.assertIn("None yet", prompts["Objectives"])
+        for sec in self.doc.sections.all():
+            self.assertEqual(sec.get_content(), f"{sec.title} text")
+            self.assertTrue(sec.current_version.ai_generated)
+            self.assertEqual(sec.citations.count(), 1)
+        run, checkpoints = self.checkpoints("task-1")
+        self.assertEqual(run.status, "completed")
+        self.assertEqual({cp.status for cp in checkpoints.values()}, {"completed"})
+        # retrieval uses short queries about the section, not the prompt
+        queries = [q for call in mock_search.call_args_list for q in call.args[1]]
+        self.assertIn("Approach for Water project", queries)
+        self.assertTrue(all(len(q.split()) < 20 for q in queries))
+        self.assertTrue(all(len(cp.prompt_hash) == 64 for cp in checkpoints.values()))
+
+    def test_retry_resumes_from_checkpoints(self, mock_search):
+        _, calls = self.generate(task_id="task-1", fail_once=["Approach"])
+
+        self.assertEqual(calls, {"Background": 1, "Objectives": 1, "Approach": 2, "Executive Summary": 1})
+        run, checkpoints = self.checkpoints("task-1")
+        self.assertEqual((run.status, run.attempts), ("completed", 2))
+        self.assertEqual(self.doc.sections.get(key="background").versions.filter(ai_generated=True).count(), 1)
+
+    def test_identical_rerun_reuses_output_until_kb_changes(self, mock_search):
+        self.generate(task_id="task-1")
+        _, calls = self.generate(task_id="task-2")
+
+        self.assertEqual(calls, {})
+        _, checkpoints = self.checkpoints("task-2")
+        self.assertEqual({cp.status for cp in checkpoints.values()}, {"reused"})
+        self.assertEqual(self.doc.sections.get(key="approach").versions.filter(ai_generated=True).count(), 1)
+
+        KnowledgeDocument.objects.create(title="New annual report", status="ready")
+        _, calls = self.generate(task_id="task-3")
+        self.assertEqual(len(calls), 4)
+
+    def test_locked_and_edited_sections_are_kept(self, mock_search):
+        summary = self.doc.sections.get(key="summary")
+        summary.is_locked = True
+        summary.save(update_fields=["is_locked"])
+        # a run that started before an editor saved Objectives
+        run = GenerationRun.objects.create(document=self.doc, task_id="task-1")
+        for sec in self.doc.sections.all():
+            GenerationSectionRun.objects.create(run=run, section=sec, base_version_id=sec.current_version_id)
+        self.set_content("objectives", "Hand-written objectives")
+
+        prompts, _ = self.generate(task_id="task-1")
+
+        self.assertNotIn("Executive Summary", prompts)
+        self.assertIn("Hand-written objectives", prompts["Approach"])
+        self.assertEqual(self.doc.sections.get(key="objectives").get_content(), "Hand-written objectives")
+        self.assertEqual(self.doc.sections.get(key="approach").get_content(), "Approach text")
+        _, checkpoints = self.checkpoints("task-1")
+        self.assertEqual(checkpoints["objectives"].status, "skipped")
+        self.assertEqual(checkpoints["summary"].status, "skipped")
+
+    @override_settings(DOC_PROMPT_TOKEN_BUDGET=140, DOC_SECTION_SUMMARY_TOKENS=8)
+    def test_prompts_stay_within_token_budget(self, mock_search):
+        def fake_summary(title, content, max_tokens):
+            return f"short {title}"
+
+        with patch.object(tasks, "summarize_section", side_effect=fake_summary) as mock_summary:
+            prompts, _ = self.generate(task_id="task-1", body=" " + words(40))
+
+        for title, prompt in prompts.items():
+            self.assertLessEqual(chunker.count_tokens(prompt), 140, title)
+        self.assertIn("Document outline:", prompts["Executive Summary"])
+        self.assertIn("(summary)", prompts["Executive Summary"])
+        # each version is summarized once and the summary is kept on it
+        summarized = [c.args[0] for c in mock_summary.call_args_list]
+        self.assertEqual(len(summarized), len(set(summarized)))
+        for title in summarized:
+            version = self.doc.sections.get(title=title).current_version
+            self.assertEqual(version.metadata["summary"], {"text": f"short {title}", "max_tokens": 8})
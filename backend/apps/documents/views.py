@@ -107,11 +107,14 @@ class SectionViewSet(viewsets.ViewSet):
         content = serializer.validated_data["content"]
         ai_generated = serializer.validated_data.get("ai_generated", False)
         summary = serializer.validated_data.get("summary", "")
-        v = DocumentSectionVersion.objects.create(
-            section=sec, content=content, created_by=request.user, ai_generated=ai_generated, summary=summary
-        )
-        sec.current_version = v
-        sec.save(update_fields=["current_version"])
+        with transaction.atomic():
+            # same row lock as AI generation, so a draft can't overwrite this edit
+            sec = DocumentSection.objects.select_for_update().get(id=sec.id)
+            v = DocumentSectionVersion.objects.create(
+                section=sec, content=content, created_by=request.user, ai_generated=ai_generated, summary=summary
+            )
+            sec.current_version = v
+            sec.save(update_fields=["current_version"])
         return Response({"detail": "Updated", "version": str(v.id)})
 
     @action(detail=True, methods=["post"])
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import KnowledgeDocument, DocumentChunk, ChatSession, ChatMessage, SearchQueryLog
+from .models import KnowledgeDocument, DocumentChunk, ChunkEmbedding, ChatSession, ChatMessage, SearchQueryLog
 
 @admin.register(KnowledgeDocument)
 class KnowledgeDocumentAdmin(admin.ModelAdmin):
@@ -14,6 +14,12 @@ class DocumentChunkAdmin(admin.ModelAdmin):
     search_fields = ("text",)
 
 
+@admin.register(ChunkEmbedding)
+class ChunkEmbeddingAdmin(admin.ModelAdmin):
+    list_display = ("content_hash", "model", "created_at")
+    search_fields = ("content_hash",)
+
+
 @admin.register(ChatSession)
 class ChatSessionAdmin(admin.ModelAdmin):
     list_display = ("title", "user", "organization", "created_at")
@@ -23,3 +29,12 @@ class ChatSessionAdmin(admin.ModelAdmin):
 class ChatMessageAdmin(admin.ModelAdmin):
     list_display = ("session", "role", "created_at")
 
+
+
+@admin.register(SearchQueryLog)
+class SearchQueryLogAdmin(admin.ModelAdmin):
+    list_display = ("query_text", "organization", "source", "mode", "cached", "latency_ms",
+                    "embed_ms", "sql_ms", "llm_ms", "serialize_ms", "result_count", "created_at")
+    list_filter = ("source", "mode", "cached", "organization")
+    search_fields = ("query_text",)
+    date_hierarchy = "created_at"
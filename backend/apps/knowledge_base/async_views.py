@@ -0,0 +1,172 @@
+"""
+Async versions of the KB endpoints that spend their time waiting on the
+network (an embedding call, a vector search and, for chat, a completion).
+
+Served by the ASGI app (core/asgi.py, e.g. under uvicorn), a request waiting
+on OpenAI holds no worker thread, so one process can keep hundreds of chat
+requests in flight. DRF views are sync-only, so these are plain Django async
+views that run DRF's own authentication classes and the same permission
+classes (IsAuthenticated, IsSameOrganization) as the viewsets, with the
+same error bodies.
+"""
+import functools
+import json
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, PermissionDenied
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+from apps.accounts.permissions import IsSameOrganization
+from .models import ChatSession
+from .openai_client import aembed_query, achat_with_context
+from .query_log import StageTimer, record
+from .result_cache import get_result_cache
+from .retrieval import ahybrid_search, search, SearchFilters, SEARCH_MODES
+from .serializers import SearchHitSerializer
+from .views import chat_context_chunks, chat_system_prompt, save_chat_exchange
+
+# as on ChatSessionViewSet
+PERMISSION_CLASSES = [IsAuthenticated, IsSameOrganization]
+
+
+def _check_permissions(api_request: Request, obj=None):
+    """APIView.check_permissions / check_object_permissions, with DRF's own request and permission classes."""
+    for permission in [cls() for cls in PERMISSION_CLASSES]:
+        if obj is None:
+            allowed = permission.has_permission(api_request, None)
+        else:
+            allowed = permission.has_object_permission(api_request, None, obj)
+        if not allowed:
+            if api_request.authenticators and not api_request.successful_authenticator:
+                raise NotAuthenticated()
+            raise PermissionDenied(getattr(permission, "message", None))
+
+
+def _authorize(api_request: Request):
+    # authenticates with the configured classes (JWT, or APIClient.force_authenticate in tests)
+    _check_permissions(api_request)
+    api_request.user.organization  # load it here, async code can't run the query
+
+
+def _error_response(api_request: Request, exc: APIException) -> JsonResponse:
+    """What APIView.handle_exception and DRF's exception handler make of exc."""
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        header = api_request.authenticators[0].authenticate_header(api_request) if api_request.authenticators else None
+        if header:
+            exc.auth_header = header
+        else:
+            exc.status_code = 403
+    response = exception_handler(exc, {"request": api_request})
+    headers = {name: value for name, value in response.items() if name.lower() != "content-type"}
+    return JsonResponse(response.data, status=response.status_code, headers=headers, safe=False)
+
+
+def async_api_view(view):
+    """
+    POST-only JSON endpoint for authenticated members of an organization.
+    The DRF request is available to the view as request.api_request.
+    """
+    @csrf_exempt
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != "POST":
+            return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+        api_request = Request(request, authenticators=[cls() for cls in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            await sync_to_async(_authorize)(api_request)
+        except APIException as e:
+            return _error_response(api_request, e)
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error"}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({"detail": "Expected a JSON object"}, status=400)
+        request.user = api_request.user
+        request.api_request = api_request
+        return await view(request, data, *args, **kwargs)
+    return wrapper
+
+
+@async_api_view
+async def semantic_search(request, data):
+    """
+    POST body: {"query": "...", "top_k": 6, "document_ids": [...], "mime_types": [...],
+                "created_after": "<iso datetime>", "created_before": "<iso datetime>",
+                "mode": "auto" | "hybrid" | "vector" | "lexical"}
+    Returns top chunks with score (cosine distance), lexical_rank and
+    fused_score as applicable, and the mode actually used ("auto" answers
+    exact-term lookups lexically and fuses both paths otherwise).
+    """
+    query = (data.get("query") or "").strip()
+    if not query:
+        return JsonResponse({"detail": "query required"}, status=400)
+    top_k = int(data.get("top_k", 6))
+    try:
+        filters = SearchFilters.from_data(data)
+    except ValueError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+    mode = data.get("mode") or "auto"
+    if mode not in SEARCH_MODES:
+        return JsonResponse({"detail": f"mode must be one of {', '.join(SEARCH_MODES)}"}, status=400)
+
+    timer = StageTimer()
+    org_id = request.user.organization_id
+    cache = get_result_cache()
+    key, cached = await sync_to_async(cache.lookup)(org_id, query, top_k=top_k, filters=filters, mode=mode)
+    if cached:
+        hits, mode_used = cached
+    else:
+        hits, mode_used = await ahybrid_search(org_id, query, top_k=top_k, filters=filters, mode=mode, timer=timer)
+        await sync_to_async(cache.store)(key, hits, mode_used)
+    with timer.stage("serialize"):
+        results = SearchHitSerializer(hits, many=True).data
+    record(request, "search", query, top_k, timer, len(hits), mode=mode_used, cached=bool(cached))
+    return JsonResponse({"mode": mode_used, "results": results})
+
+
+@async_api_view
+async def post_message(request, data, pk):
+    """POST chat/sessions/<pk>/message/ {"question": "...", "top_k": 6}"""
+    try:
+        session = await ChatSession.objects.filter(user=request.user).aget(pk=pk)
+    except ChatSession.DoesNotExist:
+        return JsonResponse({"detail": "No ChatSession matches the given query."}, status=404)
+    try:
+        await sync_to_async(_check_permissions)(request.api_request, session)
+    except APIException as e:
+        return _error_response(request.api_request, e)
+
+    question = (data.get("question") or "").strip()
+    if not question:
+        return JsonResponse({"detail": "question required"}, status=400)
+    top_k = int(data.get("top_k", 6))
+
+    timer = StageTimer()
+    org_id = request.user.organization_id
+    cache = get_result_cache()
+    key, cached = await sync_to_async(cache.lookup)(org_id, question, top_k=top_k, snippet_chars=1000, mode="vector")
+    if cached:
+        hits = cached[0]
+    else:
+        # embed query and pull top chunks
+        with timer.stage("embed"):
+            q_emb = await aembed_query(question)
+        with timer.stage("sql"):
+            hits = await sync_to_async(search)(org_id, q_emb, top_k=top_k, snippet_chars=1000)
+        await sync_to_async(cache.store)(key, hits, "vector")
+    context_chunks = chat_context_chunks(hits)
+
+    with timer.stage("llm"):
+        answer = await achat_with_context(chat_system_prompt(), question, context_chunks)
+
+    assistant_msg = await sync_to_async(save_chat_exchange)(session, question, answer, context_chunks)
+    record(request, "chat", question, top_k, timer, len(hits), mode="vector", cached=bool(cached))
+    return JsonResponse({
+        "answer": answer,
+        "citations": context_chunks,
+        "assistant_message_id": str(assistant_msg.id)
+    }, status=200)
@@ -0,0 +1,96 @@
+"""
+Bulk document uploads: many files in one multipart request, or one zip
+archive of them. All accepted files are registered with a single
+bulk_create and ingested by a few ingest_documents jobs instead of one
+request and one task per file.
+
+Archive members are never read into memory as a whole: each is streamed
+from the archive straight to storage when it is saved (Upload.open()).
+"""
+import mimetypes
+import os
+import zipfile
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Callable, ContextManager, Iterator, List, Tuple
+from django.conf import settings
+from django.core.files import File
+from .extractor_registry import EXTENSION_FORMATS
+
+
+class BulkUploadError(ValueError):
+    pass
+
+
+@dataclass
+class Skipped:
+    name: str
+    reason: str
+
+
+@dataclass
+class Upload:
+    name: str
+    size: int
+    mime_type: str
+    open: Callable[[], ContextManager[File]]  # the content, as a File to save to storage
+
+
+def _supported(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in EXTENSION_FORMATS
+
+
+def _member_opener(zf: zipfile.ZipFile, member: zipfile.ZipInfo, name: str):
+    @contextmanager
+    def open_member():
+        with zf.open(member) as stream:
+            f = File(stream, name=name)
+            f.size = member.file_size  # not the size of a same-named file on disk
+            yield f
+    return open_member
+
+
+def _archive_members(archive, max_bytes: int) -> Iterator[Upload]:
+    try:
+        zf = zipfile.ZipFile(archive)  # stays open as long as its members' openers are referenced
+    except zipfile.BadZipFile:
+        raise BulkUploadError("archive is not a valid zip file")
+    members = [m for m in zf.infolist() if not m.is_dir()]
+    # declared sizes, checked before anything is decompressed (reads stop at the declared size)
+    if sum(m.file_size for m in members) > max_bytes:
+        raise BulkUploadError(f"archive expands to more than {max_bytes} bytes")
+    for member in members:
+        name = os.path.basename(member.filename)  # never trust paths inside the archive
+        if not name or name.startswith(".") or member.filename.startswith("__MACOSX/"):
+            continue
+        yield Upload(name, member.file_size, "", _member_opener(zf, member, name))
+
+
+def collect_uploads(files: list, archive=None) -> Tuple[List[Upload], List[Skipped]]:
+    """
+    Returns ([upload], [skipped]) for the uploaded files and the members of
+    an uploaded zip archive, without reading any content. Unsupported
+    formats are skipped rather than failing the whole upload.
+    """
+    max_files = getattr(settings, "KB_BULK_UPLOAD_MAX_FILES", 500)
+    max_bytes = getattr(settings, "KB_BULK_UPLOAD_MAX_BYTES", 500 * 1024 * 1024)
+
+    candidates = [Upload(f.name, f.size, getattr(f, "content_type", "") or "", lambda f=f: nullcontext(f))
+                  for f in files]
+    if archive is not None:
+        candidates += list(_archive_members(archive, max_bytes))
+
+    accepted, skipped = [], []
+    for upload in candidates:
+        if not _supported(upload.name):
+            skipped.append(Skipped(upload.name, "unsupported file type"))
+            continue
+        upload.mime_type = upload.mime_type or mimetypes.guess_type(upload.name)[0] or ""
+        accepted.append(upload)
+    if not accepted:
+        raise BulkUploadError("no supported files in the upload")
+    if len(accepted) > max_files:
+        raise BulkUploadError(f"at most {max_files} files per bulk upload")
+    if sum(upload.size for upload in accepted) > max_bytes:
+        raise BulkUploadError(f"upload is larger than {max_bytes} bytes")
+    return accepted, skipped
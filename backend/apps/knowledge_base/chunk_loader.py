@@ -0,0 +1,123 @@
+"""
+Fast DocumentChunk inserts.
+
+On Postgres, chunks are streamed with COPY ... FROM STDIN in binary format:
+each embedding goes over the wire as 4 bytes per dimension (pgvector's
+binary representation) instead of as a ~20-character decimal per
+dimension rendered by the ORM and parsed again by the server, and there is
+no per-row INSERT overhead. Elsewhere (SQLite in tests), or with
+KB_CHUNK_COPY = False, it falls back to bulk_create.
+
+    load_chunks([DocumentChunk(...), ...])
+
+Chunks are written as given: ids and created_at are filled in when unset,
+no signals are sent and, as with bulk_create, nothing is read back.
+Embeddings are stored in the configured form (see embedding_storage): cut
+to KB_EMBEDDING_DIMENSIONS, and sent as halfvec when that is the storage.
+"""
+import io
+import struct
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from typing import List
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from .embedding_storage import reduce, storage
+from .models import DocumentChunk
+from .vector_index import is_postgres
+
+# column order of the COPY; search_vector is generated by Postgres
+COLUMNS = ("id", "document_id", "organization_id", "chunk_index", "text", "embedding",
+           "tokens", "content_hash", "page_start", "page_end", "created_at")
+
+_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_TRAILER = struct.pack(">h", -1)
+_NULL = struct.pack(">i", -1)
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _field(data: bytes) -> bytes:
+    return struct.pack(">i", len(data)) + data
+
+
+def _uuid(value) -> bytes:
+    return _field(uuid.UUID(str(value)).bytes)
+
+
+def _int4(value) -> bytes:
+    return _NULL if value is None else _field(struct.pack(">i", value))
+
+
+def _text(value) -> bytes:
+    return _NULL if value is None else _field(value.encode("utf-8"))
+
+
+def _vector(value, storage_type: str = "vector") -> bytes:
+    # pgvector's vector_recv / halfvec_recv: int16 dimensions, int16 unused, then float4s
+    # (float2s for halfvec), all big-endian
+    if value is None:
+        return _NULL
+    values = list(value)
+    code = "e" if storage_type == "halfvec" else "f"
+    return _field(struct.pack(f">hh{len(values)}{code}", len(values), 0, *values))
+
+
+def _timestamptz(value: datetime) -> bytes:
+    delta = value - _PG_EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return _field(struct.pack(">q", micros))
+
+
+def encode_copy_binary(chunks: List[DocumentChunk], storage_type: str = "vector") -> bytes:
+    """COPY BINARY payload for chunks, with the columns in COLUMNS order."""
+    now = timezone.now()
+    out = io.BytesIO()
+    out.write(_HEADER)
+    field_count = struct.pack(">h", len(COLUMNS))
+    for c in chunks:
+        out.write(field_count)
+        out.write(_uuid(c.id or uuid.uuid4()))
+        out.write(_uuid(c.document_id))
+        out.write(_NULL if c.organization_id is None else _uuid(c.organization_id))
+        out.write(_int4(c.chunk_index))
+        out.write(_text(c.text))
+        out.write(_vector(c.embedding, storage_type))
+        out.write(_int4(c.tokens))
+        out.write(_text(c.content_hash))
+        out.write(_int4(c.page_start))
+        out.write(_int4(c.page_end))
+        out.write(_timestamptz(c.created_at or now))
+    out.write(_TRAILER)
+    return out.getvalue()
+
+
+def use_copy() -> bool:
+    return is_postgres(connection) and getattr(settings, "KB_CHUNK_COPY", True)
+
+
+def copy_chunks(chunks: List[DocumentChunk]):
+    sql = f"COPY {DocumentChunk._meta.db_table} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT binary)"
+    payload = encode_copy_binary(chunks, storage()[0])
+    connection.ensure_connection()
+    with connection.cursor() as cur:
+        raw = cur.cursor
+        if hasattr(raw, "copy_expert"):  # psycopg2
+            raw.copy_expert(sql, io.BytesIO(payload))
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(payload)
+
+
+def load_chunks(chunks: List[DocumentChunk], batch_size: int = 1000) -> int:
+    """Insert chunks in batches of batch_size rows. Returns the number written."""
+    dimensions = storage()[1]
+    for chunk in chunks:
+        chunk.embedding = reduce(chunk.embedding, dimensions)
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i:i + batch_size]
+        if use_copy():
+            copy_chunks(batch)
+        else:
+            DocumentChunk.objects.bulk_create(batch, batch_size=batch_size)
+    return len(chunks)
@@ -2,50 +2,115 @@
 Token-aware chunker using tiktoken to estimate tokens.
 Produces overlapping chunks.
 """
-from typing import List
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
 import tiktoken
-import math
 
 # defaults can be overridden in settings
 DEFAULT_CHUNK_TOKENS = 900
 DEFAULT_OVERLAP = 150
 ENCODING_NAME = "cl100k_base"  # works for OpenAI embeddings
 
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name=ENCODING_NAME) -> tiktoken.Encoding:
+    return tiktoken.get_encoding(encoding_name)
+
 def count_tokens(text: str, encoding_name=ENCODING_NAME) -> int:
-    enc = tiktoken.get_encoding(encoding_name)
-    return len(enc.encode(text))
+    return len(get_encoding(encoding_name).encode_ordinary(text))
+
+@dataclass
+class TextChunk:
+    text: str
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    tokens: int = 0
+
+
+def _split_tokens(enc, ids: List[int], size: int, overlap: int) -> List[Tuple[str, int]]:
+    """
+    Token windows of an over-long paragraph (ids end with its newline),
+    overlapping like chunks do. Counts are of each piece with its joining newline.
+    """
+    stride = max(size - overlap, 1)
+    pieces = []
+    start = 0
+    while True:
+        piece = enc.decode(ids[start:start + size], errors="ignore").strip()
+        # decoding a window can cut a character in two, so the piece is counted again
+        pieces.append((piece, len(enc.encode_ordinary(piece + "\n"))))
+        if start + size >= len(ids):
+            return pieces
+        start += stride
+
+
+def _make_chunk(enc, texts: List[str], page_nos: List[Optional[int]], counts: List[int]) -> TextChunk:
+    pages = [p for p in page_nos if p is not None]
+    return TextChunk(
+        text="\n".join(texts),
+        page_start=min(pages) if pages else None,
+        page_end=max(pages) if pages else None,
+        # cl100k never merges a newline into the next paragraph's first token, so counts with the
+        # joining newline add up exactly; the last paragraph has none, and may have merged its
+        # own ("." + "\n" is one token), so it is counted on its own
+        tokens=sum(counts[:-1]) + len(enc.encode_ordinary(texts[-1])),
+    )
+
+
+def chunk_pages(pages: Iterable[Tuple[Optional[int], str]], chunk_size=DEFAULT_CHUNK_TOKENS,
+                overlap=DEFAULT_OVERLAP, encoding_name=ENCODING_NAME) -> Iterator[TextChunk]:
+    """
+    Streaming chunker over (page_no, text) pairs. Each paragraph is encoded
+    once; chunk boundaries, overlap and chunk token counts are then worked out
+    from the per-paragraph token counts, encoding only each chunk's last
+    paragraph again.
+    Paragraphs longer than chunk_size are cut into overlapping token windows.
+    Only the chunk being built is held in memory, and each chunk records the
+    pages it spans and its token count.
+    """
+    enc = get_encoding(encoding_name)
+    # paragraphs of the chunk being built
+    texts, page_nos, counts = [], [], []
+    total = 0
+    for page_no, page_text in pages:
+        for line in page_text.split("\n"):
+            p = line.strip()
+            if not p:
+                continue
+            # encoded with its joining newline, so the counts add up to the chunk's
+            ids = enc.encode_ordinary(p + "\n")
+            pieces = [(p, len(ids))] if len(ids) <= chunk_size else _split_tokens(enc, ids, chunk_size, overlap)
+            for piece, ptokens in pieces:
+                if total + ptokens <= chunk_size or not texts:
+                    texts.append(piece)
+                    page_nos.append(page_no)
+                    counts.append(ptokens)
+                    total += ptokens
+                    continue
+
+                yield _make_chunk(enc, texts, page_nos, counts)
+                # carry over the longest run of trailing paragraphs that fits the overlap
+                # and still leaves room for the new paragraph
+                budget = min(overlap, chunk_size - ptokens)
+                keep = len(counts)
+                kept_tokens = 0
+                while keep > 0 and kept_tokens + counts[keep - 1] <= budget:
+                    keep -= 1
+                    kept_tokens += counts[keep]
+                texts, page_nos, counts = texts[keep:], page_nos[keep:], counts[keep:]
+                texts.append(piece)
+                page_nos.append(page_no)
+                counts.append(ptokens)
+                total = kept_tokens + ptokens
+    if texts:
+        yield _make_chunk(enc, texts, page_nos, counts)
+
 
 def chunk_text(text: str, chunk_size=DEFAULT_CHUNK_TOKENS, overlap=DEFAULT_OVERLAP) -> List[str]:
-    # naive split by paragraphs then join lines until token budget reached
-    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
-    chunks = []
-    current = []
-    current_tokens = 0
-    for p in paragraphs:
-        ptokens = count_tokens(p)
-        if current_tokens + ptokens <= chunk_size or not current:
-            current.append(p)
-            current_tokens += ptokens
-        else:
-            chunks.append("\n".join(current))
-            # start new chunk with overlap: include last tokens from current chunk
-            if overlap > 0:
-                # grab last paragraphs to serve as overlap heuristically
-                overlap_text = ""
-                otokens = 0
-                for segment in reversed(current):
-                    seg_t = count_tokens(segment)
-                    if otokens + seg_t > overlap:
-                        break
-                    overlap_text = segment + "\n" + overlap_text
-                    otokens += seg_t
-                current = [overlap_text.strip()] if overlap_text.strip() else []
-                current_tokens = otokens
-            else:
-                current = []
-                current_tokens = 0
-            current.append(p)
-            current_tokens += ptokens
-    if current:
-        chunks.append("\n".join(current))
-    return chunks
+    # split by paragraphs then join lines until token budget reached
+    return [c.text for c in chunk_pages([(None, text)], chunk_size=chunk_size, overlap=overlap)]
+
+
+def chunk_text_with_tokens(text: str, chunk_size=DEFAULT_CHUNK_TOKENS,
+                           overlap=DEFAULT_OVERLAP) -> List[Tuple[str, int]]:
+    return [(c.text, c.tokens) for c in chunk_pages([(None, text)], chunk_size=chunk_size, overlap=overlap)]
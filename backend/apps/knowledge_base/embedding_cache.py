@@ -0,0 +1,140 @@
+"""
+Two-tier cache for query embeddings: an in-process LRU (bounded, with TTL)
+in front of the shared Django cache (Redis, CACHES['default']).
+Keys are a SHA-256 of the embedding model plus whitespace-normalized text,
+so the same query asked by any user/worker is embedded once per TTL.
+"""
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "kb:emb:"
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+    return KEY_PREFIX + digest
+
+
+class LRUCache:
+    """Thread-safe LRU with per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl: float, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < self._clock():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self._clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int = 2048, ttl: int = 7 * 24 * 3600, shared_alias: str = "default"):
+        self.local = LRUCache(max_entries, ttl)
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self._counters = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+        self._counter_lock = threading.Lock()
+
+    def _count(self, name: str, n: int = 1):
+        if n:
+            with self._counter_lock:
+                self._counters[name] += n
+
+    def stats(self) -> dict:
+        with self._counter_lock:
+            stats = dict(self._counters)
+        lookups = sum(stats.values())
+        stats["hit_rate"] = round((stats["local_hits"] + stats["shared_hits"]) / lookups, 4) if lookups else 0.0
+        stats["local_entries"] = len(self.local)
+        return stats
+
+    def get_many(self, keys: list) -> dict:
+        """Returns {key: vector} for the keys found in either tier."""
+        found = {}
+        for key in keys:
+            vec = self.local.get(key)
+            if vec is not None:
+                found[key] = vec
+        self._count("local_hits", len(found))
+
+        remaining = [k for k in keys if k not in found]
+        if remaining and self.shared_alias:
+            try:
+                shared = caches[self.shared_alias].get_many(remaining)
+            except Exception as e:  # Redis being down must not break search
+                logger.warning(f"Shared embedding cache unavailable: {e}")
+                shared = {}
+            for key, packed in shared.items():
+                vec = array("f", packed).tolist()
+                self.local.set(key, vec)
+                found[key] = vec
+            self._count("shared_hits", len(shared))
+        self._count("misses", len(keys) - len(found))
+        return found
+
+    def set_many(self, mapping: dict):
+        for key, vec in mapping.items():
+            self.local.set(key, vec)
+        if mapping and self.shared_alias:
+            try:
+                # float32 bytes: ~6 KB per 1536-d vector instead of a pickled list of floats
+                caches[self.shared_alias].set_many(
+                    {k: array("f", v).tobytes() for k, v in mapping.items()}, timeout=self.ttl
+                )
+            except Exception as e:
+                logger.warning(f"Shared embedding cache unavailable: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    max_entries=getattr(settings, "KB_EMBEDDING_CACHE_MAX_ENTRIES", 2048),
+                    ttl=getattr(settings, "KB_EMBEDDING_CACHE_TTL", 7 * 24 * 3600),
+                    shared_alias=getattr(settings, "KB_EMBEDDING_CACHE_ALIAS", "default"),
+                )
+    return _cache
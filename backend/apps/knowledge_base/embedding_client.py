@@ -0,0 +1,194 @@
+"""
+Concurrent embedding requests with a rate-limit-aware scheduler.
+
+Texts are packed into batches by token count (KB_EMBEDDING_BATCH_TOKENS per
+request, at most MAX_BATCH_INPUTS inputs), and up to
+KB_EMBEDDING_MAX_CONCURRENCY batches are in flight at once. A 429 halves the
+concurrency and pauses every worker for the server's Retry-After; each run of
+successes lets it grow back by one (AIMD). Results come back in input order.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from email.utils import parsedate_to_datetime
+from typing import Callable, List, Optional
+import openai
+from django.conf import settings
+from .chunker import count_tokens
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_INPUTS = 2048  # API limit on inputs per embeddings request
+
+
+@dataclass
+class EmbeddingClientStats:
+    requests: int = 0
+    throttled: int = 0
+    retried: int = 0
+    max_in_flight: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class AdaptiveLimit:
+    """Concurrency gate whose limit shrinks on throttling and recovers on success."""
+
+    def __init__(self, max_limit: int, clock=time.monotonic):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.in_flight = 0
+        self.resume_at = 0.0
+        self._successes = 0
+        self._clock = clock
+        self._cond = threading.Condition()
+
+    def acquire(self) -> int:
+        with self._cond:
+            while True:
+                wait = self.resume_at - self._clock()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return self.in_flight
+                else:
+                    self._cond.wait()
+
+    def release(self, retry_after: Optional[float] = None):
+        with self._cond:
+            self.in_flight -= 1
+            if retry_after is None:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self._successes = 0
+            else:
+                now = self._clock()
+                if now >= self.resume_at:  # concurrent 429s from one burst only halve once
+                    self.limit = max(1, self.limit // 2)
+                    self._successes = 0
+                self.resume_at = max(self.resume_at, now + retry_after)
+            self._cond.notify_all()
+
+
+def retry_after_seconds(error: openai.APIStatusError, default: float) -> float:
+    headers = error.response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        pass
+    return default
+
+
+def token_batches(texts: List[str], max_tokens: int, max_items: int = MAX_BATCH_INPUTS,
+                  count: Callable[[str], int] = count_tokens) -> List[List[int]]:
+    """Index ranges of texts packed greedily under max_tokens and max_items per batch."""
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = count(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class ConcurrentEmbedder:
+    def __init__(self, client: openai.OpenAI, model: str, max_concurrency: int = 4,
+                 max_batch_tokens: int = 32000, max_retries: int = 6, backoff: float = 0.5,
+                 token_counter: Callable[[str], int] = count_tokens):
+        # the scheduler does its own retrying, so it sees every 429
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.token_counter = token_counter
+        self.limit = AdaptiveLimit(self.max_concurrency)
+        self.stats = EmbeddingClientStats()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, n in increments.items():
+                setattr(self.stats, name, getattr(self.stats, name) + n)
+
+    def _embed_batch(self, inputs: List[str]) -> list:
+        attempt = 0
+        while True:
+            in_flight = self.limit.acquire()
+            with self._stats_lock:
+                self.stats.requests += 1
+                self.stats.max_in_flight = max(self.stats.max_in_flight, in_flight)
+            try:
+                response = self.client.embeddings.create(model=self.model, input=inputs)
+            except openai.RateLimitError as e:
+                delay = retry_after_seconds(e, self.backoff * 2 ** attempt)
+                self.limit.release(retry_after=delay)
+                self._count(throttled=1)
+                logger.info(f"Embeddings throttled, retrying in {delay:.2f}s at concurrency {self.limit.limit}")
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                delay = self.backoff * 2 ** attempt
+                self.limit.release()
+                logger.warning(f"Embeddings request failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+            except Exception:
+                self.limit.release()
+                raise
+            else:
+                self.limit.release()
+                return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise RuntimeError(f"Embeddings request failed after {self.max_retries} retries")
+            self._count(retried=1)
+
+    def embed(self, texts: List[str], max_items: Optional[int] = None) -> list:
+        if not texts:
+            return []
+        max_items = min(max_items or MAX_BATCH_INPUTS, MAX_BATCH_INPUTS)
+        batches = token_batches(texts, self.max_batch_tokens, max_items, count=self.token_counter)
+        if len(batches) == 1:
+            return self._embed_batch(texts)
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches)),
+                                thread_name_prefix="embed") as pool:
+            futures = [pool.submit(self._embed_batch, [texts[i] for i in batch]) for batch in batches]
+            results = []
+            for future in futures:
+                results.extend(future.result())
+        return results
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> ConcurrentEmbedder:
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                from .openai_client import client, EMBEDDING_MODEL
+                _embedder = ConcurrentEmbedder(
+                    client,
+                    EMBEDDING_MODEL,
+                    max_concurrency=getattr(settings, "KB_EMBEDDING_MAX_CONCURRENCY", 4),
+                    max_batch_tokens=getattr(settings, "KB_EMBEDDING_BATCH_TOKENS", 32000),
+                )
+    return _embedder
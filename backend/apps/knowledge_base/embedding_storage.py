@@ -0,0 +1,88 @@
+"""
+Storage format of DocumentChunk.embedding.
+
+    KB_EMBEDDING_STORAGE     "vector" (float32) or "halfvec" (float16, pgvector >= 0.7)
+    KB_EMBEDDING_DIMENSIONS  leading dimensions kept, at most EMBEDDING_DIMENSIONS
+
+A full float32 text-embedding-3-small vector takes ~6 KB per chunk. halfvec
+halves that, and keeping the first 512 or 768 dimensions cuts it by a further
+2-3x. text-embedding-3 models are trained so that a prefix of an embedding
+is itself a usable embedding, which is what the API's `dimensions` parameter
+returns (truncated, then L2-normalized). Truncating here is the same thing
+up to scale, and cosine distance ignores scale. So embeddings are still
+requested and cached (ChunkEmbedding) at full size, and only the chunk
+table and its ANN index store the reduced form. The storage can therefore
+change without re-embedding anything.
+
+Like the ANN index and the partitioning, the column type is managed outside
+the ORM: after changing the settings, run `manage.py convert_embedding_storage`,
+and use `manage.py benchmark_embedding_storage` to compare the options first.
+"""
+from typing import List, Optional, Tuple
+from django.conf import settings
+from .models import DocumentChunk
+
+EMBEDDING_DIMENSIONS = 1536  # what the embedding model returns; ChunkEmbedding always keeps all of them
+STORAGE_TYPES = ("vector", "halfvec")
+BYTES_PER_DIMENSION = {"vector": 4, "halfvec": 2}
+VECTOR_HEADER_BYTES = 8  # varlena header + int16 dimensions + int16 unused
+
+
+def storage() -> Tuple[str, int]:
+    """(storage type, dimensions) from settings."""
+    storage_type = getattr(settings, "KB_EMBEDDING_STORAGE", "vector")
+    dimensions = getattr(settings, "KB_EMBEDDING_DIMENSIONS", EMBEDDING_DIMENSIONS)
+    validate(storage_type, dimensions)
+    return storage_type, dimensions
+
+
+def validate(storage_type: str, dimensions: int):
+    if storage_type not in STORAGE_TYPES:
+        raise ValueError(f"Unsupported embedding storage: {storage_type}")
+    if not 1 <= dimensions <= EMBEDDING_DIMENSIONS:
+        raise ValueError(f"Embedding dimensions must be between 1 and {EMBEDDING_DIMENSIONS}, got {dimensions}")
+
+
+def column_type(storage_type: str = None, dimensions: int = None) -> str:
+    """SQL type of the embedding column, e.g. "halfvec(768)"."""
+    default_type, default_dimensions = storage()
+    return f"{storage_type or default_type}({dimensions or default_dimensions})"
+
+
+def opclass(storage_type: str = None) -> str:
+    """Operator class of the cosine ANN index for the storage type."""
+    return f"{storage_type or storage()[0]}_cosine_ops"
+
+
+def bytes_per_vector(storage_type: str, dimensions: int) -> int:
+    return VECTOR_HEADER_BYTES + BYTES_PER_DIMENSION[storage_type] * dimensions
+
+
+def reduce(embedding, dimensions: int = None) -> Optional[List[float]]:
+    """The stored form of a full embedding (or a query vector): its first dimensions."""
+    if embedding is None:
+        return None
+    dimensions = dimensions or storage()[1]
+    return list(embedding[:dimensions])
+
+
+def cast_sql(expression: str, storage_type: str, dimensions: int) -> str:
+    """SQL converting a vector or halfvec expression of at least `dimensions` dimensions to the given storage."""
+    return f"(({expression})::real[])[1:{dimensions}]::{storage_type}({dimensions})"
+
+
+def current_column_type(connection) -> str:
+    """The embedding column's actual type on Postgres, e.g. "vector(1536)"."""
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+            "WHERE attrelid = %s::regclass AND attname = 'embedding'",
+            [DocumentChunk._meta.db_table],
+        )
+        return cur.fetchone()[0]
+
+
+def halfvec_supported(connection) -> bool:
+    with connection.cursor() as cur:
+        cur.execute("SELECT to_regtype('halfvec') IS NOT NULL")
+        return cur.fetchone()[0]
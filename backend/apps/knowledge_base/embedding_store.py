@@ -0,0 +1,100 @@
+"""
+Content-addressed chunk embeddings. Ingestion looks every chunk up by
+SHA-256(model + text) in ChunkEmbedding and only sends unseen texts to
+OpenAI, so reindexing an unchanged file (or uploading a proposal built from
+already-ingested material) costs next to nothing.
+
+The store is deliberately shared across organizations: the key hashes the
+embedding model and the text, nothing tenant-specific, so two tenants
+ingesting the same paragraph share one row. A row holds nothing but the
+embedding of a text, and is only found by someone who already has that
+exact text, so sharing reveals nothing across tenants.
+Deleting a document therefore never deletes rows directly (another tenant
+may still use them); prune_unreferenced(), run daily by the
+prune_chunk_embeddings task, drops the rows no chunk refers to any more.
+"""
+import hashlib
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import List, Tuple
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import ChunkEmbedding, DocumentChunk
+from .openai_client import embed_texts, EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_BATCH = 1000  # keep IN (...) lists bounded
+
+
+def content_hash(text: str, model: str = EMBEDDING_MODEL) -> str:
+    return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class EmbeddingRunStats:
+    chunks: int = 0
+    reused: int = 0
+    embedded: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return round(self.reused / self.chunks, 4) if self.chunks else 0.0
+
+    def add(self, other: "EmbeddingRunStats"):
+        self.chunks += other.chunks
+        self.reused += other.reused
+        self.embedded += other.embedded
+
+    def as_dict(self) -> dict:
+        return {"chunks": self.chunks, "reused": self.reused, "embedded": self.embedded, "hit_rate": self.hit_rate}
+
+
+def embed_chunks(texts: List[str], batch_size: int = None) -> Tuple[list, List[str], EmbeddingRunStats]:
+    """
+    Returns (embeddings, content_hashes, stats) aligned with texts.
+    Texts already in the store are reused; the rest are embedded once each
+    (duplicates within the run included) and stored.
+    """
+    hashes = [content_hash(t) for t in texts]
+    unique = list(dict.fromkeys(hashes))
+
+    known = {}
+    for i in range(0, len(unique), LOOKUP_BATCH):
+        rows = ChunkEmbedding.objects.filter(content_hash__in=unique[i:i + LOOKUP_BATCH])
+        known.update(rows.values_list("content_hash", "embedding"))
+
+    missing = {}
+    for h, text in zip(hashes, texts):
+        if h not in known and h not in missing:
+            missing[h] = text
+    if missing:
+        fresh = dict(zip(missing.keys(), embed_texts(list(missing.values()), batch_size=batch_size)))
+        ChunkEmbedding.objects.bulk_create(
+            [ChunkEmbedding(content_hash=h, model=EMBEDDING_MODEL, embedding=emb) for h, emb in fresh.items()],
+            batch_size=500,
+            ignore_conflicts=True,  # another worker may have stored the same text meanwhile
+        )
+        known.update(fresh)
+
+    stats = EmbeddingRunStats(chunks=len(texts), reused=len(texts) - len(missing), embedded=len(missing))
+    return [known[h] for h in hashes], hashes, stats
+
+
+def prune_unreferenced(min_age: timedelta = timedelta(days=1), batch_size: int = LOOKUP_BATCH) -> int:
+    """
+    Delete stored embeddings no DocumentChunk refers to. Rows younger than
+    min_age are kept: an ingest in progress stores embeddings before its chunks.
+    Returns the number deleted.
+    """
+    referenced = DocumentChunk.objects.filter(content_hash=OuterRef("pk"))
+    unreferenced = (ChunkEmbedding.objects.filter(created_at__lt=timezone.now() - min_age)
+                    .exclude(Exists(referenced)).values_list("pk", flat=True))
+    deleted = 0
+    while True:
+        batch = list(unreferenced[:batch_size])
+        if not batch:
+            return deleted
+        # re-checked at delete time, in case a chunk started using the row meanwhile
+        deleted += ChunkEmbedding.objects.filter(pk__in=batch).exclude(Exists(referenced)).delete()[0]
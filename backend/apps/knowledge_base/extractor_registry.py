@@ -0,0 +1,214 @@
+"""
+Registry of text extraction backends, keyed by document format.
+
+    pages = extract_pages(file_path, mime_type=doc.mime_type)
+    for page_no, text in pages:
+        ...
+    pages.backend, pages.page_count
+
+The format comes from the file extension, checked against the file's magic
+bytes (and the uploaded MIME type as a last resort), so a mislabelled upload
+still reaches the right parser. Each format has several backends ranked by
+speed; KB_EXTRACTOR_BACKENDS can reorder them per format, and a backend
+that fails or finds no text before producing any falls through to the next.
+"""
+import logging
+import os
+import zipfile
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from django.conf import settings
+from .extractors import (
+    iter_pdf_pages, extract_text_from_docx, extract_text_from_doc,
+    extract_text_from_txt, extract_text_from_excel,
+)
+
+logger = logging.getLogger(__name__)
+
+# a backend yields (page_no, text); page_no is None for formats without pages.
+# It may return a page count (e.g. spreadsheet rows) when pages are not yielded.
+Pages = Iterable[Tuple[Optional[int], str]]
+
+
+@dataclass(frozen=True)
+class ExtractorBackend:
+    name: str
+    format: str
+    extract: Callable[[str], Pages]
+    rank: int  # lower runs first
+
+
+EXTENSION_FORMATS = {
+    ".pdf": "pdf",
+    ".docx": "docx",
+    ".doc": "doc",
+    ".txt": "text", ".md": "text", ".rtf": "text",
+    ".xls": "spreadsheet", ".xlsx": "spreadsheet", ".csv": "spreadsheet",
+}
+
+MIME_FORMATS = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/msword": "doc",
+    "text/plain": "text", "text/markdown": "text", "application/rtf": "text", "text/rtf": "text",
+    "text/csv": "spreadsheet",
+    "application/vnd.ms-excel": "spreadsheet",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "spreadsheet",
+}
+
+_backends: Dict[str, List[ExtractorBackend]] = {}
+
+
+def register(format: str, name: str, rank: int):
+    def decorator(fn):
+        _backends.setdefault(format, []).append(ExtractorBackend(name, format, fn, rank))
+        _backends[format].sort(key=lambda b: b.rank)
+        return fn
+    return decorator
+
+
+def sniff_format(file_path: str) -> Optional[str]:
+    """Format from the file's leading bytes, or None if they are not conclusive."""
+    with open(file_path, "rb") as f:
+        head = f.read(8)
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(file_path) as zf:
+                names = set(zf.namelist())
+        except zipfile.BadZipFile:
+            return None
+        if "word/document.xml" in names:
+            return "docx"
+        if "xl/workbook.xml" in names:
+            return "spreadsheet"
+    # anything else (plain text, CSV, legacy OLE .doc/.xls) is left to the extension
+    return None
+
+
+def detect_format(file_path: str, mime_type: str = "") -> Optional[str]:
+    by_extension = EXTENSION_FORMATS.get(os.path.splitext(file_path)[1].lower())
+    sniffed = sniff_format(file_path)
+    if sniffed and sniffed != by_extension:
+        logger.info(f"{file_path} looks like {sniffed}, not {by_extension or 'its extension'}")
+        return sniffed
+    return by_extension or MIME_FORMATS.get((mime_type or "").split(";")[0].strip().lower())
+
+
+def backends_for(format: str) -> List[ExtractorBackend]:
+    """Backends for a format in the order they are tried."""
+    backends = _backends.get(format, [])
+    preferred = getattr(settings, "KB_EXTRACTOR_BACKENDS", {}).get(format)
+    if preferred:
+        by_name = {b.name: b for b in backends}
+        backends = [by_name[n] for n in preferred if n in by_name] + [b for b in backends if b.name not in preferred]
+    return backends
+
+
+class ExtractedPages:
+    """
+    Iterable of (page_no, text) from the first backend that produces text.
+    backend and page_count are known once iteration has finished.
+    """
+
+    def __init__(self, file_path: str, backends: List[ExtractorBackend]):
+        self.file_path = file_path
+        self.backends = backends
+        self.backend = None
+        self.page_count = None
+
+    def __iter__(self) -> Iterator[Tuple[Optional[int], str]]:
+        last_error = None
+        for backend in self.backends:
+            has_text = False
+            pages = iter(backend.extract(self.file_path))
+            try:
+                while True:
+                    try:
+                        page_no, text = next(pages)
+                    except StopIteration as stop:
+                        counted = stop.value
+                        break
+                    has_text = has_text or bool(text.strip())
+                    if page_no is not None:
+                        self.page_count = max(self.page_count or 0, page_no)
+                    yield page_no, text
+            except Exception as e:
+                if has_text:  # pages were already handed on; a retry would duplicate them
+                    raise
+                logger.warning(f"Extractor {backend.name} failed on {self.file_path}: {str(e)}")
+                last_error = e
+                continue
+            if has_text:
+                self.backend = backend.name
+                if counted is not None:
+                    self.page_count = counted
+                return
+            logger.info(f"Extractor {backend.name} found no text in {self.file_path}")
+        if last_error is not None:
+            raise last_error
+
+
+def extract_pages(file_path: str, mime_type: str = "", format: str = None) -> ExtractedPages:
+    format = format or detect_format(file_path, mime_type)
+    backends = backends_for(format) if format else []
+    if not backends:
+        raise ValueError(f"Unsupported file type: {os.path.splitext(file_path)[1].lower() or mime_type}")
+    return ExtractedPages(file_path, backends)
+
+
+def _pdf_workers() -> int:
+    """KB_PDF_EXTRACT_WORKERS, or by default the CPUs left to each task the Celery worker runs at once."""
+    configured = getattr(settings, "KB_PDF_EXTRACT_WORKERS", 0)
+    if configured:
+        return configured
+    cpus = os.cpu_count() or 1
+    concurrency = getattr(settings, "CELERY_WORKER_CONCURRENCY", None) or cpus  # Celery's default
+    return max(1, cpus // concurrency)
+
+
+@register("pdf", "pymupdf", rank=10)
+def _pdf_pymupdf(file_path: str) -> Pages:
+    return iter_pdf_pages(file_path, workers=_pdf_workers(),
+                          shard_pages=getattr(settings, "KB_PDF_SHARD_PAGES", 16), backend="pymupdf")
+
+
+@register("pdf", "pypdf2", rank=20)
+def _pdf_pypdf2(file_path: str) -> Pages:
+    from PyPDF2 import PdfReader
+    reader = PdfReader(file_path)
+    for page_no, page in enumerate(reader.pages, start=1):
+        yield page_no, page.extract_text() or ""
+
+
+@register("pdf", "pdfplumber", rank=30)
+def _pdf_pdfplumber(file_path: str) -> Pages:
+    return iter_pdf_pages(file_path, workers=_pdf_workers(),
+                          shard_pages=getattr(settings, "KB_PDF_SHARD_PAGES", 16))
+
+
+@register("docx", "docx2txt", rank=10)
+@register("doc", "docx2txt", rank=10)
+def _docx_docx2txt(file_path: str) -> Pages:
+    text, _ = extract_text_from_doc(file_path)
+    yield None, text or ""
+
+
+@register("docx", "python-docx", rank=20)
+def _docx_python_docx(file_path: str) -> Pages:
+    text, _ = extract_text_from_docx(file_path)
+    yield None, text
+
+
+@register("text", "text", rank=10)
+def _text(file_path: str) -> Pages:
+    text, _ = extract_text_from_txt(file_path)
+    yield None, text
+
+
+@register("spreadsheet", "pandas", rank=10)
+def _spreadsheet_pandas(file_path: str) -> Pages:
+    text, rows = extract_text_from_excel(file_path)
+    yield None, text
+    return rows
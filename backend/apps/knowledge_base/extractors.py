@@ -5,34 +5,123 @@ Return a plain-text string and optional page count.
 import io
 import os
 import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import pdfplumber
+import pymupdf
 import docx
 import docx2txt
 import pandas as pd
-from typing import Tuple
+from typing import Iterator, List, Tuple
+
+try:
+    import billiard  # Celery's multiprocessing fork, installed with it
+except ImportError:
+    billiard = None
 
 logger = logging.getLogger(__name__)
 
-def extract_text_from_pdf(file_path: str) -> Tuple[str, int]:
+def pdf_page_count(file_path: str) -> int:
+    with pymupdf.open(file_path) as pdf:
+        return pdf.page_count
+
+def _pymupdf_page_texts(file_path: str, start: int, stop: int) -> List[str]:
+    with pymupdf.open(file_path) as pdf:
+        return [pdf[i].get_text() or "" for i in range(start, stop)]
+
+def extract_pdf_page_range(file_path: str, start: int, stop: int) -> List[str]:
     """
-    Extract text from PDF files using pdfplumber.
-    Returns text and page count.
+    Text of pages [start, stop) (0-based) with pdfplumber, falling back to
+    PyMuPDF for the range if pdfplumber cannot parse it. Runs in pool workers,
+    so it must stay importable and free of Django state.
     """
     try:
         texts = []
-        pages = 0
-        with pdfplumber.open(file_path) as pdf:
-            pages = len(pdf.pages)
+        with pdfplumber.open(file_path, pages=range(start + 1, stop + 1)) as pdf:
             for p in pdf.pages:
-                txt = p.extract_text() or ""
-                texts.append(txt)
-        extracted_text = "\n\n".join(texts)
-        logger.info(f"Extracted {pages} pages from PDF: {file_path}")
-        return extracted_text, pages
+                texts.append(p.extract_text() or "")
+                p.close()
+        return texts
+    except Exception as e:
+        logger.warning(f"pdfplumber failed on pages {start + 1}-{stop} of {file_path}, using PyMuPDF: {str(e)}")
+        return _pymupdf_page_texts(file_path, start, stop)
+
+def _pdf_shards(pages: int, shard_pages: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + shard_pages, pages)) for start in range(0, pages, shard_pages)]
+
+def _billiard_context():
+    """
+    Process context for the pool inside a Celery prefork child. Those are
+    daemonic billiard processes, which multiprocessing refuses to start
+    children from; billiard's own context has no such restriction.
+    """
+    if billiard is None or not billiard.current_process().daemon:
+        return None
+    return billiard.get_context("fork")
+
+def _can_fork_workers() -> bool:
+    # other daemonic processes (a multiprocessing pool's) may not have children of their own
+    return not multiprocessing.current_process().daemon or _billiard_context() is not None
+
+def _parallel_pdf_pages(file_path: str, shards, extract, workers: int) -> Iterator[Tuple[int, str]]:
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=_billiard_context())
+    try:
+        pending = deque()
+        for start, stop in shards:
+            pending.append((start, pool.submit(extract, file_path, start, stop)))
+            if len(pending) >= 2 * workers:
+                start, future = pending.popleft()
+                yield from enumerate(future.result(), start=start + 1)
+        while pending:
+            start, future = pending.popleft()
+            yield from enumerate(future.result(), start=start + 1)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def iter_pdf_pages(file_path: str, workers: int = 1, shard_pages: int = 16,
+                   backend: str = "pdfplumber") -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page_no, text) for each PDF page in order, 1-based.
+
+    With workers > 1 the page range is split into shards of shard_pages that
+    a process pool extracts in parallel; at most two shards per worker are in
+    flight, so memory stays bounded while the consumer embeds. backend="pymupdf"
+    skips pdfplumber entirely.
+    """
+    try:
+        pages = pdf_page_count(file_path)
+        shards = _pdf_shards(pages, shard_pages)
+        extract = _pymupdf_page_texts if backend == "pymupdf" else extract_pdf_page_range
+
+        done = 0
+        if workers > 1 and len(shards) > 1 and _can_fork_workers():
+            try:
+                for page_no, text in _parallel_pdf_pages(file_path, shards, extract, workers):
+                    yield page_no, text
+                    done = page_no
+            except (BrokenProcessPool, OSError) as e:
+                logger.warning(f"PDF extraction pool failed for {file_path}, continuing in-process: {str(e)}")
+        for start, stop in shards:
+            if stop > done:
+                texts = extract(file_path, max(start, done), stop)
+                yield from enumerate(texts, start=max(start, done) + 1)
     except Exception as e:
         logger.error(f"Failed to extract text from PDF {file_path}: {str(e)}")
         raise ValueError(f"Failed to extract text from PDF: {str(e)}")
 
+def extract_text_from_pdf(file_path: str) -> Tuple[str, int]:
+    """
+    Extract text from PDF files using pdfplumber.
+    Returns text and page count.
+    """
+    texts = [txt for _, txt in iter_pdf_pages(file_path)]
+    pages = len(texts)
+    extracted_text = "\n\n".join(texts)
+    logger.info(f"Extracted {pages} pages from PDF: {file_path}")
+    return extracted_text, pages
+
 def extract_text_from_docx(file_path: str) -> Tuple[str, int]:
     """
     Extract text from DOCX files using python-docx.
@@ -0,0 +1,249 @@
+"""
+The ingestion pipeline behind ingest_document and ingest_documents.
+
+Documents are extracted and chunked one after another, but their chunks
+flow through one stream: each window of KB_INGEST_WINDOW_CHUNKS chunks is
+embedded in one embed_chunks call and written in one load_chunks call
+(a binary COPY on Postgres), whichever documents it spans. A batch of small
+files therefore costs a few large embedding requests and inserts instead of
+several small ones per file, and memory stays flat however long a single
+file is.
+
+Reindexing is incremental (KB_INCREMENTAL_REINGEST): new chunks are matched
+to the document's existing rows by content hash. Matched rows keep their
+ids, and are only updated if their position or pages moved; only the
+unmatched chunks are embedded and written, and rows no longer in the
+document are deleted once it is fully read. An unchanged file rewrites
+nothing and leaves cached search results valid.
+"""
+import logging
+import os
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .chunk_loader import load_chunks
+from .chunker import chunk_pages
+from .embedding_store import content_hash, embed_chunks, EmbeddingRunStats
+from .extractor_registry import extract_pages
+from .models import DocumentChunk, KnowledgeDocument
+from .partitions import ensure_partition
+from .result_cache import bump_kb_generation
+
+logger = logging.getLogger(__name__)
+
+
+def windows(iterable, size):
+    it = iter(iterable)
+    while True:
+        window = list(islice(it, size))
+        if not window:
+            return
+        yield window
+
+
+def mark_failed(doc: KnowledgeDocument, message: str):
+    logger.error(f"Ingestion of document {doc.id} failed: {message}")
+    doc.status = "failed"
+    doc.error_message = message
+    doc.save(update_fields=["status", "error_message"])
+
+
+class DocumentRun:
+    """Progress of one document through a batch."""
+
+    def __init__(self, doc: KnowledgeDocument):
+        self.doc = doc
+        self.pages = None  # ExtractedPages, once extracted
+        self.chunks = 0
+        self.unchanged = 0  # existing rows reused as they were
+        self.exhausted = False  # every chunk has been handed to a window
+        self.finished = False  # stored as ready, or marked failed
+        self.changed = False  # the document's stored chunks differ from before the run
+        self.existing = {}  # content hash -> deque of existing rows not matched yet
+        self.stale = set()  # ids of existing rows not matched yet
+        self.offset = 0  # new rows are written at offset + chunk_index until apply_changes()
+        self.updates = []  # DocumentChunk rows whose index, pages or tokens must be set
+        self.moved = []  # ids among those whose chunk_index changes
+
+    def load_existing(self, incremental: bool):
+        chunks = DocumentChunk.objects.filter(organization_id=self.doc.organization_id, document=self.doc)
+        if not incremental:
+            deleted, _ = chunks.delete()
+            if deleted:
+                logger.info(f"Deleted {deleted} existing chunks for document {self.doc.id}")
+                self.changed = True
+            return
+        rows = chunks.order_by("chunk_index").values_list(
+            "id", "content_hash", "chunk_index", "page_start", "page_end", "tokens", named=True)
+        for row in rows.iterator(chunk_size=2000):
+            self.stale.add(row.id)
+            if row.content_hash:
+                self.existing.setdefault(row.content_hash, deque()).append(row)
+            self.offset = row.chunk_index + 1
+
+    def place(self, chunk):
+        """
+        Give the document's next chunk its index. Returns the DocumentChunk to
+        embed and write, or None if an existing row with the same text is reused.
+        """
+        index = self.chunks
+        self.chunks += 1
+        rows = self.existing.get(content_hash(chunk.text))
+        if rows:
+            row = rows.popleft()
+            self.stale.discard(row.id)
+            if (row.chunk_index, row.page_start, row.page_end, row.tokens) == (
+                    index, chunk.page_start, chunk.page_end, chunk.tokens):
+                self.unchanged += 1
+                return None
+            self.updates.append(DocumentChunk(id=row.id, chunk_index=index, tokens=chunk.tokens,
+                                              page_start=chunk.page_start, page_end=chunk.page_end))
+            if row.chunk_index != index:
+                self.moved.append(row.id)
+            return None
+        self.changed = True
+        new = DocumentChunk(
+            document=self.doc,
+            organization_id=self.doc.organization_id,
+            chunk_index=self.offset + index,
+            text=chunk.text,
+            tokens=chunk.tokens,
+            page_start=chunk.page_start,
+            page_end=chunk.page_end,
+        )
+        if self.offset:
+            # clear of the existing rows' indexes; moved to index by apply_changes()
+            self.updates.append(DocumentChunk(id=new.id, chunk_index=index, tokens=chunk.tokens,
+                                              page_start=chunk.page_start, page_end=chunk.page_end))
+            self.moved.append(new.id)
+        return new
+
+    def apply_changes(self):
+        """Once every chunk is stored: delete unmatched rows and put the rest in order."""
+        chunks = DocumentChunk.objects.filter(organization_id=self.doc.organization_id, document=self.doc)
+        for ids in windows(self.stale, 1000):
+            chunks.filter(id__in=ids).delete()
+        if self.stale:
+            logger.info(f"Deleted {len(self.stale)} chunks no longer in document {self.doc.id}")
+        # (document, chunk_index) is unique: first lift every row that changes index above all the
+        # current and final indexes, then set the final values, so no two rows ever share one
+        for ids in windows(self.moved, 1000):
+            chunks.filter(id__in=ids).update(chunk_index=F("chunk_index") + self.offset + self.chunks)
+        chunks.bulk_update(self.updates, ["chunk_index", "page_start", "page_end", "tokens"], batch_size=500)
+        self.changed = self.changed or bool(self.stale or self.updates)
+        self.existing, self.stale, self.updates, self.moved = {}, set(), [], []
+
+    def fail(self, message: str):
+        mark_failed(self.doc, message)
+        self.finished = True
+
+    def abandon(self, message: str):
+        """Fail part-way through: drop the rows this run wrote, leaving the document's chunks as they were."""
+        # written rows are the ones at or above offset until apply_changes(); the existing ones are below
+        written = DocumentChunk.objects.filter(organization_id=self.doc.organization_id, document=self.doc,
+                                               chunk_index__gte=self.offset)
+        deleted, _ = written.delete()
+        self.changed = self.changed or bool(deleted)
+        self.fail(message)
+
+    def finish(self):
+        self.apply_changes()
+        if not self.chunks:
+            self.fail("No text content could be extracted from the document")
+            return
+        logger.info(f"Extracted {self.pages.page_count or 'unpaged'} pages from {self.doc.file.name} "
+                    f"with {self.pages.backend}")
+        self.doc.pages = self.pages.page_count
+        self.doc.status = "ready"
+        self.doc.processed_at = timezone.now()
+        self.doc.error_message = ""
+        self.doc.save(update_fields=["pages", "status", "processed_at", "error_message"])
+        self.finished = True
+        logger.info(f"Successfully processed document {self.doc.id} with {self.chunks} chunks "
+                    f"({self.unchanged} unchanged)")
+
+
+def _document_chunks(runs: List[DocumentRun], chunk_tokens: int, overlap: int,
+                     incremental: bool) -> Iterator[Tuple[DocumentRun, object]]:
+    """(run, chunk) for every chunk of every readable document, in order."""
+    for run in runs:
+        doc = run.doc
+        file_path = doc.file.path
+        if not os.path.exists(file_path):
+            run.fail(f"File not found: {file_path}")
+            continue
+        try:
+            run.pages = extract_pages(file_path, mime_type=doc.mime_type)
+        except ValueError as e:
+            run.fail(str(e))
+            continue
+
+        ensure_partition(doc.organization_id)
+        run.load_existing(incremental)
+        try:
+            # extraction is lazy: backends raise their own errors (corrupt docx, pdfplumber, ...) here
+            for chunk in chunk_pages(run.pages, chunk_size=chunk_tokens, overlap=overlap):
+                yield run, chunk
+        except Exception as e:
+            logger.exception(f"Extraction of document {doc.id} failed: {e}")
+            run.abandon(f"Could not extract text: {e}")
+            continue
+        run.exhausted = True
+
+
+def ingest_batch(docs: List[KnowledgeDocument]) -> Tuple[Dict[str, DocumentRun], EmbeddingRunStats]:
+    """
+    Extract, chunk, embed and store docs. Returns ({document id: run}, embedding
+    stats). Documents that can't be read are marked failed and skipped; any
+    other error marks every unfinished document failed and is raised.
+    """
+    chunk_tokens = getattr(settings, "KB_CHUNK_TOKENS", 900)
+    overlap = getattr(settings, "KB_CHUNK_OVERLAP", 150)
+    window_size = getattr(settings, "KB_INGEST_WINDOW_CHUNKS", 256)
+    incremental = getattr(settings, "KB_INCREMENTAL_REINGEST", True)
+
+    runs = [DocumentRun(doc) for doc in docs]
+    for doc in docs:
+        if doc.status != "processing":
+            doc.status = "processing"
+            doc.save(update_fields=["status"])
+
+    embed_stats = EmbeddingRunStats()
+    try:
+        for window in windows(_document_chunks(runs, chunk_tokens, overlap, incremental), window_size):
+            # a document abandoned while this window filled up contributes nothing more
+            placed = (run.place(chunk) for run, chunk in window if not run.finished)
+            rows = [row for row in placed if row is not None]
+            if rows:
+                embeddings, hashes, stats = embed_chunks([row.text for row in rows])
+                embed_stats.add(stats)
+                for row, emb, digest in zip(rows, embeddings, hashes):
+                    row.embedding, row.content_hash = emb, digest
+                load_chunks(rows, batch_size=len(rows))
+            # documents whose last chunk was in this window (or before) are complete
+            for run in runs:
+                if run.exhausted and not run.finished:
+                    run.finish()
+        for run in runs:
+            if run.exhausted and not run.finished:
+                run.finish()
+    except Exception as e:
+        logger.exception(f"Failed to ingest documents {[str(d.id) for d in docs]}: {e}")
+        for run in runs:
+            if not run.finished:
+                run.changed = True  # possibly part-written
+                run.fail(str(e))
+        raise
+    finally:
+        # drop cached results of organizations whose chunks changed
+        for org_id in {run.doc.organization_id for run in runs if run.changed}:
+            bump_kb_generation(org_id)
+
+    logger.info(
+        f"Embeddings for {len(docs)} document(s): {embed_stats.reused}/{embed_stats.chunks} reused "
+        f"(hit rate {embed_stats.hit_rate:.0%}), {embed_stats.embedded} sent to OpenAI"
+    )
+    return {str(run.doc.id): run for run in runs}, embed_stats
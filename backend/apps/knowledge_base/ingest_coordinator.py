@@ -0,0 +1,130 @@
+"""
+At most one ingestion per document, queued or running.
+
+enqueue_ingest() sends ingest_document only if no run for the document is
+already queued, so the same upload or a burst of reindex clicks coalesce
+into one task. A worker runs a document only while holding its ingestion
+lock (ingest_lock); a duplicate that gets through anyway (a retry racing a
+new enqueue, a bulk job overlapping a reindex) skips the document instead
+of extracting, embedding and rewriting its chunks a second time. Skipping
+leaves a rerun request: the run that holds the lock may have read the file
+before the change that queued the duplicate, so when it finishes it
+enqueues one more (forced) run rather than leaving stale chunks behind.
+
+Both markers are cache.add() keys in the shared cache (Redis), with TTLs so
+that a lost task or a killed worker can't block a document for good. If
+the cache is unavailable, ingestion goes ahead unguarded. Avoided duplicate
+work is counted, see stats().
+"""
+import logging
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+QUEUED_PREFIX = "kb:ingest:queued:"
+LOCK_PREFIX = "kb:ingest:lock:"
+RERUN_PREFIX = "kb:ingest:rerun:"
+STATS_PREFIX = "kb:ingest:stats:"
+STATS = ("enqueued", "coalesced", "skipped_running", "rerun")
+
+
+def _cache():
+    return caches[getattr(settings, "KB_INGEST_LOCK_ALIAS", "default")]
+
+
+def _count(name: str):
+    key = STATS_PREFIX + name
+    try:
+        try:
+            _cache().incr(key)
+        except ValueError:
+            if not _cache().add(key, 1, timeout=None):
+                _cache().incr(key)
+    except Exception as e:
+        logger.warning(f"Could not count ingestion {name}: {e}")
+
+
+def stats() -> dict:
+    """
+    Counts since the cache was last cleared: tasks sent, enqueues coalesced,
+    duplicate runs skipped, and runs re-enqueued for them.
+    """
+    found = _cache().get_many([STATS_PREFIX + name for name in STATS])
+    return {name: found.get(STATS_PREFIX + name, 0) for name in STATS}
+
+
+def enqueue_ingest(document_id, force: bool = False) -> bool:
+    """
+    Send ingest_document for a document unless a run is already queued. Returns whether it was sent.
+    force runs it even if the document is already ready.
+    """
+    from .tasks import ingest_document  # tasks use ingest_lock
+
+    document_id = str(document_id)
+    try:
+        first = _cache().add(QUEUED_PREFIX + document_id, 1, timeout=getattr(settings, "KB_INGEST_QUEUED_TTL", 600))
+    except Exception as e:
+        logger.warning(f"Ingestion queue marker unavailable, enqueueing document {document_id} anyway: {e}")
+        first = True
+    if not first:
+        logger.info(f"Ingestion of document {document_id} is already queued; not enqueueing it again")
+        _count("coalesced")
+        return False
+    if force:
+        ingest_document.delay(document_id, force=True)
+    else:
+        ingest_document.delay(document_id)
+    _count("enqueued")
+    return True
+
+
+@contextmanager
+def ingest_lock(document_id):
+    """
+    Yields True while this worker holds the document's ingestion lock, or
+    False if another run holds it (the caller should skip the document; the
+    holder runs it again once it is done).
+    """
+    document_id = str(document_id)
+    key, token = LOCK_PREFIX + document_id, uuid.uuid4().hex
+    lock_ttl = getattr(settings, "KB_INGEST_LOCK_TTL", 3600)
+    try:
+        acquired = _cache().add(key, token, timeout=lock_ttl)
+        if acquired:
+            # the queued run is starting: later enqueues may queue a new one
+            _cache().delete(QUEUED_PREFIX + document_id)
+        else:
+            # the queued marker stays, so further enqueues coalesce into this request
+            _cache().set(RERUN_PREFIX + document_id, 1, timeout=lock_ttl)
+    except Exception as e:
+        logger.warning(f"Ingestion lock unavailable, ingesting document {document_id} unguarded: {e}")
+        yield True
+        return
+    if not acquired:
+        logger.info(f"Document {document_id} is being ingested by another worker; it will run again afterwards")
+        _count("skipped_running")
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        _release(document_id, key, token)
+
+
+def _release(document_id: str, key: str, token: str):
+    try:
+        if _cache().get(key) == token:  # not if it expired and another run took it
+            _cache().delete(key)
+        rerun = _cache().delete(RERUN_PREFIX + document_id)
+        if rerun:
+            _cache().delete(QUEUED_PREFIX + document_id)  # left by the skipped run, which is gone
+    except Exception as e:
+        logger.warning(f"Could not release the ingestion lock of document {document_id}: {e}")
+        return
+    if rerun:
+        logger.info(f"Document {document_id} changed while it was being ingested; ingesting it again")
+        _count("rerun")
+        enqueue_ingest(document_id, force=True)
@@ -0,0 +1,83 @@
+"""
+Compare chunk insert throughput: binary COPY (load_chunks) vs bulk_create.
+
+    python manage.py benchmark_chunk_loader <org id or name>
+    python manage.py benchmark_chunk_loader <org> --rows 20000 --batch 1000 --repeat 3
+
+Synthetic chunks with random embeddings are written to a throwaway document
+of the organization inside a transaction that is rolled back, so nothing is
+left behind. Prints rows/sec per method (best of --repeat runs). COPY needs
+Postgres; on other databases only bulk_create is measured.
+"""
+import random
+import time
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apps.accounts.models import Organization
+from apps.knowledge_base import chunk_loader
+from apps.knowledge_base.models import DocumentChunk, KnowledgeDocument
+from apps.knowledge_base.partitions import ensure_partition
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _chunks(doc, rows, dim):
+    return [
+        DocumentChunk(
+            document=doc, organization_id=doc.organization_id, chunk_index=i,
+            text=f"benchmark chunk {i} " + "lorem ipsum dolor sit amet " * 120,
+            embedding=[random.uniform(-1, 1) for _ in range(dim)],
+            content_hash=f"{i:064x}", tokens=700, page_start=1, page_end=1,
+        ) for i in range(rows)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Benchmark DocumentChunk inserts (rows/sec): binary COPY vs bulk_create"
+
+    def add_arguments(self, parser):
+        parser.add_argument("organization", help="Organization id or name")
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--batch", type=int, default=1000, help="Rows per COPY / bulk_create batch")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        org = Organization.objects.filter(name=opts["organization"]).first()
+        if org is None:
+            try:
+                org = Organization.objects.filter(pk=opts["organization"]).first()
+            except (ValueError, ValidationError):
+                pass
+        if org is None:
+            raise CommandError(f"No organization {opts['organization']!r}")
+
+        random.seed(opts["seed"])
+        dim = DocumentChunk._meta.get_field("embedding").dimensions
+        ensure_partition(org.id)
+        methods = {"bulk_create": lambda rows: DocumentChunk.objects.bulk_create(rows, batch_size=opts["batch"])}
+        if chunk_loader.use_copy():
+            methods["copy"] = lambda rows: chunk_loader.load_chunks(rows, batch_size=opts["batch"])
+
+        self.stdout.write(f"{opts['rows']} rows of {dim} dimensions, batches of {opts['batch']}")
+        for name, load in methods.items():
+            best = None
+            for _ in range(opts["repeat"]):
+                try:
+                    with transaction.atomic():
+                        doc = KnowledgeDocument.objects.create(
+                            organization=org, title="benchmark_chunk_loader", file_name="benchmark.txt",
+                            mime_type="text/plain", status="processing",
+                        )
+                        rows = _chunks(doc, opts["rows"], dim)  # built outside the timed part
+                        started = time.perf_counter()
+                        load(rows)
+                        elapsed = time.perf_counter() - started
+                        raise _Rollback
+                except _Rollback:
+                    pass
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f"  {name:<12} {opts['rows'] / best:>10.0f} rows/sec  ({best:.2f}s)")
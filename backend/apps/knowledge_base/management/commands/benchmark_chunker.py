@@ -0,0 +1,105 @@
+"""
+Compare chunking throughput of the single-pass chunker against the previous one.
+
+    python manage.py benchmark_chunker                          # synthetic ~1M-token text
+    python manage.py benchmark_chunker --file report.txt --repeat 3
+
+"before" is the previous algorithm as ingestion ran it: every paragraph
+tokenized with a fresh tiktoken lookup, overlap paragraphs re-tokenized,
+then each finished chunk tokenized again for its token count. "after" is
+chunk_pages, which encodes each paragraph once and returns token counts.
+"""
+import random
+import time
+import tiktoken
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.knowledge_base.chunker import ENCODING_NAME, chunk_pages, get_encoding
+
+WORDS = (
+    "the project will strengthen community resilience through climate smart agriculture "
+    "training for smallholder farmers budget outcome indicator baseline target partner "
+    "monitoring evaluation learning sustainability gender inclusion water sanitation"
+).split()
+
+
+def _legacy_count_tokens(text):
+    return len(tiktoken.get_encoding(ENCODING_NAME).encode(text))
+
+
+def _legacy_chunk_text(text, chunk_size, overlap):
+    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+    chunks = []
+    current = []
+    current_tokens = 0
+    for p in paragraphs:
+        ptokens = _legacy_count_tokens(p)
+        if current_tokens + ptokens <= chunk_size or not current:
+            current.append(p)
+            current_tokens += ptokens
+        else:
+            chunks.append("\n".join(current))
+            if overlap > 0:
+                overlap_text = ""
+                otokens = 0
+                for segment in reversed(current):
+                    seg_t = _legacy_count_tokens(segment)
+                    if otokens + seg_t > overlap:
+                        break
+                    overlap_text = segment + "\n" + overlap_text
+                    otokens += seg_t
+                current = [overlap_text.strip()] if overlap_text.strip() else []
+                current_tokens = otokens
+            else:
+                current = []
+                current_tokens = 0
+            current.append(p)
+            current_tokens += ptokens
+    if current:
+        chunks.append("\n".join(current))
+    return [(c, _legacy_count_tokens(c)) for c in chunks]
+
+
+def _synthetic_text(paragraphs, seed=0):
+    rnd = random.Random(seed)
+    return "\n".join(
+        " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 120))) + "."
+        for _ in range(paragraphs)
+    )
+
+
+class Command(BaseCommand):
+    help = "Benchmark chunks/sec of the chunker before and after single-pass tokenization"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="Plain-text file to chunk (default: synthetic text)")
+        parser.add_argument("--paragraphs", type=int, default=20000, help="Paragraphs of synthetic text")
+        parser.add_argument("--repeat", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        if opts["file"]:
+            with open(opts["file"], encoding="utf-8", errors="ignore") as f:
+                text = f.read()
+        else:
+            text = _synthetic_text(opts["paragraphs"])
+        chunk_size = getattr(settings, "KB_CHUNK_TOKENS", 900)
+        overlap = getattr(settings, "KB_CHUNK_OVERLAP", 150)
+        get_encoding()  # load the BPE ranks outside the timings
+        self.stdout.write(f"{len(text):,} chars, {text.count(chr(10)) + 1:,} lines, chunk {chunk_size}/{overlap} tokens")
+
+        runs = {
+            "before": lambda: _legacy_chunk_text(text, chunk_size, overlap),
+            "after": lambda: [(c.text, c.tokens) for c in chunk_pages([(None, text)], chunk_size, overlap)],
+        }
+        rates = {}
+        for name, run in runs.items():
+            started = time.perf_counter()
+            for _ in range(opts["repeat"]):
+                chunks = run()
+            seconds = (time.perf_counter() - started) / opts["repeat"]
+            rates[name] = len(chunks) / seconds
+            tokens = sum(t for _, t in chunks)
+            self.stdout.write(
+                f"{name:<7} {len(chunks):>6} chunks {tokens:>10,} tokens {seconds:>8.3f}s {rates[name]:>9.1f} chunks/s"
+            )
+        self.stdout.write(f"speedup {rates['after'] / rates['before']:.1f}x")
@@ -0,0 +1,117 @@
+"""
+Recall vs size of embedding storage options, on an organization's own chunks.
+
+    python manage.py benchmark_embedding_storage <org id or name>
+    python manage.py benchmark_embedding_storage <org> --samples 100 --top-k 10 \
+        --storages vector:1536,vector:512,halfvec:1536,halfvec:768
+
+Sampled chunks' embeddings serve as queries (the chunk itself excluded).
+For each option, the org's stored embeddings are converted on the fly, and
+the exact top k is compared with the exact top k under the current storage.
+It prints bytes per vector, the estimated embedding size for the org,
+recall@k and p50 query time. Nothing is written. halfvec options need
+pgvector >= 0.7 and are skipped otherwise. Recall is only meaningful on real
+embeddings: text-embedding-3 vectors keep most of their ranking in their
+leading dimensions, while synthetic random vectors do not.
+"""
+import random
+import re
+import statistics
+import time
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from apps.accounts.models import Organization
+from apps.knowledge_base.embedding_storage import (
+    bytes_per_vector, cast_sql, current_column_type, halfvec_supported, reduce, validate,
+)
+from apps.knowledge_base.models import DocumentChunk
+from apps.knowledge_base.vector_index import is_postgres
+
+DEFAULT_STORAGES = "vector:1536,vector:768,vector:512,vector:256,halfvec:1536,halfvec:768,halfvec:512"
+
+
+class Command(BaseCommand):
+    help = "Benchmark embedding storage options (recall@k vs bytes per vector) on an organization's chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("organization", help="Organization id or name")
+        parser.add_argument("--samples", type=int, default=50, help="Chunks whose embeddings are used as queries")
+        parser.add_argument("--top-k", type=int, default=10)
+        parser.add_argument("--storages", default=DEFAULT_STORAGES, help="Comma-separated type:dimensions options")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        if not is_postgres(connection):
+            raise CommandError("Embedding storage can only be benchmarked on PostgreSQL")
+        org = Organization.objects.filter(name=opts["organization"]).first()
+        if org is None:
+            try:
+                org = Organization.objects.filter(pk=opts["organization"]).first()
+            except (ValueError, ValidationError):
+                pass
+        if org is None:
+            raise CommandError(f"No organization {opts['organization']!r}")
+
+        current = current_column_type(connection)
+        current_type, current_dimensions = re.fullmatch(r"(\w+)\((\d+)\)", current).groups()
+        current_dimensions = int(current_dimensions)
+        options = []
+        for option in opts["storages"].split(","):
+            storage_type, _, dimensions = option.strip().partition(":")
+            try:
+                dimensions = int(dimensions or current_dimensions)
+                validate(storage_type, dimensions)
+            except ValueError as e:
+                raise CommandError(f"Bad storage option {option!r}: {e}")
+            options.append((storage_type, dimensions))
+        has_halfvec = halfvec_supported(connection)
+
+        chunks = DocumentChunk.objects.filter(organization=org, embedding__isnull=False)
+        total = chunks.count()
+        if not total:
+            raise CommandError(f"{org.name} has no embedded chunks")
+        random.seed(opts["seed"])
+        ids = list(chunks.values_list("id", flat=True))
+        sample = random.sample(ids, min(opts["samples"], len(ids)))
+        queries = list(DocumentChunk.objects.filter(id__in=sample).values_list("id", "embedding"))
+
+        baseline = {chunk_id: self.top_k(org.id, chunk_id, vec, current_type, current_dimensions, opts["top_k"])[0]
+                    for chunk_id, vec in queries}
+        current_bytes = bytes_per_vector(current_type, current_dimensions)
+        self.stdout.write(f"{org.name}: {total} chunks, {len(queries)} queries, top {opts['top_k']}, "
+                          f"recall relative to the current {current}")
+        self.stdout.write(f"  {'storage':<16}{'bytes/vec':>10}{'vs now':>8}{'org MB':>9}{'recall':>8}{'p50 ms':>9}")
+        for storage_type, dimensions in options:
+            label = f"{storage_type}({dimensions})"
+            if dimensions > current_dimensions:
+                self.stdout.write(f"  {label:<16} skipped: more dimensions than currently stored")
+                continue
+            if storage_type == "halfvec" and not has_halfvec:
+                self.stdout.write(f"  {label:<16} skipped: halfvec needs pgvector >= 0.7")
+                continue
+            recalls, timings = [], []
+            for chunk_id, vec in queries:
+                found, ms = self.top_k(org.id, chunk_id, vec, storage_type, dimensions, opts["top_k"])
+                expected = baseline[chunk_id]
+                recalls.append(len(set(found) & set(expected)) / len(expected) if expected else 1.0)
+                timings.append(ms)
+            size = bytes_per_vector(storage_type, dimensions)
+            self.stdout.write(
+                f"  {label:<16}{size:>10}{current_bytes / size:>7.1f}x{total * size / 2**20:>9.1f}"
+                f"{statistics.mean(recalls):>8.3f}{statistics.median(timings):>9.1f}"
+            )
+
+    def top_k(self, org_id, chunk_id, vec, storage_type, dimensions, k):
+        """Exact top k under a storage option (an expression, so the ANN index is not used), and its time in ms."""
+        sql = (
+            f"SELECT dc.id FROM {DocumentChunk._meta.db_table} dc "
+            f"WHERE dc.organization_id = %s AND dc.embedding IS NOT NULL AND dc.id <> %s "
+            f"ORDER BY {cast_sql('dc.embedding', storage_type, dimensions)} <=> %s::{storage_type}({dimensions}) "
+            f"LIMIT %s"
+        )
+        started = time.perf_counter()
+        with connection.cursor() as cur:
+            cur.execute(sql, [org_id, chunk_id, str(reduce(vec, dimensions)), k])
+            found = [row[0] for row in cur.fetchall()]
+        return found, (time.perf_counter() - started) * 1000
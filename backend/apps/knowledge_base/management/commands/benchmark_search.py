@@ -0,0 +1,105 @@
+"""
+Measure recall and latency of the search modes on an organization's own chunks.
+
+    python manage.py benchmark_search <org id or name>
+    python manage.py benchmark_search <org> --samples 200 --top-k 6 --modes lexical,hybrid
+
+Queries are made from randomly sampled chunks, so each has a known right
+answer (the chunk it came from):
+
+  phrase   a quoted run of words from the chunk
+  exact    the chunk's code-like terms (digits, acronyms), e.g. grant codes
+  natural  the chunk's opening words, unquoted
+
+For each mode and query kind it prints recall@k (share of queries whose
+source chunk is in the top k), p50/p95 latency, and for "auto" how often the
+embedding call was skipped. vector, hybrid and auto call the embeddings API
+(cached queries are served from the embedding cache).
+"""
+import random
+import re
+import statistics
+import time
+from collections import defaultdict
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from apps.accounts.models import Organization
+from apps.knowledge_base.models import DocumentChunk
+from apps.knowledge_base.retrieval import SEARCH_MODES, hybrid_search, is_exact_lookup
+
+PHRASE_WORDS = 4
+NATURAL_WORDS = 10
+
+
+def _queries(text: str) -> dict:
+    words = re.findall(r"[\w'./-]+", text)
+    queries = {}
+    if len(words) >= PHRASE_WORDS:
+        start = random.randrange(len(words) - PHRASE_WORDS + 1)
+        queries["phrase"] = '"' + " ".join(words[start:start + PHRASE_WORDS]) + '"'
+    exact = list(dict.fromkeys(w for w in words if is_exact_lookup(w)))[:2]
+    if exact:
+        queries["exact"] = " ".join(exact)
+    if words:
+        queries["natural"] = " ".join(words[:NATURAL_WORDS])
+    return queries
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark search modes (recall@k, p50/p95 latency) on queries sampled from an organization's chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("organization", help="Organization id or name")
+        parser.add_argument("--samples", type=int, default=100, help="Chunks to sample queries from")
+        parser.add_argument("--top-k", type=int, default=6)
+        parser.add_argument("--modes", default=",".join(SEARCH_MODES), help="Comma-separated search modes")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        org = Organization.objects.filter(name=opts["organization"]).first()
+        if org is None:
+            try:
+                org = Organization.objects.filter(pk=opts["organization"]).first()
+            except (ValueError, ValidationError):
+                pass
+        if org is None:
+            raise CommandError(f"No organization {opts['organization']!r}")
+        modes = [m.strip() for m in opts["modes"].split(",") if m.strip()]
+        unknown = set(modes) - set(SEARCH_MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes {sorted(unknown)}; choose from {', '.join(SEARCH_MODES)}")
+
+        random.seed(opts["seed"])
+        chunk_ids = list(DocumentChunk.objects.filter(organization=org, document__is_active=True)
+                         .values_list("id", flat=True))
+        if not chunk_ids:
+            raise CommandError("The organization has no active chunks")
+        sample = random.sample(chunk_ids, min(opts["samples"], len(chunk_ids)))
+        cases = []
+        for chunk_id, text in DocumentChunk.objects.filter(id__in=sample).values_list("id", "text"):
+            cases.extend((kind, query, chunk_id) for kind, query in _queries(text).items())
+
+        rows = defaultdict(lambda: {"found": 0, "latencies": [], "lexical_only": 0})
+        for mode in modes:
+            for kind, query, chunk_id in cases:
+                started = time.perf_counter()
+                hits, used = hybrid_search(org, query, top_k=opts["top_k"], mode=mode)
+                row = rows[(mode, kind)]
+                row["latencies"].append((time.perf_counter() - started) * 1000)
+                row["found"] += any(h.chunk_id == chunk_id for h in hits)
+                row["lexical_only"] += used == "lexical"
+
+        k = opts["top_k"]
+        self.stdout.write(f"{len(cases)} queries from {len(sample)} chunks of {org.name}")
+        self.stdout.write(f"{'mode':<8} {'queries':<8} {'n':>5} {f'recall@{k}':>9} {'p50 ms':>8} {'p95 ms':>8} {'no embed':>8}")
+        for (mode, kind), row in sorted(rows.items(), key=lambda item: (modes.index(item[0][0]), item[0][1])):
+            n = len(row["latencies"])
+            self.stdout.write(
+                f"{mode:<8} {kind:<8} {n:>5} {row['found'] / n:>9.1%} {statistics.median(row['latencies']):>8.1f} "
+                f"{_percentile(row['latencies'], 95):>8.1f} {row['lexical_only'] / n:>8.0%}"
+            )
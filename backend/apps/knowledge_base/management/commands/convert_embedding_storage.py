@@ -0,0 +1,99 @@
+"""
+Convert the DocumentChunk.embedding column to the storage configured by
+KB_EMBEDDING_STORAGE / KB_EMBEDDING_DIMENSIONS (see embedding_storage.py).
+
+    KB_EMBEDDING_STORAGE=halfvec KB_EMBEDDING_DIMENSIONS=768 python manage.py convert_embedding_storage
+    python manage.py convert_embedding_storage --dry-run
+
+The ANN index is dropped, the column is rewritten in place and the index is
+rebuilt with the matching operator class, all in one transaction. The table
+is locked throughout: run it in a maintenance window, with the new settings
+deployed alongside, since queries cast to the configured type.
+
+Going to fewer dimensions or to halfvec converts the stored vectors.
+Going back to more dimensions needs what was cut off, so those vectors are
+refilled from the full-size ChunkEmbedding store by content hash; chunks
+without a stored embedding are left NULL (and are reported) until reindexed.
+"""
+import re
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from apps.knowledge_base.embedding_storage import (
+    cast_sql, column_type, current_column_type, halfvec_supported, storage,
+)
+from apps.knowledge_base.models import ChunkEmbedding, DocumentChunk
+from apps.knowledge_base.vector_index import (
+    INDEX_NAME, create_index_sql, drop_index_sql, index_params, is_postgres, maintenance_work_mem_sql,
+    suggested_ivfflat_lists,
+)
+
+
+class Command(BaseCommand):
+    help = "Convert DocumentChunk.embedding to KB_EMBEDDING_STORAGE / KB_EMBEDDING_DIMENSIONS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--maintenance-work-mem", default="", help="e.g. '2GB'; HNSW builds much faster when the graph fits")
+        parser.add_argument("--dry-run", action="store_true", help="Print the SQL without executing it")
+
+    def handle(self, *args, **opts):
+        if not is_postgres(connection):
+            raise CommandError("Embedding storage can only be converted on PostgreSQL")
+        try:
+            storage_type, dimensions = storage()
+        except ValueError as e:
+            raise CommandError(str(e))
+        target = column_type(storage_type, dimensions)
+        current = current_column_type(connection)
+        if current == target:
+            self.stdout.write(f"Embeddings are already stored as {target}")
+            return
+        if storage_type == "halfvec" and not halfvec_supported(connection):
+            raise CommandError("halfvec storage needs pgvector >= 0.7 on the database server")
+        match = re.fullmatch(r"\w+\((\d+)\)", current)
+        if not match:
+            raise CommandError(f"Unexpected embedding column type {current}")
+        current_dimensions = int(match.group(1))
+
+        table = DocumentChunk._meta.db_table
+        method = getattr(settings, "KB_VECTOR_INDEX_METHOD", "hnsw")
+        params = index_params(method)
+        if method == "ivfflat":
+            params["lists"] = suggested_ivfflat_lists(DocumentChunk.objects.count())
+
+        statements = []
+        if opts["maintenance_work_mem"]:
+            try:
+                statements.append(maintenance_work_mem_sql(opts["maintenance_work_mem"], local=True))
+            except ValueError as e:
+                raise CommandError(str(e))
+        statements.append(drop_index_sql(INDEX_NAME))
+        refill = dimensions > current_dimensions
+        if refill:
+            statements += [
+                f"ALTER TABLE {table} ALTER COLUMN embedding TYPE {target} USING NULL",
+                f"UPDATE {table} dc SET embedding = {cast_sql('ce.embedding', storage_type, dimensions)} "
+                f"FROM {ChunkEmbedding._meta.db_table} ce WHERE ce.content_hash = dc.content_hash",
+            ]
+        else:
+            statements.append(
+                f"ALTER TABLE {table} ALTER COLUMN embedding TYPE {target} "
+                f"USING {cast_sql('embedding', storage_type, dimensions)}"
+            )
+        statements.append(create_index_sql(method, params, storage_type=storage_type))
+
+        self.stdout.write(f"Converting embeddings from {current} to {target}")
+        with transaction.atomic(), connection.cursor() as cur:
+            for sql in statements:
+                self.stdout.write(sql)
+                if not opts["dry_run"]:
+                    cur.execute(sql)
+            if opts["dry_run"]:
+                return
+            if refill:
+                cur.execute(f"SELECT count(*) FROM {table} WHERE embedding IS NULL")
+                missing = cur.fetchone()[0]
+                if missing:
+                    self.stdout.write(self.style.WARNING(
+                        f"{missing} chunks have no stored embedding to refill from; reindex their documents"))
+        self.stdout.write(self.style.SUCCESS(f"Embeddings are now stored as {target}, indexed with {method} {params}"))
@@ -0,0 +1,86 @@
+"""
+Rebuild or retune the ANN index on DocumentChunk.embedding without blocking writes.
+
+    python manage.py rebuild_vector_index                      # HNSW with settings defaults
+    python manage.py rebuild_vector_index --m 24 --ef-construction 128
+    python manage.py rebuild_vector_index --method ivfflat     # lists sized from row count
+    python manage.py rebuild_vector_index --method ivfflat --lists 400
+
+The new index is built CONCURRENTLY under a temporary name, then swapped in
+place of the old one, so searches keep using the old index until the end.
+When the chunk table is partitioned by organization, the parent index is
+created ON ONLY the parent and each partition's index is built concurrently
+and attached to it.
+"""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from apps.knowledge_base.models import DocumentChunk
+from apps.knowledge_base.partitions import list_partitions
+from apps.knowledge_base.vector_index import (
+    INDEX_NAME, METHODS, create_index_sql, drop_index_sql, index_params,
+    is_postgres, maintenance_work_mem_sql, suggested_ivfflat_lists,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild or retune the pgvector ANN index on DocumentChunk.embedding"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--method", choices=METHODS, help="Index method (default: KB_VECTOR_INDEX_METHOD)")
+        parser.add_argument("--m", type=int, help="HNSW max connections per layer")
+        parser.add_argument("--ef-construction", type=int, help="HNSW candidate list size at build time")
+        parser.add_argument("--lists", type=int, help="IVFFlat number of lists (default: sized from row count)")
+        parser.add_argument("--maintenance-work-mem", default="", help="e.g. '2GB'; HNSW builds much faster when the graph fits")
+        parser.add_argument("--dry-run", action="store_true", help="Print the SQL without executing it")
+
+    def handle(self, *args, **opts):
+        if not is_postgres(connection):
+            raise CommandError("Vector indexes are only supported on PostgreSQL")
+
+        method = opts["method"] or getattr(settings, "KB_VECTOR_INDEX_METHOD", "hnsw")
+        params = index_params(method, m=opts["m"], ef_construction=opts["ef_construction"], lists=opts["lists"])
+        if method == "ivfflat" and opts["lists"] is None:
+            params["lists"] = suggested_ivfflat_lists(DocumentChunk.objects.count())
+
+        tmp_name = f"{INDEX_NAME}_new"
+        statements = []
+        if opts["maintenance_work_mem"]:
+            try:
+                statements.append(maintenance_work_mem_sql(opts["maintenance_work_mem"]))
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        partitions = list_partitions()
+        if partitions:
+            # partitioned indexes cannot be created or dropped CONCURRENTLY as a whole
+            token = int(time.time())
+            statements += [
+                drop_index_sql(tmp_name),  # leftover from an interrupted run
+                create_index_sql(method, params, name=tmp_name, only=True),
+            ]
+            for partition in partitions:
+                part_index = f"{partition}_ann_{token}"
+                statements += [
+                    create_index_sql(method, params, name=part_index, table=partition, concurrently=True),
+                    f"ALTER INDEX {tmp_name} ATTACH PARTITION {part_index}",
+                ]
+            statements.append(drop_index_sql(INDEX_NAME))
+        else:
+            statements += [
+                drop_index_sql(tmp_name, concurrently=True),  # leftover from an interrupted run
+                create_index_sql(method, params, name=tmp_name, concurrently=True),
+                drop_index_sql(INDEX_NAME, concurrently=True),
+            ]
+        statements.append(f"ALTER INDEX {tmp_name} RENAME TO {INDEX_NAME}")
+
+        for sql in statements:
+            self.stdout.write(sql)
+            if opts["dry_run"]:
+                continue
+            with connection.cursor() as cur:
+                cur.execute(sql)
+
+        if not opts["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {INDEX_NAME} using {method} {params}"))
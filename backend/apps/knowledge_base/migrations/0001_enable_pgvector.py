@@ -1,6 +1,7 @@
 # Generated by Django 5.2.5 on 2025-08-16 10:12
 
 from django.db import migrations
+from pgvector.django import VectorExtension
 
 
 class Migration(migrations.Migration):
@@ -9,4 +10,5 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
+        VectorExtension(),
     ]
@@ -0,0 +1,33 @@
+# HNSW index on DocumentChunk.embedding (cosine). PostgreSQL only; retune or
+# switch to IVFFlat later with `manage.py rebuild_vector_index`.
+
+from django.db import migrations
+
+
+def create_ann_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS kb_chunk_embedding_ann_idx "
+        "ON knowledge_base_documentchunk USING hnsw (embedding vector_cosine_ops) "
+        "WITH (m = 16, ef_construction = 64)"
+    )
+
+
+def drop_ann_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS kb_chunk_embedding_ann_idx")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('knowledge_base', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_ann_index, drop_ann_index),
+    ]
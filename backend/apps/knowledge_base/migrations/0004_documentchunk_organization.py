@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_chunk_organization(apps, schema_editor):
+    DocumentChunk = apps.get_model('knowledge_base', 'DocumentChunk')
+    KnowledgeDocument = apps.get_model('knowledge_base', 'KnowledgeDocument')
+    DocumentChunk.objects.filter(organization__isnull=True).update(
+        organization_id=Subquery(
+            KnowledgeDocument.objects.filter(id=OuterRef('document_id')).values('organization_id')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('knowledge_base', '0003_documentchunk_embedding_ann_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='organization',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='kb_chunks', to='accounts.organization'),
+        ),
+        migrations.RunPython(backfill_chunk_organization, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,104 @@
+# Converts knowledge_base_documentchunk into a table list-partitioned by
+# organization_id, with one partition per organization plus a DEFAULT
+# partition (chunks without an organization). Partitioned indexes (including
+# the HNSW index) are created on the parent and cascade to every partition.
+# PostgreSQL only; on other databases the table is left as-is.
+#
+# A partitioned table cannot have a primary key / unique constraint that does
+# not include the partition key, so (id) and (document_id, chunk_index) are
+# enforced as (id, organization_id) and (document_id, chunk_index, organization_id).
+# Since organization_id is derived from document_id, the latter is equivalent.
+
+from django.db import migrations
+
+TABLE = "knowledge_base_documentchunk"
+OLD_TABLE = "knowledge_base_documentchunk_unpartitioned"
+
+
+def partition_name(org_id):
+    return f"kb_chunk_org_{org_id.hex}"
+
+
+def partition_documentchunk(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Organization = apps.get_model("accounts", "Organization")
+    execute = schema_editor.execute
+
+    execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+    execute(
+        f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        f"PARTITION BY LIST (organization_id)"
+    )
+    execute(f"CREATE TABLE kb_chunk_org_default PARTITION OF {TABLE} DEFAULT")
+    for org_id in Organization.objects.values_list("id", flat=True):
+        execute(f"CREATE TABLE {partition_name(org_id)} PARTITION OF {TABLE} FOR VALUES IN ('{org_id}')")
+
+    execute(f"INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}")
+    execute(f"DROP TABLE {OLD_TABLE}")
+
+    # Recreate constraints/indexes under their original names so later schema changes still find them
+    execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT knowledge_base_documentchunk_id_org_uniq UNIQUE (id, organization_id)")
+    execute(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT knowledge_base_documentc_document_id_chunk_index_b82fef5f_uniq "
+        f"UNIQUE (document_id, chunk_index, organization_id)"
+    )
+    execute(f"CREATE INDEX knowledge_b_documen_7eb428_idx ON {TABLE} (document_id, chunk_index)")
+    execute(f"CREATE INDEX knowledge_base_documentchunk_document_id_919d93f4 ON {TABLE} (document_id)")
+    execute(f"CREATE INDEX knowledge_base_documentchunk_organization_id_aa197bc9 ON {TABLE} (organization_id)")
+    execute(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT knowledge_base_docum_document_id_919d93f4_fk_knowledge "
+        f"FOREIGN KEY (document_id) REFERENCES knowledge_base_knowledgedocument (id) DEFERRABLE INITIALLY DEFERRED"
+    )
+    execute(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT knowledge_base_docum_organization_id_aa197bc9_fk_accounts_ "
+        f"FOREIGN KEY (organization_id) REFERENCES accounts_organization (id) DEFERRABLE INITIALLY DEFERRED"
+    )
+    execute(
+        f"CREATE INDEX kb_chunk_embedding_ann_idx ON {TABLE} USING hnsw (embedding vector_cosine_ops) "
+        f"WITH (m = 16, ef_construction = 64)"
+    )
+
+
+def unpartition_documentchunk(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    execute = schema_editor.execute
+
+    execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+    execute(f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    execute(f"INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}")
+    execute(f"DROP TABLE {OLD_TABLE} CASCADE")
+
+    execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT knowledge_base_documentchunk_pkey PRIMARY KEY (id)")
+    execute(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT knowledge_base_documentc_document_id_chunk_index_b82fef5f_uniq "
+        f"UNIQUE (document_id, chunk_index)"
+    )
+    execute(f"CREATE INDEX knowledge_b_documen_7eb428_idx ON {TABLE} (document_id, chunk_index)")
+    execute(f"CREATE INDEX knowledge_base_documentchunk_document_id_919d93f4 ON {TABLE} (document_id)")
+    execute(f"CREATE INDEX knowledge_base_documentchunk_organization_id_aa197bc9 ON {TABLE} (organization_id)")
+    execute(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT knowledge_base_docum_document_id_919d93f4_fk_knowledge "
+        f"FOREIGN KEY (document_id) REFERENCES knowledge_base_knowledgedocument (id) DEFERRABLE INITIALLY DEFERRED"
+    )
+    execute(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT knowledge_base_docum_organization_id_aa197bc9_fk_accounts_ "
+        f"FOREIGN KEY (organization_id) REFERENCES accounts_organization (id) DEFERRABLE INITIALLY DEFERRED"
+    )
+    execute(
+        f"CREATE INDEX kb_chunk_embedding_ann_idx ON {TABLE} USING hnsw (embedding vector_cosine_ops) "
+        f"WITH (m = 16, ef_construction = 64)"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('knowledge_base', '0004_documentchunk_organization'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_documentchunk, unpartition_documentchunk),
+    ]
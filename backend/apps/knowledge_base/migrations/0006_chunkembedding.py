@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:26
+
+import hashlib
+import pgvector.django.vector
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_chunk_embeddings(apps, schema_editor):
+    """
+    Key existing chunks by content hash and seed the store from their embeddings,
+    so the first reindex after deploy is free and its chunks are matched, not rewritten.
+    """
+    DocumentChunk = apps.get_model('knowledge_base', 'DocumentChunk')
+    ChunkEmbedding = apps.get_model('knowledge_base', 'ChunkEmbedding')
+    model = getattr(settings, 'KB_EMBEDDING_MODEL', 'text-embedding-3-small')
+
+    last = None
+    while True:
+        # keyset pages, since the chunks being read are also being updated
+        rows = DocumentChunk.objects.order_by('pk')
+        if last is not None:
+            rows = rows.filter(pk__gt=last)
+        rows = list(rows.values_list('pk', 'text', 'embedding')[:1000])
+        if not rows:
+            break
+        chunks, embeddings = [], []
+        for pk, text, embedding in rows:
+            digest = hashlib.sha256(f"{model}\n{text}".encode('utf-8')).hexdigest()
+            chunks.append(DocumentChunk(pk=pk, content_hash=digest))
+            if embedding is not None:
+                embeddings.append(ChunkEmbedding(content_hash=digest, model=model, embedding=embedding))
+        DocumentChunk.objects.bulk_update(chunks, ['content_hash'])
+        ChunkEmbedding.objects.bulk_create(embeddings, ignore_conflicts=True)
+        last = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge_base', '0005_partition_documentchunk_by_organization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkEmbedding',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=100)),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=1536)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(seed_chunk_embeddings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Full-text search over DocumentChunk.text for lexical and hybrid retrieval:
+# a stored generated tsvector column plus a GIN index. Like the HNSW index,
+# both are managed outside the ORM (queried in retrieval.lexical_search).
+# Created on the partitioned parent, so every partition, including ones
+# added later by partitions.ensure_partition, gets the column and index.
+# PostgreSQL only.
+
+from django.db import migrations
+
+TABLE = "knowledge_base_documentchunk"
+TEXT_SEARCH_CONFIG = "english"  # must match retrieval.TEXT_SEARCH_CONFIG
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"ALTER TABLE {TABLE} ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(text, ''))) STORED"
+    )
+    schema_editor.execute(f"CREATE INDEX kb_chunk_search_vector_idx ON {TABLE} USING gin (search_vector)")
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS kb_chunk_search_vector_idx")
+    schema_editor.execute(f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge_base', '0006_chunkembedding'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
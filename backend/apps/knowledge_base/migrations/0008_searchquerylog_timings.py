@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('knowledge_base', '0007_documentchunk_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchquerylog',
+            name='cached',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='searchquerylog',
+            name='embed_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='searchquerylog',
+            name='llm_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='searchquerylog',
+            name='mode',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='searchquerylog',
+            name='serialize_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='searchquerylog',
+            name='source',
+            field=models.CharField(choices=[('search', 'search'), ('chat', 'chat'), ('chat_stream', 'chat_stream')], default='search', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='searchquerylog',
+            name='sql_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='searchquerylog',
+            index=models.Index(fields=['organization', 'created_at'], name='knowledge_b_organiz_f3e172_idx'),
+        ),
+    ]
@@ -53,11 +53,22 @@ class DocumentChunk(models.Model):
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     document = models.ForeignKey(KnowledgeDocument, on_delete=models.CASCADE, related_name="chunks")
+    # denormalized from document.organization; the table is list-partitioned on it (see partitions.py)
+    organization = models.ForeignKey(
+        "accounts.Organization",
+        on_delete=models.CASCADE,
+        related_name="kb_chunks",
+        null=True,
+        blank=True,
+    )
     chunk_index = models.PositiveIntegerField()  # ordering index
     text = models.TextField()
     # vector dimension depends on embedding model; pgvector.VectorField stores vector
+    # On Postgres the column may be halfvec and/or fewer dimensions: the type follows
+    # KB_EMBEDDING_STORAGE / KB_EMBEDDING_DIMENSIONS, see embedding_storage.py
     embedding = VectorField(dimensions=1536, null=True)  # default uses 1536 (text-embedding-3-small)
     tokens = models.PositiveIntegerField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, default="")  # key into ChunkEmbedding
     page_start = models.IntegerField(null=True, blank=True)
     page_end = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -66,7 +77,7 @@ class DocumentChunk(models.Model):
         unique_together = ("document", "chunk_index")
         indexes = [
             models.Index(fields=["document", "chunk_index"]),
-            # vector index must be created in a migration using RunSQL for ivfflat or hnsw (see migration note).
+            # ANN index on embedding is managed outside the ORM: see migration 0003 and vector_index.py.
         ]
         ordering = ["chunk_index"]
 
@@ -74,15 +85,45 @@ class DocumentChunk(models.Model):
         return f"chunk {self.chunk_index} of {self.document.title}"
 
 
+class ChunkEmbedding(models.Model):
+    """
+    Content-addressed embedding cache: one row per (chunk text, embedding model),
+    shared across documents, reindexes and organizations so unchanged text is
+    never re-embedded. Rows no chunk refers to are pruned (embedding_store.prune_unreferenced).
+    """
+    content_hash = models.CharField(max_length=64, primary_key=True)  # sha256 of model + text
+    model = models.CharField(max_length=100)
+    embedding = VectorField(dimensions=1536)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.model}:{self.content_hash[:12]}"
+
+
 class SearchQueryLog(models.Model):
+    """One search or chat retrieval, with where its time went (written in batches by query_log)."""
+    SOURCE_CHOICES = (("search", "search"), ("chat", "chat"), ("chat_stream", "chat_stream"))
+    STAGES = ("embed", "sql", "llm", "serialize")
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
     organization = models.ForeignKey("accounts.Organization", on_delete=models.SET_NULL, null=True, blank=True)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default="search")
     query_text = models.TextField()
     top_k = models.PositiveIntegerField(default=6)
+    mode = models.CharField(max_length=20, blank=True)  # search mode used (vector, lexical, hybrid)
+    cached = models.BooleanField(default=False)  # served from the result cache
     latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    # per-stage milliseconds; null when the stage did not run
+    embed_ms = models.FloatField(null=True, blank=True)
+    sql_ms = models.FloatField(null=True, blank=True)
+    llm_ms = models.FloatField(null=True, blank=True)
+    serialize_ms = models.FloatField(null=True, blank=True)
     result_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["organization", "created_at"])]
+
 
 class ChatSession(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
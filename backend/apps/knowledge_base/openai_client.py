@@ -1,6 +1,11 @@
+import asyncio
 import os
-from openai import OpenAI
+import weakref
+from asgiref.sync import sync_to_async
+from openai import AsyncOpenAI, OpenAI
 from django.conf import settings
+from .embedding_cache import get_embedding_cache, cache_key
+from .embedding_client import get_embedder
 
 # Initialize the OpenAI client
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
@@ -8,36 +13,104 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
 EMBEDDING_MODEL = getattr(settings, "KB_EMBEDDING_MODEL", "text-embedding-3-small")
 CHAT_MODEL = getattr(settings, "KB_CHAT_MODEL", "gpt-3.5-turbo")
 
-def embed_texts(texts: list, batch_size: int = 64) -> list:
+def embed_texts(texts: list, batch_size: int = None) -> list:
     """
-    Takes a list of strings, returns list of vectors (floats).
+    Takes a list of strings, returns list of vectors (floats) in the same order.
+    Requests are sized by tokens and sent concurrently (see embedding_client);
+    batch_size additionally caps the number of inputs per request.
     """
-    results = []
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
-        response = client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=batch
-        )
-        batch_embs = [item.embedding for item in response.data]
-        results.extend(batch_embs)
-    return results
+    return get_embedder().embed(texts, max_items=batch_size)
 
-def chat_with_context(system_prompt: str, user_question: str, context_chunks: list, max_tokens=512, temperature=0.2):
+def cached_embed_texts(texts: list, batch_size: int = None) -> list:
     """
-    context_chunks: list of dicts {'text': ..., 'source': ..., 'score': ...}
-    We'll build a system + context + user message and call chat completion.
+    Same as embed_texts, but serves repeated texts from the embedding cache
+    and only sends the misses (deduplicated) to the API.
     """
+    cache = get_embedding_cache()
+    keys = [cache_key(EMBEDDING_MODEL, t) for t in texts]
+    found = cache.get_many(list(dict.fromkeys(keys)))
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    if missing:
+        fresh = dict(zip(missing.keys(), embed_texts(list(missing.values()), batch_size=batch_size)))
+        cache.set_many(fresh)
+        found.update(fresh)
+    return [found[k] for k in keys]
+
+
+def embed_query(text: str) -> list:
+    """Embedding of a single search/chat/generation query, cached."""
+    return cached_embed_texts([text], batch_size=1)[0]
+
+def _chat_messages(system_prompt: str, user_question: str, context_chunks: list) -> list:
     # Build a compact context
     context_text = "\n\n".join([f"Source: {c['source']}\n{c['text'][:1000]}" for c in context_chunks])
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"Context:\n{context_text}\n\nQuestion: {user_question}"},
     ]
+
+def chat_with_context(system_prompt: str, user_question: str, context_chunks: list, max_tokens=512, temperature=0.2):
+    """
+    context_chunks: list of dicts {'text': ..., 'source': ..., 'score': ...}
+    We'll build a system + context + user message and call chat completion.
+    """
     response = client.chat.completions.create(
         model=CHAT_MODEL,
-        messages=messages,
+        messages=_chat_messages(system_prompt, user_question, context_chunks),
+        max_tokens=max_tokens,
+        temperature=temperature,
+    )
+    return response.choices[0].message.content
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_async_client() -> AsyncOpenAI:
+    """AsyncOpenAI for the running event loop (its connection pool can't be shared across loops)."""
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        _async_clients[loop] = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
+    return _async_clients[loop]
+
+async def aembed_query(text: str) -> list:
+    """embed_query for async views: same cache, non-blocking API call."""
+    cache = get_embedding_cache()
+    key = cache_key(EMBEDDING_MODEL, text)
+    # the shared tier is Redis, so lookups leave the event loop too
+    found = await sync_to_async(cache.get_many, thread_sensitive=False)([key])
+    if key in found:
+        return found[key]
+    response = await get_async_client().embeddings.create(model=EMBEDDING_MODEL, input=[text])
+    vec = response.data[0].embedding
+    await sync_to_async(cache.set_many, thread_sensitive=False)({key: vec})
+    return vec
+
+async def achat_with_context(system_prompt: str, user_question: str, context_chunks: list,
+                             max_tokens=512, temperature=0.2):
+    """chat_with_context for async views."""
+    response = await get_async_client().chat.completions.create(
+        model=CHAT_MODEL,
+        messages=_chat_messages(system_prompt, user_question, context_chunks),
+        max_tokens=max_tokens,
+        temperature=temperature,
+    )
+    return response.choices[0].message.content
+
+async def stream_chat_with_context(system_prompt: str, user_question: str, context_chunks: list,
+                                   max_tokens=512, temperature=0.2):
+    """Same as chat_with_context, yielding pieces of the answer as the model produces them."""
+    stream = await get_async_client().chat.completions.create(
+        model=CHAT_MODEL,
+        messages=_chat_messages(system_prompt, user_question, context_chunks),
         max_tokens=max_tokens,
         temperature=temperature,
+        stream=True,
     )
-    return response.choices[0].message.content
\ No newline at end of file
+    async with stream:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
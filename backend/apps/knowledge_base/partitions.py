@@ -0,0 +1,96 @@
+"""
+Per-organization partitions of the DocumentChunk table (PostgreSQL only).
+The table is LIST-partitioned on organization_id (migration 0005) so that a
+tenant's vector search only scans that tenant's partition and ANN index.
+Partitions are created when an organization is created and, defensively,
+before any chunk write; rows that landed in the DEFAULT partition before the
+organization's partition existed are moved into it.
+"""
+import logging
+import zlib
+from django.db import connection, transaction
+from .models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTITION = "kb_chunk_org_default"
+
+# organizations whose partition is known to exist (per process)
+_known_partitions = set()
+
+
+def partition_name(org_id) -> str:
+    return f"kb_chunk_org_{org_id.hex}"
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE relname = %s", [DocumentChunk._meta.db_table])
+        row = cur.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def list_partitions() -> list:
+    """Names of all partitions of the chunk table, including the default one."""
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = %s ORDER BY c.relname
+            """,
+            [DocumentChunk._meta.db_table],
+        )
+        return [r[0] for r in cur.fetchall()]
+
+
+def ensure_partition(org_id):
+    """
+    Create the chunk partition for an organization if it does not exist yet.
+    Safe to call concurrently and repeatedly; no-op when the table is not partitioned.
+    """
+    if org_id is None or org_id in _known_partitions:
+        return
+    if not is_partitioned():
+        return
+
+    table = DocumentChunk._meta.db_table
+    name = partition_name(org_id)
+    with transaction.atomic(), connection.cursor() as cur:
+        # serialize creators of the same partition
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", [zlib.crc32(name.encode())])
+        cur.execute("SELECT to_regclass(%s)", [name])
+        if cur.fetchone()[0] is None:
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE organization_id = %s)", [org_id])
+            if cur.fetchone()[0]:
+                # move stray rows out of the default partition before attaching. Generated
+                # columns (search_vector, migration 0007) must stay generated to attach, and
+                # can't be written: only the model's columns are copied, the rest is recomputed
+                columns = ", ".join(f.column for f in DocumentChunk._meta.concrete_fields)
+                cur.execute(
+                    f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)"
+                )
+                cur.execute(
+                    f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE organization_id = %s RETURNING {columns}) "
+                    f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved",
+                    [org_id],
+                )
+                cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES IN (%s)", [str(org_id)])
+            else:
+                cur.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES IN (%s)", [str(org_id)])
+            logger.info(f"Created chunk partition {name} for organization {org_id}")
+    _known_partitions.add(org_id)
+
+
+def drop_partition(org_id):
+    """Drop an organization's (empty) partition after the organization is deleted."""
+    _known_partitions.discard(org_id)
+    if org_id is None or not is_partitioned():
+        return
+    with connection.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {partition_name(org_id)}")
@@ -29,3 +29,14 @@ class CanManageDocument(BasePermission):
             return True
         # org admin
         return u.user_roles.filter(role__name="admin").exists()
+
+
+class CanViewSearchAnalytics(BasePermission):
+    """Superusers (every organization) and org admins (their own)."""
+    def has_permission(self, request, view):
+        u = request.user
+        if not (u and u.is_authenticated):
+            return False
+        if u.is_superuser:
+            return True
+        return bool(u.organization) and u.user_roles.filter(role__name="admin").exists()
@@ -0,0 +1,223 @@
+"""
+SearchQueryLog recording that stays off the request path.
+
+Views time their stages with a StageTimer and hand the finished entry to
+record(), which only appends it to an in-process buffer. The buffer is
+written with one bulk insert once it holds KB_QUERY_LOG_BATCH entries or
+its oldest entry is KB_QUERY_LOG_FLUSH_SECONDS old, checked when a request
+finishes, after its response has been sent (signals.flush_query_log).
+Entries still buffered when a process exits are lost; this is analytics,
+not an audit trail.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.db import connections
+from django.db.models import Aggregate, Count, FloatField, Q
+from .models import SearchQueryLog
+from .vector_index import is_postgres
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimer:
+    """Milliseconds spent per stage of one request, plus the total since creation."""
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._started = clock()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (self._clock() - started) * 1000
+
+    def total_ms(self) -> float:
+        return (self._clock() - self._started) * 1000
+
+    def log_fields(self) -> dict:
+        fields = {f"{name}_ms": round(self.stages[name], 3) for name in SearchQueryLog.STAGES if name in self.stages}
+        fields["latency_ms"] = round(self.total_ms())
+        return fields
+
+
+class QueryLogBuffer:
+    def __init__(self, batch_size: int = 200, flush_seconds: float = 5.0, max_pending: int = 10000,
+                 clock=time.monotonic):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._clock = clock
+        self._pending = deque()
+        self._oldest = None
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, entry: SearchQueryLog):
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                # the database is not keeping up; shed load rather than grow without bound
+                self._pending.popleft()
+                self._dropped += 1
+            if not self._pending:
+                self._oldest = self._clock()
+            self._pending.append(entry)
+
+    def due(self) -> bool:
+        with self._lock:
+            return bool(self._pending) and (
+                len(self._pending) >= self.batch_size or self._clock() - self._oldest >= self.flush_seconds
+            )
+
+    def flush(self) -> int:
+        with self._lock:
+            entries, self._pending = list(self._pending), deque()
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            logger.warning(f"Dropped {dropped} search query log entries: the write buffer was full")
+        if not entries:
+            return 0
+        try:
+            SearchQueryLog.objects.bulk_create(entries, batch_size=self.batch_size)
+        except Exception as e:
+            logger.warning(f"Could not write {len(entries)} search query log entries: {e}")
+            return 0
+        return len(entries)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_query_log() -> QueryLogBuffer:
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = QueryLogBuffer(
+                    batch_size=getattr(settings, "KB_QUERY_LOG_BATCH", 200),
+                    flush_seconds=getattr(settings, "KB_QUERY_LOG_FLUSH_SECONDS", 5.0),
+                    max_pending=getattr(settings, "KB_QUERY_LOG_MAX_PENDING", 10000),
+                )
+    return _buffer
+
+
+def record(request, source: str, query: str, top_k: int, timer: StageTimer, result_count: int,
+           mode: str = "", cached: bool = False):
+    """Queue a SearchQueryLog entry for the current request."""
+    if not getattr(settings, "KB_QUERY_LOG_ENABLED", True):
+        return
+    get_query_log().add(SearchQueryLog(
+        user_id=request.user.pk, organization_id=request.user.organization_id, source=source,
+        query_text=query, top_k=top_k, mode=mode, cached=cached, result_count=result_count,
+        **timer.log_fields(),
+    ))
+
+
+def flush_when_due():
+    buffer = get_query_log()
+    if buffer.due():
+        buffer.flush()
+
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(1, -(-len(sorted_values) * pct // 100))  # ceil
+    return sorted_values[int(rank) - 1]
+
+
+class Percentiles(Aggregate):
+    """
+    Postgres percentile_disc at PERCENTILES, as an array: the nearest-rank
+    percentiles percentile() computes, without reading the rows out.
+    """
+    function = "percentile_disc"
+    template = (f"%(function)s(ARRAY[{', '.join(str(p / 100) for p in PERCENTILES)}]) "
+                f"WITHIN GROUP (ORDER BY %(expressions)s)")
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, output_field=ArrayField(FloatField()), **extra)
+
+
+def _stage_fields():
+    return ["latency_ms"] + [f"{name}_ms" for name in SearchQueryLog.STAGES]
+
+
+def _timings_in_sql(queryset) -> list:
+    """(org id, org name, queries, cached, {field: (count, percentiles)}) per organization, aggregated by Postgres."""
+    aggregates = {}
+    for field in _stage_fields():
+        aggregates[f"{field}_count"] = Count(field)
+        aggregates[f"{field}_pct"] = Percentiles(field)
+    rows = (queryset.order_by().values("organization_id", "organization__name")
+            .annotate(queries=Count("id"), cached=Count("id", filter=Q(cached=True)), **aggregates))
+    return [
+        (row["organization_id"], row["organization__name"], row["queries"], row["cached"],
+         {field: (row[f"{field}_count"], row[f"{field}_pct"]) for field in _stage_fields()})
+        for row in rows
+    ]
+
+
+def _timings_in_python(queryset) -> list:
+    """_timings_in_sql for databases without percentile_disc (SQLite): streams the rows."""
+    stage_fields = _stage_fields()
+    per_org = {}
+    rows = queryset.values_list("organization_id", "organization__name", "cached", *stage_fields)
+    for org_id, org_name, cached, *timings in rows.iterator(chunk_size=2000):
+        org = per_org.setdefault(org_id, {"name": org_name, "queries": 0, "cached": 0,
+                                          "timings": {f: [] for f in stage_fields}})
+        org["queries"] += 1
+        org["cached"] += cached
+        for field, value in zip(stage_fields, timings):
+            if value is not None:
+                org["timings"][field].append(value)
+
+    result = []
+    for org_id, org in per_org.items():
+        stages = {}
+        for field, values in org["timings"].items():
+            values.sort()
+            stages[field] = (len(values), [percentile(values, p) for p in PERCENTILES] if values else None)
+        result.append((org_id, org["name"], org["queries"], org["cached"], stages))
+    return result
+
+
+def latency_summary(queryset) -> list:
+    """
+    Per organization: query count, result-cache hit rate and p50/p95/p99 of
+    the total latency and of each stage (over the queries that ran it).
+    Computed in the database on Postgres.
+    """
+    if is_postgres(connections[queryset.db]):
+        per_org = _timings_in_sql(queryset)
+    else:
+        per_org = _timings_in_python(queryset)
+
+    summary = []
+    for org_id, org_name, queries, cached, timings in sorted(per_org, key=lambda org: -org[2]):
+        stages = {}
+        for field, (count, values) in timings.items():
+            if count:
+                stages[field[:-3] if field != "latency_ms" else "total"] = {
+                    "count": count, **{f"p{p}": round(v, 1) for p, v in zip(PERCENTILES, values)}
+                }
+        summary.append({
+            "organization": str(org_id) if org_id else None,
+            "organization_name": org_name,
+            "queries": queries,
+            "cache_hit_rate": round(cached / queries, 4),
+            "stages": stages,
+        })
+    return summary
@@ -0,0 +1,118 @@
+"""
+Cache of retrieval results (the hits for a query) in the shared Django cache.
+
+Keys cover the organization, the normalized query, every search parameter
+and the organization's KB generation: a counter bumped whenever what search
+can return changes (a document ingested or re-ingested, deleted, or its
+is_active flag changed). Invalidation is one increment, and entries for old
+generations are never read again and simply expire.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict
+from typing import List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .embedding_cache import normalize_text
+from .retrieval import SearchFilters, SearchHit
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "kb:res:"
+GENERATION_PREFIX = "kb:gen:"
+
+
+class ResultCache:
+    def __init__(self, ttl: int = 600, alias: str = "default"):
+        self.ttl = ttl
+        self.alias = alias
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and bool(self.alias)
+
+    def generation(self, org_id) -> int:
+        cache = caches[self.alias]
+        key = f"{GENERATION_PREFIX}{org_id}"
+        value = cache.get(key)
+        if value is None:
+            # a clock-based start, so a counter lost to eviction can't come back at an old value
+            cache.add(key, time.time_ns(), timeout=None)
+            value = cache.get(key)
+        return value
+
+    def bump(self, org_id):
+        cache = caches[self.alias]
+        key = f"{GENERATION_PREFIX}{org_id}"
+        try:
+            cache.incr(key)
+        except ValueError:  # no counter yet: a fresh one is already newer than any cached entry
+            cache.add(key, time.time_ns(), timeout=None)
+
+    def key(self, org_id, generation, query: str, **params) -> str:
+        filters = params.pop("filters", None) or SearchFilters()
+        filter_values = asdict(filters)
+        if filter_values["document_ids"]:
+            filter_values["document_ids"] = sorted(str(d) for d in filter_values["document_ids"])
+        payload = json.dumps(
+            {"query": normalize_text(query), "filters": filter_values, **params}, sort_keys=True, default=str
+        )
+        return f"{KEY_PREFIX}{org_id}:{generation}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def lookup(self, org_id, query: str, **params) -> Tuple[Optional[str], Optional[Tuple[List[SearchHit], str]]]:
+        """
+        Returns (key, cached) where cached is (hits, mode) or None on a miss.
+        key is None when the cache is disabled or unavailable; pass it to store().
+        """
+        if not self.enabled:
+            return None, None
+        try:
+            key = self.key(org_id, self.generation(org_id), query, **params)
+            cached = caches[self.alias].get(key)
+        except Exception as e:  # Redis being down must not break search
+            logger.warning(f"Search result cache unavailable: {e}")
+            return None, None
+        if cached is None:
+            return key, None
+        rows, mode = cached
+        return key, ([SearchHit(**row) for row in rows], mode)
+
+    def store(self, key: Optional[str], hits: List[SearchHit], mode: str):
+        if key is None:
+            return
+        try:
+            caches[self.alias].set(key, ([hit.as_dict() for hit in hits], mode), timeout=self.ttl)
+        except Exception as e:
+            logger.warning(f"Search result cache unavailable: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(
+                    ttl=getattr(settings, "KB_RESULT_CACHE_TTL", 600),
+                    alias=getattr(settings, "KB_RESULT_CACHE_ALIAS", "default"),
+                )
+    return _cache
+
+
+def bump_kb_generation(org_id):
+    """Invalidate an organization's cached results, once the current transaction commits."""
+    def bump():
+        try:
+            get_result_cache().bump(org_id)
+        except Exception as e:
+            logger.warning(f"Could not invalidate cached search results for organization {org_id}: {e}")
+
+    if org_id is not None:
+        transaction.on_commit(bump)
@@ -0,0 +1,336 @@
+"""
+Top-k cosine retrieval over DocumentChunk embeddings, shared by the search
+API, KB chat and document generation.
+
+    hits = search(org, query_vec, top_k=6, filters=SearchFilters(document_ids=[...]))
+
+Filters are pushed into SQL, snippets are truncated in SQL, and only the
+columns callers use are read. The query plan is chosen per call: the ANN
+index for large candidate sets, an exact scan (which never misses a row)
+when filters or a small tenant make the candidate set small.
+
+hybrid_search() adds a Postgres full-text path (the search_vector column,
+migration 0007) and merges both result lists by reciprocal-rank fusion, so
+exact terms such as grant codes or "MTP IV" are found even when the
+embedding misses them. Queries that look like an exact-term lookup and
+match lexically are answered without an embedding call.
+"""
+import hashlib
+import logging
+import re
+from contextlib import nullcontext
+from dataclasses import dataclass, asdict, replace
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple
+from uuid import UUID
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils.dateparse import parse_datetime
+from .embedding_cache import LRUCache
+from .embedding_storage import column_type, reduce
+from .models import DocumentChunk, KnowledgeDocument
+from .openai_client import aembed_query, embed_query
+from .partitions import partition_name
+from .vector_index import apply_search_settings, is_postgres
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNIPPET_CHARS = 600
+TEXT_SEARCH_CONFIG = "english"  # the config search_vector is generated with (migration 0007)
+RRF_K = 60  # reciprocal-rank fusion constant: 1 / (RRF_K + rank)
+HYBRID_CANDIDATES = 4  # each path contributes top_k * HYBRID_CANDIDATES candidates to the fusion
+SEARCH_MODES = ("auto", "hybrid", "vector", "lexical")
+
+# reltuples only moves on ANALYZE / autovacuum, so a short-lived per-process copy saves a query per search
+_chunk_counts = LRUCache(max_entries=4096, ttl=getattr(settings, "KB_CHUNK_COUNT_CACHE_TTL", 300))
+_UNKNOWN = -1
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    document_ids: Optional[Sequence] = None
+    mime_types: Optional[Sequence[str]] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+    def is_selective(self) -> bool:
+        # restricting to explicit documents bounds the candidate set to a few hundred chunks
+        return bool(self.document_ids)
+
+    @classmethod
+    def from_data(cls, data) -> "SearchFilters":
+        """Filters from a search request body; raises ValueError on a malformed date."""
+        dates = {}
+        for key in ("created_after", "created_before"):
+            if data.get(key):
+                dates[key] = parse_datetime(data[key])
+                if dates[key] is None:
+                    raise ValueError(f"{key} must be an ISO 8601 datetime")
+        return cls(
+            document_ids=data.get("document_ids") or None,
+            mime_types=data.get("mime_types") or None,
+            **dates,
+        )
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    chunk_id: UUID
+    document_id: UUID
+    document_title: str
+    chunk_index: int
+    snippet: str
+    score: Optional[float]  # cosine distance, lower is better; None if only the lexical search found it
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    lexical_rank: Optional[float] = None  # ts_rank_cd, higher is better
+    fused_score: Optional[float] = None  # reciprocal-rank fusion score, higher is better
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _filter_sql(org_id, filters: SearchFilters = None) -> Tuple[List[str], list]:
+    filters = filters or SearchFilters()
+    # dc.organization_id first: it is the partition key
+    where = ["dc.organization_id = %s", "kd.is_active = true"]
+    where_params = [org_id]
+    if filters.document_ids:
+        where.append("dc.document_id = ANY(%s::uuid[])")
+        where_params.append([str(d) for d in filters.document_ids])
+    if filters.mime_types:
+        where.append("kd.mime_type = ANY(%s)")
+        where_params.append(list(filters.mime_types))
+    if filters.created_after:
+        where.append("kd.created_at >= %s")
+        where_params.append(filters.created_after)
+    if filters.created_before:
+        where.append("kd.created_at < %s")
+        where_params.append(filters.created_before)
+    return where, where_params
+
+
+def build_search_sql(org_id, query_vec, top_k: int, filters: SearchFilters = None,
+                     snippet_chars: Optional[int] = DEFAULT_SNIPPET_CHARS, exact: bool = False) -> Tuple[str, list]:
+    """
+    Returns (sql, params) for a top-k query. exact=True ranks the filtered
+    candidates in a materialized CTE, which the ANN index cannot serve.
+    snippet_chars=None returns the full chunk text.
+    """
+    text_col = "LEFT(dc.text, %s)" if snippet_chars else "dc.text"
+    select_params = [snippet_chars] if snippet_chars else []
+    select_params.append(str(reduce(query_vec)))  # in the stored form (see embedding_storage)
+    where, where_params = _filter_sql(org_id, filters)
+
+    body = f"""
+        SELECT dc.id, dc.document_id, kd.title, dc.chunk_index, {text_col},
+               dc.page_start, dc.page_end, dc.embedding <=> %s::{column_type()} AS score
+        FROM {DocumentChunk._meta.db_table} dc
+        JOIN {KnowledgeDocument._meta.db_table} kd ON kd.id = dc.document_id
+        WHERE {' AND '.join(where)}
+    """
+    if exact:
+        sql = f"WITH candidates AS MATERIALIZED ({body}) SELECT * FROM candidates ORDER BY score ASC LIMIT %s"
+    else:
+        sql = f"{body} ORDER BY score ASC LIMIT %s"
+    return sql, select_params + where_params + [top_k]
+
+
+def build_lexical_sql(org_id, query: str, top_k: int, filters: SearchFilters = None,
+                      snippet_chars: Optional[int] = DEFAULT_SNIPPET_CHARS) -> Tuple[str, list]:
+    """
+    Returns (sql, params) for the top-k chunks matching query as a web-search
+    style full-text query (every term, "quoted phrases", -exclusions), best
+    first. Served by the GIN index on search_vector.
+    """
+    text_col = "LEFT(dc.text, %s)" if snippet_chars else "dc.text"
+    select_params = [snippet_chars] if snippet_chars else []
+    where, where_params = _filter_sql(org_id, filters)
+    where.append("dc.search_vector @@ q.query")
+
+    sql = f"""
+        SELECT dc.id, dc.document_id, kd.title, dc.chunk_index, {text_col},
+               dc.page_start, dc.page_end, ts_rank_cd(dc.search_vector, q.query) AS rank
+        FROM {DocumentChunk._meta.db_table} dc
+        JOIN {KnowledgeDocument._meta.db_table} kd ON kd.id = dc.document_id
+        CROSS JOIN websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', %s) AS q(query)
+        WHERE {' AND '.join(where)}
+        ORDER BY rank DESC LIMIT %s
+    """
+    return sql, select_params + [query] + where_params + [top_k]
+
+
+def kb_fingerprint(org) -> str:
+    """
+    Digest of what search() can return for an organization: it changes when an
+    active document is added, re-processed or deactivated.
+    """
+    org_id = getattr(org, "pk", org)
+    state = KnowledgeDocument.objects.filter(organization_id=org_id, is_active=True).aggregate(
+        n=Count("id"), created=Max("created_at"), processed=Max("processed_at")
+    )
+    return hashlib.sha256(f"{org_id}|{state['n']}|{state['created']}|{state['processed']}".encode()).hexdigest()
+
+
+def estimated_chunk_count(org_id) -> Optional[int]:
+    """
+    Planner estimate of the organization's chunk count (its partition's reltuples), if known.
+    Cached per process for KB_CHUNK_COUNT_CACHE_TTL seconds.
+    """
+    if not is_postgres(connection):
+        return None
+    estimate = _chunk_counts.get(org_id)
+    if estimate is None:
+        with connection.cursor() as cur:
+            cur.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [partition_name(org_id)])
+            row = cur.fetchone()
+        # -1 means never analyzed
+        estimate = int(row[0]) if row and row[0] >= 0 else _UNKNOWN
+        _chunk_counts.set(org_id, estimate)
+    return None if estimate == _UNKNOWN else estimate
+
+
+def use_exact_plan(org_id, filters: SearchFilters) -> bool:
+    if filters.is_selective():
+        return True
+    estimate = estimated_chunk_count(org_id)
+    return estimate is not None and estimate <= getattr(settings, "KB_EXACT_SEARCH_MAX_ROWS", 20000)
+
+
+def search(org, query_vec, top_k: int = 6, filters: SearchFilters = None,
+           snippet_chars: Optional[int] = DEFAULT_SNIPPET_CHARS, exact: bool = None) -> List[SearchHit]:
+    """
+    Top-k chunks of an organization's active documents nearest to query_vec.
+    org may be an Organization or its id; exact=None lets the engine choose the plan.
+    """
+    org_id = getattr(org, "pk", org)
+    if org_id is None:
+        return []
+    filters = filters or SearchFilters()
+    if exact is None:
+        exact = use_exact_plan(org_id, filters)
+
+    sql, params = build_search_sql(org_id, query_vec, top_k, filters, snippet_chars, exact)
+    with transaction.atomic(), connection.cursor() as cur:
+        if not exact:
+            apply_search_settings(cur, top_k=top_k)
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+
+    return [
+        SearchHit(
+            chunk_id=r[0], document_id=r[1], document_title=r[2], chunk_index=r[3],
+            snippet=r[4], page_start=r[5], page_end=r[6], score=float(r[7]) if r[7] is not None else None,
+        )
+        for r in rows
+    ]
+
+
+def lexical_search(org, query: str, top_k: int = 6, filters: SearchFilters = None,
+                   snippet_chars: Optional[int] = DEFAULT_SNIPPET_CHARS) -> List[SearchHit]:
+    """Top-k chunks of an organization's active documents matching query by full-text search."""
+    org_id = getattr(org, "pk", org)
+    if org_id is None or not query.strip():
+        return []
+    sql, params = build_lexical_sql(org_id, query, top_k, filters or SearchFilters(), snippet_chars)
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    return [
+        SearchHit(
+            chunk_id=r[0], document_id=r[1], document_title=r[2], chunk_index=r[3],
+            snippet=r[4], page_start=r[5], page_end=r[6], score=None, lexical_rank=float(r[7]),
+        )
+        for r in rows
+    ]
+
+
+def fuse_hits(vector_hits: List[SearchHit], lexical_hits: List[SearchHit], top_k: int,
+              k: int = RRF_K) -> List[SearchHit]:
+    """Reciprocal-rank fusion: each chunk scores the sum of 1 / (k + rank) over the lists it is in."""
+    fused = {}
+    for rank, hit in enumerate(vector_hits, 1):
+        fused[hit.chunk_id] = [hit, 1.0 / (k + rank)]
+    for rank, hit in enumerate(lexical_hits, 1):
+        entry = fused.get(hit.chunk_id)
+        if entry is None:
+            fused[hit.chunk_id] = [hit, 1.0 / (k + rank)]
+        else:
+            entry[0] = replace(entry[0], lexical_rank=hit.lexical_rank)
+            entry[1] += 1.0 / (k + rank)
+    ranked = sorted(fused.values(), key=lambda e: e[1], reverse=True)[:top_k]
+    return [replace(hit, fused_score=round(score, 6)) for hit, score in ranked]
+
+
+_EXACT_TERM = re.compile(r"^(?=.*\d)[\w./-]+$|^[A-Z]{2,}$")
+
+
+def is_exact_lookup(query: str) -> bool:
+    """Quoted phrases, or queries made only of codes and acronyms ("MTP IV", "KE-2024/17")."""
+    if re.search(r'"[^"]+"', query):
+        return True
+    terms = query.split()
+    return bool(terms) and all(_EXACT_TERM.match(t) for t in terms)
+
+
+def _candidate_count(mode: str, top_k: int) -> int:
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of {', '.join(SEARCH_MODES)}")
+    return top_k if mode in ("vector", "lexical") else top_k * HYBRID_CANDIDATES
+
+
+def _lexical_answers(mode: str, query: str, lexical_hits: List[SearchHit]) -> bool:
+    return mode == "lexical" or (mode == "auto" and bool(lexical_hits) and is_exact_lookup(query))
+
+
+def _stage(timer, name: str):
+    return timer.stage(name) if timer else nullcontext()
+
+
+def hybrid_search(org, query: str, top_k: int = 6, filters: SearchFilters = None, mode: str = "auto",
+                  snippet_chars: Optional[int] = DEFAULT_SNIPPET_CHARS,
+                  embed: Callable[[str], list] = None, timer=None) -> Tuple[List[SearchHit], str]:
+    """
+    Returns (hits, mode used). "vector" and "lexical" run one path, "hybrid"
+    fuses both, and "auto" is hybrid unless the query is an exact-term lookup
+    the lexical path answers, in which case nothing is embedded.
+    embed(query) -> vector defaults to the cached embed_query. A
+    query_log.StageTimer, if given, gets the "embed" and "sql" times.
+    """
+    candidates = _candidate_count(mode, top_k)
+    lexical = []
+    if mode != "vector":
+        with _stage(timer, "sql"):
+            lexical = lexical_search(org, query, candidates, filters, snippet_chars)
+        if _lexical_answers(mode, query, lexical):
+            return lexical[:top_k], "lexical"
+    with _stage(timer, "embed"):
+        query_vec = (embed or embed_query)(query)
+    with _stage(timer, "sql"):
+        vector = search(org, query_vec, top_k=candidates, filters=filters, snippet_chars=snippet_chars)
+    if mode == "vector":
+        return vector, "vector"
+    return fuse_hits(vector, lexical, top_k), "hybrid"
+
+
+async def ahybrid_search(org, query: str, top_k: int = 6, filters: SearchFilters = None, mode: str = "auto",
+                         snippet_chars: Optional[int] = DEFAULT_SNIPPET_CHARS,
+                         timer=None) -> Tuple[List[SearchHit], str]:
+    """hybrid_search for async views: the embedding call is awaited rather than holding a thread."""
+    candidates = _candidate_count(mode, top_k)
+    lexical = []
+    if mode != "vector":
+        with _stage(timer, "sql"):
+            lexical = await sync_to_async(lexical_search)(org, query, candidates, filters, snippet_chars)
+        if _lexical_answers(mode, query, lexical):
+            return lexical[:top_k], "lexical"
+    with _stage(timer, "embed"):
+        query_vec = await aembed_query(query)
+    with _stage(timer, "sql"):
+        vector = await sync_to_async(search)(org, query_vec, top_k=candidates, filters=filters,
+                                             snippet_chars=snippet_chars)
+    if mode == "vector":
+        return vector, "vector"
+    return fuse_hits(vector, lexical, top_k), "hybrid"
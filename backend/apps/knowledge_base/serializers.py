@@ -30,9 +30,14 @@ class ChunkSerializer(serializers.ModelSerializer):
 class SearchHitSerializer(serializers.Serializer):
     chunk_id = serializers.UUIDField()
     document_id = serializers.UUIDField()
+    document_title = serializers.CharField()
     snippet = serializers.CharField()
-    score = serializers.FloatField()
+    score = serializers.FloatField(allow_null=True)  # cosine distance; None for lexical-only hits
+    lexical_rank = serializers.FloatField(allow_null=True)
+    fused_score = serializers.FloatField(allow_null=True)
     chunk_index = serializers.IntegerField()
+    page_start = serializers.IntegerField(allow_null=True)
+    page_end = serializers.IntegerField(allow_null=True)
 
 
 class ChatMessageSerializer(serializers.ModelSerializer):
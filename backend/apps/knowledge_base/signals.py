@@ -1,10 +1,45 @@
-from django.db.models.signals import post_save
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from apps.accounts.models import Organization
 from .models import KnowledgeDocument
-from .tasks import ingest_document
+from .partitions import ensure_partition, drop_partition
+from .ingest_coordinator import enqueue_ingest
+from .query_log import flush_when_due
+from .result_cache import bump_kb_generation
 
 @receiver(post_save, sender=KnowledgeDocument)
 def trigger_ingest_on_upload(sender, instance, created, **kwargs):
-    # Only auto-ingest new uploads (if you prefer explicit action, remove this signal)
+    # Only auto-ingest new uploads; this is the one place uploads are enqueued
     if created and instance.status == "uploaded":
-        ingest_document.delay(str(instance.id))
+        transaction.on_commit(lambda: enqueue_ingest(instance.id))
+
+
+@receiver(post_save, sender=KnowledgeDocument)
+def invalidate_results_on_visibility_change(sender, instance, created, update_fields=None, **kwargs):
+    # a full save may have flipped is_active; saves of other fields (ingest progress) can't change results
+    if not created and (update_fields is None or "is_active" in update_fields):
+        bump_kb_generation(instance.organization_id)
+
+
+@receiver(post_delete, sender=KnowledgeDocument)
+def invalidate_results_on_delete(sender, instance, **kwargs):
+    bump_kb_generation(instance.organization_id)
+
+
+@receiver(post_save, sender=Organization)
+def create_chunk_partition(sender, instance, created, **kwargs):
+    if created:
+        ensure_partition(instance.id)
+
+
+@receiver(post_delete, sender=Organization)
+def drop_chunk_partition(sender, instance, **kwargs):
+    drop_partition(instance.id)
+
+
+@receiver(request_finished)
+def flush_query_log(sender, **kwargs):
+    # runs once the response has been sent, so buffered log writes never delay one
+    flush_when_due()
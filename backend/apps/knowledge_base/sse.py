@@ -0,0 +1,29 @@
+"""
+Server-sent events helpers for streaming responses.
+
+Streams are async iterators so that under ASGI (core/asgi.py) every event
+is flushed to the client as it is produced; a WSGI server buffers them.
+"""
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+def sse_event(event: str, data) -> str:
+    payload = json.dumps(data, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets a view accept "Accept: text/event-stream". Streaming views return a
+    StreamingHttpResponse themselves; this only renders their error responses,
+    as a single "error" event.
+    """
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return sse_event("error", data).encode(self.charset)
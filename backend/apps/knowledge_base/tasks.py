@@ -1,24 +1,24 @@
-import os
 import logging
+from contextlib import ExitStack
 from celery import shared_task
-from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from .models import KnowledgeDocument, DocumentChunk
-from .extractors import extract_text_from_pdf, extract_text_from_docx, extract_text_from_doc, extract_text_from_txt, extract_text_from_excel
-from .chunker import chunk_text, count_tokens
-from .openai_client import embed_texts
+from .models import KnowledgeDocument
+from .embedding_store import prune_unreferenced
+from .ingest import ingest_batch
+from .ingest_coordinator import ingest_lock
 
 logger = logging.getLogger(__name__)
 
+
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
-def ingest_document(self, document_id):
+def ingest_document(self, document_id, force=False):
     """
     Ingest a document by:
     1. Extracting text based on file type
     2. Chunking the text
     3. Generating embeddings
     4. Storing chunks in the database
+    force re-ingests a document that is already ready (a rerun, see ingest_coordinator).
     """
     try:
         doc = KnowledgeDocument.objects.get(id=document_id)
@@ -26,107 +26,45 @@ def ingest_document(self, document_id):
         logger.error(f"Document {document_id} not found")
         return
 
-    # Check if document is already processed
-    if doc.status == "ready":
-        logger.info(f"Document {document_id} already processed, skipping")
-        return
-
-    # Set status to processing
-    if doc.status != "processing":
-        doc.status = "processing"
-        doc.save(update_fields=["status"])
-
-    # Validate file path
-    file_path = doc.file.path
-    if not os.path.exists(file_path):
-        error_msg = f"File not found: {file_path}"
-        logger.error(error_msg)
-        doc.status = "failed"
-        doc.error_message = error_msg
-        doc.save(update_fields=["status", "error_message"])
-        return
-
-    ext = os.path.splitext(file_path)[1].lower()
-    supported_extensions = {".pdf", ".docx", ".doc", ".txt", ".md", ".rtf", ".xls", ".xlsx", ".csv"}
-    if ext not in supported_extensions:
-        error_msg = f"Unsupported file extension: {ext}"
-        logger.error(error_msg)
-        doc.status = "failed"
-        doc.error_message = error_msg
-        doc.save(update_fields=["status", "error_message"])
+    with ingest_lock(document_id) as acquired:
+        if not acquired:
+            return
+        # Check if document is already processed (re-read: a run that just finished may have done it)
+        doc.refresh_from_db(fields=["status"])
+        if doc.status == "ready" and not force:
+            logger.info(f"Document {document_id} already processed, skipping")
+            return
+
+        runs, embed_stats = ingest_batch([doc])
+    run = runs[str(doc.id)]
+    if doc.status != "ready":
         return
+    return {"document_id": str(document_id), "chunks": run.chunks, "unchanged": run.unchanged,
+            "embeddings": embed_stats.as_dict()}
 
-    try:
-        # Extract text based on file extension
-        if ext in [".pdf"]:
-            text, pages = extract_text_from_pdf(file_path)
-            logger.info(f"Extracted {pages} pages from PDF: {file_path}")
-        elif ext in [".docx"]:
-            text, pages = extract_text_from_docx(file_path)
-            logger.info(f"Extracted text from DOCX: {file_path}")
-        elif ext in [".doc"]:
-            text, pages = extract_text_from_doc(file_path)
-            logger.info(f"Extracted text from DOC: {file_path}")
-        elif ext in [".txt", ".md", ".rtf"]:
-            text, pages = extract_text_from_txt(file_path)
-            logger.info(f"Extracted text from TXT/MD/RTF: {file_path}")
-        elif ext in [".xls", ".xlsx", ".csv"]:
-            text, pages = extract_text_from_excel(file_path)
-            logger.info(f"Extracted {pages} rows from Excel/CSV: {file_path}")
-
-        doc.pages = pages
-        doc.save(update_fields=["pages"])
-
-        # Chunk the text
-        chunk_tokens = getattr(settings, "KB_CHUNK_TOKENS", 900)
-        overlap = getattr(settings, "KB_CHUNK_OVERLAP", 150)
-        chunks = chunk_text(text, chunk_size=chunk_tokens, overlap=overlap)
-
-        if not chunks:
-            error_msg = "No text content could be extracted from the document"
-            raise ValueError(error_msg)
-
-        # Embed chunks in batches
-        batch_size = getattr(settings, "KB_EMBEDDING_BATCH_SIZE", 64)
-        embeddings = embed_texts(chunks, batch_size=batch_size)
-
-        # Prepare DocumentChunk objects
-        objs = []
-        for idx, (chunk_text_, emb) in enumerate(zip(chunks, embeddings)):
-            tok_count = count_tokens(chunk_text_)
-            objs.append(DocumentChunk(
-                document=doc,
-                chunk_index=idx,
-                text=chunk_text_,
-                embedding=emb,
-                tokens=tok_count
-            ))
 
-        # Use atomic transaction to ensure consistency
-        with transaction.atomic():
-            # Delete existing chunks for reprocessing
-            existing_chunks = DocumentChunk.objects.filter(document=doc)
-            if existing_chunks.exists():
-                logger.info(f"Deleting {existing_chunks.count()} existing chunks for document {document_id}")
-                existing_chunks.delete()
-
-            # Create new chunks
-            DocumentChunk.objects.bulk_create(objs, batch_size=200)
-
-            # Update document status
-            doc.status = "ready"
-            doc.processed_at = timezone.now()
-            doc.error_message = ""
-            doc.save(update_fields=["status", "processed_at", "error_message"])
-
-        logger.info(f"Successfully processed document {document_id} with {len(objs)} chunks")
-
-    except Exception as e:
-        logger.exception(f"Failed to ingest document {document_id}: {str(e)}")
-        doc.status = "failed"
-        doc.error_message = str(e)
-        doc.save(update_fields=["status", "error_message"])
-        raise
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
+def ingest_documents(self, document_ids):
+    """
+    Ingest several documents in one job (bulk uploads): their chunks share
+    embedding requests and inserts. Documents already ready (e.g. on a retry)
+    are skipped.
+    """
+    with ExitStack() as locks:
+        locked = [doc_id for doc_id in document_ids if locks.enter_context(ingest_lock(doc_id))]
+        docs = list(KnowledgeDocument.objects.filter(id__in=locked).exclude(status="ready"))
+        skipped = len(document_ids) - len(docs)
+        if skipped:
+            logger.info(f"{skipped} of {len(document_ids)} documents not found, already processed "
+                        f"or being ingested elsewhere; skipping them")
+        if not docs:
+            return
+        runs, embed_stats = ingest_batch(docs)
+    return {
+        "documents": {doc_id: {"status": run.doc.status, "chunks": run.chunks, "unchanged": run.unchanged}
+                      for doc_id, run in runs.items()},
+        "embeddings": embed_stats.as_dict(),
+    }
 
 @shared_task
 def cleanup_failed_documents():
@@ -149,4 +87,15 @@ def cleanup_failed_documents():
         )
         logger.info(f"Reset {count} stuck documents to failed status")
     
-    return count
\ No newline at end of file
+    return count
+
+
+@shared_task
+def prune_chunk_embeddings():
+    """
+    Periodic task deleting stored chunk embeddings that no chunk refers to any more.
+    """
+    count = prune_unreferenced()
+    if count:
+        logger.info(f"Pruned {count} unreferenced chunk embeddings")
+    return count
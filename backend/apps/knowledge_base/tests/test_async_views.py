@@ -0,0 +1,174 @@
+import asyncio
+import time
+from asgiref.sync import sync_to_async
+from unittest.mock import AsyncMock, patch
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from apps.accounts.models import Organization
+from apps.knowledge_base import async_views, query_log, retrieval
+from apps.knowledge_base.models import ChatMessage, ChatSession, SearchQueryLog
+from apps.knowledge_base.retrieval import SearchHit
+
+User = get_user_model()
+
+HITS = [SearchHit(chunk_id="c1", document_id="d1", document_title="Annual report", chunk_index=0,
+                  snippet="Boreholes serve 4,000 households.", score=0.2)]
+
+
+@patch.object(async_views, "aembed_query", AsyncMock(return_value=[0.0]))
+@patch.object(async_views, "search", return_value=HITS)
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create_superuser(email="owner@example.com", password="pass")
+        self.org = Organization.objects.create(name="AsyncOrg", created_by=owner)
+        self.user = User.objects.create_user(email="member@async.org", password="pass", organization=self.org)
+        self.session = ChatSession.objects.create(user=self.user, organization=self.org, title="Water")
+        self.headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+        self.query_log = query_log.QueryLogBuffer()
+        patcher = patch.object(query_log, "get_query_log", return_value=self.query_log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def post(self, url, data, headers=None):
+        return await self.async_client.post(url, data, content_type="application/json",
+                                            headers=self.headers if headers is None else headers)
+
+    @patch.object(retrieval, "aembed_query", AsyncMock(return_value=[0.0]))
+    @patch.object(retrieval, "lexical_search", return_value=[])
+    async def test_search(self, mock_lexical, mock_search):
+        with patch.object(retrieval, "search", return_value=HITS) as vector_search:
+            response = await self.post(reverse("kb-search"), {"query": "households", "top_k": 3})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["mode"], "hybrid")
+        self.assertEqual(body["results"][0]["chunk_id"], "c1")
+        self.assertIsNotNone(body["results"][0]["fused_score"])
+        self.assertEqual(vector_search.call_args.args[0], self.org.id)
+        self.assertEqual(vector_search.call_args.kwargs["top_k"], 12)  # fusion candidates for top_k=3
+
+        await sync_to_async(self.query_log.flush)()
+        log = await SearchQueryLog.objects.aget()
+        self.assertEqual((log.source, log.query_text, log.top_k, log.mode, log.result_count),
+                         ("search", "households", 3, "hybrid", 1))
+        for stage in (log.embed_ms, log.sql_ms, log.serialize_ms, log.latency_ms):
+            self.assertIsNotNone(stage)
+        self.assertIsNone(log.llm_ms)
+
+    async def test_lexical_search_mode(self, mock_search):
+        lexical_hit = SearchHit(chunk_id="c2", document_id="d1", document_title="Annual report", chunk_index=1,
+                                snippet="MTP IV flagship projects", score=None, lexical_rank=0.5)
+        with patch.object(retrieval, "lexical_search", return_value=[lexical_hit]) as lexical, \
+                patch.object(retrieval, "aembed_query", AsyncMock()) as embed:
+            response = await self.post(reverse("kb-search"), {"query": "MTP IV", "mode": "lexical"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["mode"], "lexical")
+        self.assertEqual(response.json()["results"][0]["score"], None)
+        self.assertEqual(lexical.call_args.args[:3], (self.org.id, "MTP IV", 6))
+        embed.assert_not_called()
+
+    async def test_search_rejects_bad_requests(self, mock_search):
+        self.assertEqual((await self.post(reverse("kb-search"), {"query": "x"}, headers={})).status_code, 401)
+        response = await self.post(reverse("kb-search"), {"query": "x", "created_after": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "created_after must be an ISO 8601 datetime"})
+        response = await self.post(reverse("kb-search"), {"query": "x", "mode": "fuzzy"})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_post_message(self, mock_search):
+        url = reverse("chat-sessions-post-message", args=[self.session.id])
+        with patch.object(async_views, "achat_with_context", AsyncMock(return_value="About 4,000 [1].")):
+            response = await self.post(url, {"question": "How many households?"})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["answer"], "About 4,000 [1].")
+        self.assertEqual(body["citations"][0]["source"], "d1")
+        message = await ChatMessage.objects.aget(id=body["assistant_message_id"])
+        self.assertEqual(message.content, "About 4,000 [1].")
+        self.assertEqual(len(self.query_log._pending), 1)
+        self.assertEqual(self.query_log._pending[0].source, "chat")
+        self.assertIsNotNone(self.query_log._pending[0].llm_ms)
+
+    async def test_other_users_session_is_not_found(self, mock_search):
+        other = await User.objects.acreate(email="other@async.org", organization=self.org)
+        session = await ChatSession.objects.acreate(user=other, organization=self.org)
+        response = await self.post(reverse("chat-sessions-post-message", args=[session.id]), {"question": "hi"})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_chat_requests_wait_concurrently(self, mock_search):
+        async def slow_answer(*args, **kwargs):
+            await asyncio.sleep(0.2)
+            return "answer"
+
+        url = reverse("chat-sessions-post-message", args=[self.session.id])
+        started = time.perf_counter()
+        with patch.object(async_views, "achat_with_context", slow_answer):
+            responses = await asyncio.gather(*[self.post(url, {"question": f"q{i}"}) for i in range(20)])
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual({r.status_code for r in responses}, {200})
+        self.assertLess(elapsed, 2.0)  # 20 x 0.2s if each request held a thread
+        self.assertEqual(await ChatMessage.objects.filter(session=self.session).acount(), 40)
+
+
+class AsyncAccessMatchesViewSetTest(TestCase):
+    """The async endpoints answer unauthorized requests exactly like ChatSessionViewSet's actions."""
+
+    def setUp(self):
+        owner = User.objects.create_superuser(email="owner@example.com", password="pass")
+        self.org = Organization.objects.create(name="ParityOrg", created_by=owner)
+        self.other_org = Organization.objects.create(name="OtherOrg", created_by=owner)
+        self.user = User.objects.create_user(email="member@parity.org", password="pass", organization=self.org)
+        self.session = ChatSession.objects.create(user=self.user, organization=self.org, title="Water")
+
+    def responses(self, user=None, session=None, headers=None):
+        """(sync, async) responses to the same question about a session."""
+        if headers is None and user is not None:
+            headers = {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+        session = session or self.session
+        return [
+            self.client.post(url, {"question": "hi"}, content_type="application/json", headers=headers or {})
+            for url in (reverse("chat-sessions-stream-message", args=[session.id]),
+                        reverse("chat-sessions-post-message", args=[session.id]))
+        ]
+
+    def assertSameResponse(self, responses, status):
+        sync, async_ = responses
+        self.assertEqual((sync.status_code, async_.status_code), (status, status))
+        self.assertEqual(sync.json(), async_.json())
+        self.assertEqual(sync.get("WWW-Authenticate"), async_.get("WWW-Authenticate"))
+
+    def test_anonymous_and_bad_token(self):
+        self.assertSameResponse(self.responses(), 401)
+        self.assertSameResponse(self.responses(headers={"Authorization": "Bearer nonsense"}), 401)
+
+    def test_inactive_user(self):
+        token = {"Authorization": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+        self.user.is_active = False
+        self.user.save(update_fields=["is_active"])
+        self.assertSameResponse(self.responses(headers=token), 401)
+
+    def test_user_without_organization(self):
+        loner = User.objects.create_user(email="loner@parity.org", password="pass")
+        self.assertSameResponse(self.responses(user=loner), 403)
+
+    def test_other_organizations_session(self):
+        outsider = User.objects.create_user(email="member@other.org", password="pass", organization=self.other_org)
+        self.assertSameResponse(self.responses(user=outsider), 404)
+
+        # the user's own session, kept from before they moved organization
+        self.user.organization = self.other_org
+        self.user.save(update_fields=["organization"])
+        self.assertSameResponse(self.responses(user=self.user), 403)
+
+    def test_search_rejects_like_the_viewsets(self):
+        loner = User.objects.create_user(email="loner@parity.org", password="pass")
+        headers = {"Authorization": f"Bearer {RefreshToken.for_user(loner).access_token}"}
+        sessions = self.client.post(reverse("chat-sessions-list"), {}, content_type="application/json", headers=headers)
+        search = self.client.post(reverse("kb-search"), {"query": "x"}, content_type="application/json", headers=headers)
+        self.assertEqual((search.status_code, search.json()), (sessions.status_code, sessions.json()))
+
@@ -0,0 +1,92 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from apps.accounts.models import Organization
+from apps.knowledge_base import signals, views
+from apps.knowledge_base.models import KnowledgeDocument
+
+User = get_user_model()
+
+
+def zip_upload(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    return SimpleUploadedFile("docs.zip", buf.getvalue(), content_type="application/zip")
+
+
+@patch.object(signals, "enqueue_ingest")
+@patch.object(views, "ingest_documents")
+class BulkUploadTest(APITestCase):
+    def setUp(self):
+        self.media = media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        owner = User.objects.create_superuser(email="owner@example.com", password="pass")
+        self.org = Organization.objects.create(name="BulkOrg", created_by=owner)
+        self.user = User.objects.create_user(email="member@bulk.org", password="pass", organization=self.org)
+        self.client.force_authenticate(self.user)
+        self.url = reverse("documents-bulk")
+
+    def test_files_and_archive_register_in_one_job(self, mock_batch, mock_single):
+        files = [SimpleUploadedFile(f"report{i}.txt", b"water access", content_type="text/plain") for i in range(3)]
+        archive = zip_upload({"plans/strategy.md": "# Strategy", "tool.exe": "MZ", "__MACOSX/._strategy.md": "x"})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {"files": files, "archive": archive}, format="multipart")
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["skipped"], [{"name": "tool.exe", "reason": "unsupported file type"}])
+        docs = KnowledgeDocument.objects.filter(organization=self.org)
+        self.assertEqual(sorted(d.file_name for d in docs),
+                         ["report0.txt", "report1.txt", "report2.txt", "strategy.md"])
+        self.assertTrue(all(d.uploaded_by == self.user and d.status == "uploaded" for d in docs))
+        mock_batch.delay.assert_called_once()
+        self.assertEqual(sorted(mock_batch.delay.call_args.args[0]), sorted(str(d.id) for d in docs))
+        mock_single.assert_not_called()
+
+    def test_jobs_are_split_by_size(self, mock_batch, mock_single):
+        files = [SimpleUploadedFile(f"r{i}.txt", b"text") for i in range(5)]
+        with self.settings(KB_BULK_INGEST_DOCUMENTS=2), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {"files": files}, format="multipart")
+        self.assertEqual(response.data["ingestion_jobs"], 3)
+        self.assertEqual([len(c.args[0]) for c in mock_batch.delay.call_args_list], [2, 2, 1])
+
+    def test_rejects_unusable_uploads(self, mock_batch, mock_single):
+        bad_zip = SimpleUploadedFile("docs.zip", b"not a zip")
+        self.assertEqual(self.client.post(self.url, {"archive": bad_zip}, format="multipart").status_code, 400)
+        only_exe = SimpleUploadedFile("tool.exe", b"MZ")
+        self.assertEqual(self.client.post(self.url, {"files": [only_exe]}, format="multipart").status_code, 400)
+        with self.settings(KB_BULK_UPLOAD_MAX_BYTES=10):
+            big = zip_upload({"big.txt": "x" * 100})
+            self.assertEqual(self.client.post(self.url, {"archive": big}, format="multipart").status_code, 400)
+        self.assertFalse(KnowledgeDocument.objects.exists())
+        mock_batch.delay.assert_not_called()
+
+    def test_archive_members_are_streamed_to_storage(self, mock_batch, mock_single):
+        archive = zip_upload({"a.txt": "alpha", "b.md": "beta"})
+        with patch.object(zipfile.ZipFile, "read", side_effect=AssertionError("member read into memory")):
+            response = self.client.post(self.url, {"archive": archive}, format="multipart")
+        self.assertEqual(response.status_code, 202)
+        contents = sorted(d.file.read() for d in KnowledgeDocument.objects.all())
+        self.assertEqual(contents, [b"alpha", b"beta"])
+        self.assertEqual(sorted(d.size_bytes for d in KnowledgeDocument.objects.all()), [4, 5])
+
+    def test_failed_insert_leaves_no_stored_files(self, mock_batch, mock_single):
+        files = [SimpleUploadedFile(f"r{i}.txt", b"text") for i in range(3)]
+        with patch.object(KnowledgeDocument.objects, "bulk_create", side_effect=DatabaseError("down")):
+            with self.assertRaises(DatabaseError):
+                self.client.post(self.url, {"files": files}, format="multipart")
+        stored = [f for _, _, names in os.walk(self.media) for f in names]
+        self.assertEqual(stored, [])
+        mock_batch.delay.assert_not_called()
@@ -0,0 +1,85 @@
+import json
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from apps.accounts.models import Organization
+from apps.knowledge_base import query_log, views
+from apps.knowledge_base.models import ChatMessage, ChatSession
+from apps.knowledge_base.retrieval import SearchHit
+
+User = get_user_model()
+
+
+def parse_events(body):
+    events = []
+    for block in body.decode().strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@patch.object(views, "embed_query", return_value=[0.0])
+@patch.object(views, "search", return_value=[
+    SearchHit(chunk_id="c1", document_id="d1", document_title="Annual report", chunk_index=0,
+              snippet="Boreholes serve 4,000 households.", score=0.2),
+])
+class ChatStreamTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create_superuser(email="owner@example.com", password="pass")
+        org = Organization.objects.create(name="ChatOrg", created_by=owner)
+        self.user = User.objects.create_user(email="member@chat.org", password="pass", organization=org)
+        self.session = ChatSession.objects.create(user=self.user, organization=org, title="Water")
+        self.url = reverse("chat-sessions-stream-message", args=[self.session.id])
+        self.headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user).access_token}",
+                        "Accept": "text/event-stream"}
+        self.query_log = query_log.QueryLogBuffer()
+        patcher = patch.object(query_log, "get_query_log", return_value=self.query_log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def post(self, data):
+        response = await self.async_client.post(self.url, data, content_type="application/json", headers=self.headers)
+        body = b""
+        if response.streaming:
+            async for part in response.streaming_content:
+                body += part.encode() if isinstance(part, str) else part
+        else:
+            body = response.content
+        return response, body
+
+    async def test_answer_streams_and_is_stored_when_complete(self, mock_search, mock_embed):
+        async def fake_stream(system_prompt, question, context_chunks):
+            for piece in ["About ", "4,000 ", "households [1]."]:
+                yield piece
+
+        with patch.object(views, "stream_chat_with_context", fake_stream):
+            response, body = await self.post({"question": "How many households?"})
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = parse_events(body)
+        self.assertEqual([e for e, _ in events], ["citations", "token", "token", "token", "done"])
+        self.assertEqual(events[0][1][0]["source"], "d1")
+        message = await ChatMessage.objects.aget(id=events[-1][1]["assistant_message_id"])
+        self.assertEqual(message.content, "About 4,000 households [1].")
+        self.assertEqual(await ChatMessage.objects.filter(session=self.session).acount(), 2)
+        [log] = self.query_log._pending
+        self.assertEqual((log.source, log.result_count), ("chat_stream", 1))
+        self.assertIsNotNone(log.llm_ms)
+
+    async def test_failed_stream_stores_nothing(self, mock_search, mock_embed):
+        async def broken_stream(system_prompt, question, context_chunks):
+            yield "About "
+            raise RuntimeError("connection reset")
+
+        with patch.object(views, "stream_chat_with_context", broken_stream):
+            _, body = await self.post({"question": "How many households?"})
+
+        self.assertEqual(parse_events(body)[-1], ("error", {"detail": "Answer generation failed"}))
+        self.assertEqual(await ChatMessage.objects.filter(session=self.session).acount(), 0)
+
+    async def test_missing_question_is_an_error_event(self, mock_search, mock_embed):
+        response, body = await self.post({"question": " "})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(parse_events(body), [("error", {"detail": "question required"})])
@@ -0,0 +1,86 @@
+import struct
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from unittest import skipIf
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from apps.accounts.models import Organization
+from apps.knowledge_base.chunk_loader import COLUMNS, encode_copy_binary, load_chunks, use_copy
+from apps.knowledge_base.models import DocumentChunk, KnowledgeDocument
+
+
+def _read_fields(payload: bytes):
+    """Decode COPY BINARY rows into lists of raw field bytes (None for NULL)."""
+    assert payload.startswith(b"PGCOPY\n\xff\r\n\x00")
+    pos, rows = 19, []
+    while True:
+        (count,) = struct.unpack_from(">h", payload, pos)
+        pos += 2
+        if count == -1:
+            break
+        row = []
+        for _ in range(count):
+            (length,) = struct.unpack_from(">i", payload, pos)
+            pos += 4
+            if length == -1:
+                row.append(None)
+                continue
+            row.append(payload[pos:pos + length])
+            pos += length
+        rows.append(row)
+    assert pos == len(payload)
+    return rows
+
+
+class EncodeCopyBinaryTest(SimpleTestCase):
+    def test_encodes_each_column_in_postgres_binary_format(self):
+        chunk_id, doc_id, org_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        created = datetime(2000, 1, 2, 0, 0, 1, 5, tzinfo=dt_timezone.utc)
+        chunk = DocumentChunk(
+            id=chunk_id, document_id=doc_id, organization_id=org_id, chunk_index=3, text="grant ÄB-12",
+            embedding=[0.5, -1.0, 2.0], content_hash="ab" * 32, tokens=7, page_start=None, page_end=2,
+            created_at=created,
+        )
+
+        [row] = _read_fields(encode_copy_binary([chunk]))
+        fields = dict(zip(COLUMNS, row))
+
+        self.assertEqual(len(row), len(COLUMNS))
+        self.assertEqual(fields["id"], chunk_id.bytes)
+        self.assertEqual(fields["document_id"], doc_id.bytes)
+        self.assertEqual(fields["organization_id"], org_id.bytes)
+        self.assertEqual(struct.unpack(">i", fields["chunk_index"]), (3,))
+        self.assertEqual(fields["text"].decode("utf-8"), "grant ÄB-12")
+        self.assertEqual(struct.unpack(">hh3f", fields["embedding"]), (3, 0, 0.5, -1.0, 2.0))
+        self.assertEqual(fields["content_hash"], b"ab" * 32)
+        self.assertIsNone(fields["page_start"])
+        self.assertEqual(struct.unpack(">q", fields["created_at"]), ((86400 + 1) * 1_000_000 + 5,))
+
+    def test_fills_in_missing_id_and_empty_payload(self):
+        chunk = DocumentChunk(document_id=uuid.uuid4(), chunk_index=0, text="x", tokens=1)
+        chunk.id = None
+        [row] = _read_fields(encode_copy_binary([chunk]))
+        self.assertEqual(len(row[0]), 16)
+        self.assertIsNone(row[COLUMNS.index("embedding")])
+        self.assertEqual(_read_fields(encode_copy_binary([])), [])
+
+    def test_halfvec_embeddings_are_float16(self):
+        chunk = DocumentChunk(document_id=uuid.uuid4(), chunk_index=0, text="x", embedding=[0.5, -2.0])
+        [row] = _read_fields(encode_copy_binary([chunk], storage_type="halfvec"))
+        self.assertEqual(struct.unpack(">hh2e", row[COLUMNS.index("embedding")]), (2, 0, 0.5, -2.0))
+
+
+class LoadChunksFallbackTest(TestCase):
+    @skipIf(connection.vendor == "postgresql", "loads through COPY, into a vector(1536) column")
+    @override_settings(KB_EMBEDDING_DIMENSIONS=2)
+    def test_falls_back_to_bulk_create_off_postgres(self):
+        org = Organization.objects.create(name="Loader Org")
+        doc = KnowledgeDocument.objects.create(organization=org, title="t", file_name="t.txt", status="processing")
+        chunks = [DocumentChunk(document=doc, organization=org, chunk_index=i, text=f"c{i}", tokens=1,
+                                embedding=[i, 1.0, 2.0]) for i in range(5)]
+
+        self.assertFalse(use_copy())
+        self.assertEqual(load_chunks(chunks, batch_size=2), 5)
+        self.assertEqual(list(DocumentChunk.objects.filter(document=doc).order_by("chunk_index")
+                              .values_list("text", flat=True)), ["c0", "c1", "c2", "c3", "c4"])
+        self.assertEqual(DocumentChunk.objects.get(document=doc, chunk_index=3).embedding, [3.0, 1.0])  # stored form
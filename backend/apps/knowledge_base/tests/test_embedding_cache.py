@@ -0,0 +1,60 @@
+from unittest.mock import patch
+from django.test import SimpleTestCase, override_settings
+from apps.knowledge_base import openai_client
+from apps.knowledge_base.embedding_cache import EmbeddingCache, LRUCache, cache_key
+
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "emb-tests"}}
+
+
+class LRUCacheTest(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(max_entries=2, ttl=60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(len(lru), 2)
+
+    def test_expires_entries(self):
+        now = [0.0]
+        lru = LRUCache(max_entries=10, ttl=5, clock=lambda: now[0])
+        lru.set("a", 1)
+        now[0] = 4.0
+        self.assertEqual(lru.get("a"), 1)
+        now[0] = 6.0
+        self.assertIsNone(lru.get("a"))
+
+
+class CacheKeyTest(SimpleTestCase):
+    def test_whitespace_normalized_and_model_scoped(self):
+        self.assertEqual(cache_key("m", "  MTP   IV\nbudget "), cache_key("m", "MTP IV budget"))
+        self.assertNotEqual(cache_key("m1", "MTP IV"), cache_key("m2", "MTP IV"))
+
+
+@override_settings(CACHES=LOCMEM)
+class CachedEmbedTextsTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = EmbeddingCache(max_entries=10, ttl=60)
+        patcher = patch.object(openai_client, "get_embedding_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(openai_client, "embed_texts")
+    def test_only_misses_are_embedded(self, mock_embed):
+        mock_embed.side_effect = lambda texts, batch_size=64: [[float(len(t)), 0.5] for t in texts]
+        self.assertEqual(openai_client.embed_query("hello"), [5.0, 0.5])
+        vecs = openai_client.cached_embed_texts(["hello", "hi", "hi"])
+        self.assertEqual(vecs, [[5.0, 0.5], [2.0, 0.5], [2.0, 0.5]])
+        self.assertEqual(mock_embed.call_args_list[1].args[0], ["hi"])
+        self.assertEqual(self.cache.stats()["local_hits"], 1)
+
+    @patch.object(openai_client, "embed_texts")
+    def test_shared_tier_serves_other_processes(self, mock_embed):
+        mock_embed.return_value = [[0.25, 0.5]]
+        openai_client.embed_query("grant codes")
+        self.cache.local.clear()  # a fresh worker process
+        self.assertEqual(openai_client.embed_query("grant codes"), [0.25, 0.5])
+        self.assertEqual(mock_embed.call_count, 1)
+        self.assertEqual(self.cache.stats()["shared_hits"], 1)
@@ -0,0 +1,112 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import openai
+from django.test import SimpleTestCase
+from apps.knowledge_base.embedding_client import AdaptiveLimit, ConcurrentEmbedder, token_batches
+
+
+def word_count(text):
+    return len(text.split())
+
+
+class StubEmbeddingsHandler(BaseHTTPRequestHandler):
+    """Minimal /v1/embeddings: vector = [len(text), 0.0], data returned shuffled."""
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, body, headers=()):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server = self.server
+        inputs = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["input"]
+        with server.lock:
+            server.requests.append(len(inputs))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            throttle = server.throttle_remaining > 0
+            server.throttle_remaining -= throttle
+        try:
+            if throttle:
+                self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                               headers=[("Retry-After", "0.05")])
+                return
+            time.sleep(0.05)
+            data = [{"object": "embedding", "index": i, "embedding": [float(len(t)), 0.0]} for i, t in enumerate(inputs)]
+            random.shuffle(data)
+            self.send_json(200, {"object": "list", "data": data, "model": "stub",
+                                 "usage": {"prompt_tokens": 1, "total_tokens": 1}})
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+class ConcurrentEmbedderTest(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubEmbeddingsHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.server.throttle_remaining = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        client = openai.OpenAI(api_key="test", base_url=f"http://127.0.0.1:{self.server.server_port}/v1")
+        self.embedder = ConcurrentEmbedder(client, "stub", max_concurrency=4, max_batch_tokens=10,
+                                           backoff=0.01, token_counter=word_count)
+
+    def test_batches_concurrently_and_keeps_order(self):
+        texts = [" ".join(["w"] * (i % 5 + 1)) for i in range(40)]
+        vectors = self.embedder.embed(texts)
+        self.assertEqual([v[0] for v in vectors], [float(len(t)) for t in texts])
+        self.assertGreater(len(self.server.requests), 4)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 4)
+
+    def test_backs_off_on_429(self):
+        self.server.throttle_remaining = 3
+        texts = ["alpha beta"] * 30
+        vectors = self.embedder.embed(texts)
+        self.assertEqual(len(vectors), 30)
+        self.assertEqual(self.embedder.stats.throttled, 3)
+        self.assertEqual(self.embedder.stats.retried, 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.throttle_remaining = 100
+        self.embedder.max_retries = 2
+        with self.assertRaises(RuntimeError):
+            self.embedder.embed(["alpha"])
+
+
+class SchedulingTest(SimpleTestCase):
+    def test_token_batches(self):
+        texts = ["a b c", "d e", "f", "g h i j", "k"]
+        self.assertEqual(token_batches(texts, max_tokens=6, count=word_count), [[0, 1, 2], [3, 4]])
+        self.assertEqual(token_batches(texts, max_tokens=100, max_items=2, count=word_count), [[0, 1], [2, 3], [4]])
+
+    def test_adaptive_limit_halves_once_per_burst_and_recovers(self):
+        now = [0.0]
+        limit = AdaptiveLimit(8, clock=lambda: now[0])
+        for _ in range(3):
+            limit.acquire()
+        limit.release(retry_after=1.0)
+        limit.release(retry_after=1.0)
+        self.assertEqual(limit.limit, 4)
+        now[0] = 2.0
+        limit.release()
+        for _ in range(4):
+            limit.acquire()
+            limit.release()
+        self.assertEqual(limit.limit, 5)
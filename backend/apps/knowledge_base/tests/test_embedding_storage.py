@@ -0,0 +1,35 @@
+from django.test import SimpleTestCase, override_settings
+from apps.knowledge_base.embedding_storage import (
+    bytes_per_vector, cast_sql, column_type, opclass, reduce, storage,
+)
+from apps.knowledge_base.retrieval import build_search_sql
+from apps.knowledge_base.vector_index import create_index_sql
+
+
+class EmbeddingStorageTest(SimpleTestCase):
+    def test_defaults_store_full_float32_vectors(self):
+        self.assertEqual(storage(), ("vector", 1536))
+        self.assertEqual(column_type(), "vector(1536)")
+        self.assertEqual(opclass(), "vector_cosine_ops")
+        self.assertEqual(reduce([0.5] * 1536), [0.5] * 1536)
+
+    @override_settings(KB_EMBEDDING_STORAGE="halfvec", KB_EMBEDDING_DIMENSIONS=2)
+    def test_reduced_halfvec_storage(self):
+        self.assertEqual(column_type(), "halfvec(2)")
+        self.assertEqual(reduce([0.1, 0.2, 0.3]), [0.1, 0.2])
+        self.assertIsNone(reduce(None))
+        self.assertEqual(cast_sql("dc.embedding", "halfvec", 2), "((dc.embedding)::real[])[1:2]::halfvec(2)")
+        self.assertIn("USING hnsw (embedding halfvec_cosine_ops)", create_index_sql("hnsw", {"m": 16}, table="t"))
+
+        sql, params = build_search_sql("org", [0.1, 0.2, 0.3], 6)
+        self.assertIn("dc.embedding <=> %s::halfvec(2) AS score", sql)
+        self.assertEqual(params[1], str([0.1, 0.2]))
+
+    def test_rejects_unknown_storage(self):
+        for settings in ({"KB_EMBEDDING_STORAGE": "bit"}, {"KB_EMBEDDING_DIMENSIONS": 3072}):
+            with self.subTest(**settings), override_settings(**settings), self.assertRaises(ValueError):
+                storage()
+
+    def test_bytes_per_vector(self):
+        self.assertEqual(bytes_per_vector("vector", 1536), 6152)
+        self.assertEqual(bytes_per_vector("halfvec", 768), 1544)
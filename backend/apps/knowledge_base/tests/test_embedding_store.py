@@ -0,0 +1,71 @@
+import importlib
+from datetime import timedelta
+from unittest.mock import patch
+from django.apps import apps
+from django.test import TestCase
+from django.utils import timezone
+from apps.accounts.models import Organization
+from apps.knowledge_base import embedding_store
+from apps.knowledge_base.embedding_store import content_hash, embed_chunks, prune_unreferenced
+from apps.knowledge_base.models import ChunkEmbedding, DocumentChunk, KnowledgeDocument
+
+
+def fake_embed(texts, batch_size=64):
+    return [[float(len(t))] + [0.0] * 1535 for t in texts]
+
+
+class EmbedChunksTest(TestCase):
+    @patch.object(embedding_store, "embed_texts", side_effect=fake_embed)
+    def test_reuses_stored_embeddings(self, mock_embed):
+        vecs, hashes, stats = embed_chunks(["alpha", "beta", "alpha"])
+        self.assertEqual(mock_embed.call_args.args[0], ["alpha", "beta"])
+        self.assertEqual([v[0] for v in vecs], [5.0, 4.0, 5.0])
+        self.assertEqual(hashes[0], content_hash("alpha"))
+        self.assertEqual(stats.as_dict(), {"chunks": 3, "reused": 1, "embedded": 2, "hit_rate": 0.3333})
+        self.assertEqual(ChunkEmbedding.objects.count(), 2)
+
+        mock_embed.reset_mock()
+        vecs, _, stats = embed_chunks(["beta", "gamma", "alpha"])
+        self.assertEqual(mock_embed.call_args.args[0], ["gamma"])
+        self.assertEqual([float(v[0]) for v in vecs], [4.0, 5.0, 5.0])
+        self.assertEqual((stats.reused, stats.embedded), (2, 1))
+
+    def test_hash_is_model_scoped(self):
+        self.assertNotEqual(content_hash("x", model="a"), content_hash("x", model="b"))
+
+
+class PruneUnreferencedTest(TestCase):
+    def test_deletes_only_old_rows_no_chunk_uses(self):
+        vec = [0.0] * 1536
+        for h in ("used", "orphan", "fresh"):
+            ChunkEmbedding.objects.create(content_hash=h, model="m", embedding=vec)
+        ChunkEmbedding.objects.exclude(content_hash="fresh").update(created_at=timezone.now() - timedelta(days=2))
+        org = Organization.objects.create(name="Prune Org")
+        doc = KnowledgeDocument.objects.create(organization=org, title="t", file_name="t.txt")
+        DocumentChunk.objects.create(document=doc, organization=org, chunk_index=0, text="x", content_hash="used")
+
+        self.assertEqual(prune_unreferenced(batch_size=1), 1)
+        self.assertEqual(sorted(ChunkEmbedding.objects.values_list("content_hash", flat=True)), ["fresh", "used"])
+
+
+class SeedMigrationTest(TestCase):
+    def test_seeded_rows_are_referenced_by_the_chunks_they_came_from(self):
+        migration = importlib.import_module("apps.knowledge_base.migrations.0006_chunkembedding")
+        org = Organization.objects.create(name="Seed Org")
+        doc = KnowledgeDocument.objects.create(organization=org, title="t", file_name="t.txt")
+        for i, text in enumerate(["alpha", "beta", "alpha"]):
+            DocumentChunk.objects.create(document=doc, organization=org, chunk_index=i, text=text,
+                                         embedding=[float(i)] + [0.0] * 1535)
+        DocumentChunk.objects.create(document=doc, organization=org, chunk_index=3, text="unembedded")
+
+        migration.seed_chunk_embeddings(apps, None)
+
+        hashes = list(DocumentChunk.objects.order_by("chunk_index").values_list("content_hash", flat=True))
+        self.assertEqual(hashes, [content_hash(t) for t in ["alpha", "beta", "alpha", "unembedded"]])
+        self.assertEqual(ChunkEmbedding.objects.count(), 2)
+
+        later = timezone.now() + timedelta(days=2)
+        with patch.object(embedding_store.timezone, "now", return_value=later):
+            self.assertEqual(prune_unreferenced(), 0)
+        self.assertEqual(ChunkEmbedding.objects.count(), 2)
+
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+import docx
+from django.test import SimpleTestCase, override_settings
+from reportlab.pdfgen import canvas
+from apps.knowledge_base import extractor_registry
+from apps.knowledge_base.extractor_registry import (
+    ExtractedPages, ExtractorBackend, backends_for, detect_format, extract_pages,
+)
+
+
+class ExtractorRegistryTest(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def make_pdf(self, name, pages=2):
+        pdf = canvas.Canvas(self.path(name))
+        for page in range(1, pages + 1):
+            pdf.drawString(72, 720, f"page {page} narrative")
+            pdf.showPage()
+        pdf.save()
+        return self.path(name)
+
+    def test_detects_format_from_content(self):
+        mislabelled = self.make_pdf("report.txt")
+        document = docx.Document()
+        document.add_paragraph("Theory of change")
+        document.save(self.path("proposal.bin"))
+        with open(self.path("notes.md"), "w") as f:
+            f.write("# Notes")
+
+        self.assertEqual(detect_format(mislabelled), "pdf")
+        self.assertEqual(detect_format(self.path("proposal.bin")), "docx")
+        self.assertEqual(detect_format(self.path("notes.md")), "text")
+        with open(self.path("upload"), "w") as f:
+            f.write("a,b\n1,2\n")
+        self.assertEqual(detect_format(self.path("upload"), "text/csv; charset=utf-8"), "spreadsheet")
+
+    def test_pdf_pages_and_backend(self):
+        pages = extract_pages(self.make_pdf("report.pdf", pages=3))
+        texts = list(pages)
+        self.assertEqual([n for n, _ in texts], [1, 2, 3])
+        self.assertEqual(pages.page_count, 3)
+        self.assertEqual(pages.backend, "pymupdf")
+
+    def test_falls_through_failing_and_empty_backends(self):
+        def broken(path):
+            raise ValueError("cannot parse")
+            yield
+
+        def empty(path):
+            yield 1, "   "
+
+        def working(path):
+            yield 1, "budget narrative"
+            return 7
+
+        pages = ExtractedPages("x.pdf", [
+            ExtractorBackend("broken", "pdf", broken, 1),
+            ExtractorBackend("empty", "pdf", empty, 2),
+            ExtractorBackend("working", "pdf", working, 3),
+        ])
+        self.assertIn((1, "budget narrative"), list(pages))
+        self.assertEqual(pages.backend, "working")
+        self.assertEqual(pages.page_count, 7)
+
+    def test_raises_when_every_backend_fails(self):
+        def broken(path):
+            raise ValueError("cannot parse")
+            yield
+
+        with self.assertRaises(ValueError):
+            list(ExtractedPages("x.pdf", [ExtractorBackend("broken", "pdf", broken, 1)]))
+
+    @override_settings(KB_EXTRACTOR_BACKENDS={"pdf": ["pdfplumber"]})
+    def test_preferred_backend_order(self):
+        self.assertEqual([b.name for b in backends_for("pdf")], ["pdfplumber", "pymupdf", "pypdf2"])
+
+    def test_unsupported_type(self):
+        with open(self.path("image.png"), "wb") as f:
+            f.write(b"\x89PNG\r\n")
+        with self.assertRaises(ValueError):
+            extract_pages(self.path("image.png"), mime_type="image/png")
+
+    def test_default_pdf_workers_share_cpus_between_concurrent_tasks(self):
+        with patch.object(extractor_registry.os, "cpu_count", return_value=8):
+            with override_settings(KB_PDF_EXTRACT_WORKERS=0, CELERY_WORKER_CONCURRENCY=None):
+                self.assertEqual(extractor_registry._pdf_workers(), 1)
+            with override_settings(KB_PDF_EXTRACT_WORKERS=0, CELERY_WORKER_CONCURRENCY=2):
+                self.assertEqual(extractor_registry._pdf_workers(), 4)
+            with override_settings(KB_PDF_EXTRACT_WORKERS=3, CELERY_WORKER_CONCURRENCY=2):
+                self.assertEqual(extractor_registry._pdf_workers(), 3)
+
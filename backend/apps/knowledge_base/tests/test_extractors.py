@@ -0,0 +1,65 @@
+import io
+import os
+import tempfile
+from unittest.mock import patch
+import billiard
+from django.test import SimpleTestCase
+from reportlab.pdfgen import canvas
+from apps.knowledge_base import extractors
+from apps.knowledge_base.extractors import iter_pdf_pages
+
+
+def _extract_in_pool(path, queue):
+    # runs in a daemonic billiard process, like a task in Celery's prefork pool
+    queue.put((extractors._can_fork_workers(), list(iter_pdf_pages(path, workers=2, shard_pages=2))))
+
+
+class IterPdfPagesTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        fd, cls.path = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+        buf = io.BytesIO()
+        pdf = canvas.Canvas(buf)
+        for page in range(1, 6):
+            pdf.drawString(72, 720, f"page {page} of the annual report")
+            pdf.showPage()
+        pdf.save()
+        with open(cls.path, "wb") as f:
+            f.write(buf.getvalue())
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.path)
+        super().tearDownClass()
+
+    def test_parallel_shards_reassemble_in_order(self):
+        sequential = list(iter_pdf_pages(self.path))
+        parallel = list(iter_pdf_pages(self.path, workers=2, shard_pages=2))
+        self.assertEqual(parallel, sequential)
+        self.assertEqual([n for n, _ in parallel], [1, 2, 3, 4, 5])
+        self.assertIn("page 4", parallel[3][1])
+
+    def test_falls_back_to_pymupdf(self):
+        with patch.object(extractors.pdfplumber, "open", side_effect=Exception("broken xref")):
+            pages = list(iter_pdf_pages(self.path, shard_pages=3))
+        self.assertEqual(len(pages), 5)
+        self.assertIn("page 5", pages[4][1])
+
+    def test_sequential_inside_daemonic_process(self):
+        with patch.object(extractors, "_can_fork_workers", return_value=False), \
+                patch.object(extractors, "ProcessPoolExecutor") as pool:
+            pages = list(iter_pdf_pages(self.path, workers=4, shard_pages=1))
+        pool.assert_not_called()
+        self.assertEqual(len(pages), 5)
+
+    def test_parallel_inside_celery_prefork_child(self):
+        queue = billiard.get_context("fork").Queue()
+        child = billiard.Process(target=_extract_in_pool, args=(self.path, queue), daemon=True)
+        child.start()
+        can_fork, pages = queue.get(timeout=60)
+        child.join()
+        self.assertTrue(can_fork)
+        self.assertEqual(pages, list(iter_pdf_pages(self.path)))
+
@@ -0,0 +1,122 @@
+import shutil
+import tempfile
+from unittest.mock import Mock, patch
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from apps.accounts.models import Organization
+from apps.knowledge_base import ingest_coordinator, tasks
+from apps.knowledge_base.ingest_coordinator import enqueue_ingest, ingest_lock, stats
+from apps.knowledge_base.models import KnowledgeDocument
+
+User = get_user_model()
+
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "ingest-tests"}}
+
+
+@override_settings(CACHES=LOCMEM)
+@patch.object(tasks.ingest_document, "delay")
+class IngestCoordinatorTest(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+
+    def test_duplicate_enqueues_coalesce_until_the_run_starts(self, mock_delay):
+        self.assertTrue(enqueue_ingest("doc-1"))
+        self.assertFalse(enqueue_ingest("doc-1"))
+        self.assertTrue(enqueue_ingest("doc-2"))
+        self.assertEqual([c.args for c in mock_delay.call_args_list], [("doc-1",), ("doc-2",)])
+
+        with ingest_lock("doc-1") as acquired:
+            self.assertTrue(acquired)
+            self.assertTrue(enqueue_ingest("doc-1"))  # may change what the next run sees
+        self.assertEqual(stats(), {"enqueued": 3, "coalesced": 1, "skipped_running": 0, "rerun": 0})
+
+    def test_lock_is_single_flight(self, mock_delay):
+        with ingest_lock("doc-1") as first:
+            with ingest_lock("doc-1") as second:
+                self.assertEqual((first, second), (True, False))
+        with ingest_lock("doc-1") as again:
+            self.assertTrue(again)
+        self.assertEqual(stats()["skipped_running"], 1)
+
+    def test_run_skipped_behind_the_lock_is_not_lost(self, mock_delay):
+        with ingest_lock("doc-1"):
+            self.assertTrue(enqueue_ingest("doc-1"))  # a reindex while the run is going
+            with ingest_lock("doc-1") as second:  # its task starts before the first run is done
+                self.assertFalse(second)
+            self.assertFalse(enqueue_ingest("doc-1"))  # coalesces into the pending rerun
+            self.assertEqual(mock_delay.call_count, 1)
+        mock_delay.assert_called_with("doc-1", force=True)
+        self.assertEqual(stats(), {"enqueued": 2, "coalesced": 1, "skipped_running": 1, "rerun": 1})
+
+        with ingest_lock("doc-1") as rerun:  # and nothing is pending after it
+            self.assertTrue(rerun)
+        self.assertEqual(mock_delay.call_count, 2)
+
+    def test_unavailable_cache_does_not_block_ingestion(self, mock_delay):
+        with patch.object(ingest_coordinator, "_cache", side_effect=ConnectionError("redis down")):
+            self.assertTrue(enqueue_ingest("doc-1"))
+            self.assertTrue(enqueue_ingest("doc-1"))
+            with ingest_lock("doc-1") as acquired:
+                self.assertTrue(acquired)
+        self.assertEqual(mock_delay.call_count, 2)
+
+
+@override_settings(CACHES=LOCMEM)
+class IngestTaskLockTest(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        owner = User.objects.create_superuser(email="owner@example.com", password="pass")
+        org = Organization.objects.create(name="LockOrg", created_by=owner)
+        self.doc = KnowledgeDocument.objects.create(organization=org, title="Report", file="knowledge_docs/r.txt",
+                                                    status="processing")
+
+    @patch.object(tasks.ingest_document, "delay")
+    @patch.object(tasks, "ingest_batch")
+    def test_tasks_skip_documents_being_ingested(self, mock_batch, mock_delay):
+        with ingest_lock(self.doc.id):
+            self.assertIsNone(tasks.ingest_document(str(self.doc.id)))
+            self.assertIsNone(tasks.ingest_documents([str(self.doc.id)]))
+        mock_batch.assert_not_called()
+        self.assertEqual(stats()["skipped_running"], 2)
+        mock_delay.assert_called_once_with(str(self.doc.id), force=True)
+
+    @patch.object(tasks, "ingest_batch")
+    def test_forced_run_reingests_a_ready_document(self, mock_batch):
+        self.doc.status = "ready"
+        self.doc.save(update_fields=["status"])
+        mock_batch.return_value = ({str(self.doc.id): Mock(chunks=2, unchanged=True)}, Mock())
+
+        self.assertIsNone(tasks.ingest_document(str(self.doc.id)))
+        mock_batch.assert_not_called()
+        self.assertTrue(tasks.ingest_document(str(self.doc.id), force=True)["unchanged"])
+        mock_batch.assert_called_once()
+
+
+@override_settings(CACHES=LOCMEM)
+@patch.object(tasks.ingest_document, "delay")
+class UploadEnqueuesOnceTest(APITestCase):
+    def test_upload_and_reindex_burst(self, mock_delay):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        caches["default"].clear()
+        owner = User.objects.create_superuser(email="owner@example.com", password="pass")
+        org = Organization.objects.create(name="UploadOrg", created_by=owner)
+        self.client.force_authenticate(User.objects.create_user(email="m@upload.org", password="pass", organization=org))
+
+        with self.settings(MEDIA_ROOT=media), self.captureOnCommitCallbacks(execute=True):
+            # "documents-list" reverses to the documents app's route of the same name
+            response = self.client.post("/api/knowledge_base/documents/",
+                                        {"file": SimpleUploadedFile("a.txt", b"water"), "title": "A"}, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        mock_delay.assert_called_once_with(str(response.data["id"]))
+
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                reindex = self.client.post(reverse("documents-reindex", args=[response.data["id"]]))
+            self.assertEqual(reindex.status_code, 202)
+        self.assertEqual(mock_delay.call_count, 1)  # the upload's run is still queued
+        self.assertEqual(stats()["coalesced"], 3)
@@ -0,0 +1,191 @@
+import io
+import shutil
+import tempfile
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from reportlab.pdfgen import canvas
+from apps.accounts.models import Organization
+from apps.knowledge_base import chunker, embedding_store, ingest, tasks
+from apps.knowledge_base.chunker import chunk_pages, chunk_text_with_tokens, count_tokens
+from apps.knowledge_base.models import KnowledgeDocument
+from apps.knowledge_base.tests.helpers import WordEncoding
+
+User = get_user_model()
+
+
+def fake_embed(texts, batch_size=64):
+    return [[float(len(t))] + [0.0] * 1535 for t in texts]
+
+
+@patch.object(chunker, "get_encoding", lambda name=None: WordEncoding())
+class ChunkPagesTest(SimpleTestCase):
+    def test_chunks_record_page_span_and_tokens(self):
+        pages = [(1, "a b c\nd e f"), (2, "g h i\n\nj k l"), (3, "m n o")]
+        chunks = list(chunk_pages(pages, chunk_size=8, overlap=4))
+        self.assertEqual([(c.page_start, c.page_end) for c in chunks], [(1, 1), (1, 2), (2, 2), (2, 3)])
+        self.assertEqual(chunks[1].text, "d e f\ng h i")
+        self.assertEqual([c.tokens for c in chunks], [7, 7, 7, 7])
+
+    def test_chunk_text_has_no_pages(self):
+        text = "one two\nthree four\nfive six"
+        self.assertEqual(chunk_text_with_tokens(text, chunk_size=6, overlap=0), [("one two\nthree four", 5), ("five six", 2)])
+        self.assertIsNone(next(chunk_pages([(None, text)])).page_start)
+
+    def test_long_paragraph_split_into_token_windows(self):
+        chunks = list(chunk_pages([(1, "a b c d e f g")], chunk_size=4, overlap=1))
+        self.assertEqual([c.text for c in chunks], ["a b c d", "d e f g", "g"])
+        self.assertTrue(all(c.tokens <= 4 for c in chunks))
+
+
+class ChunkTokenCountTest(SimpleTestCase):
+    def test_counts_match_tiktoken_on_the_chunk_text(self):
+        # cl100k merges trailing punctuation with a newline ("." + "\n"), which per-paragraph counts must allow for
+        lines = [f"Outcome {i}: reach {i * 70} households." if i % 2 else f"Indicator {i} (baseline)!"
+                 for i in range(120)]
+        pages = [(1, "\n".join(lines)), (2, "Budget narrative, résumé — see annex. " * 60)]
+        chunks = list(chunk_pages(pages, chunk_size=50, overlap=10))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual([c.tokens for c in chunks], [count_tokens(c.text) for c in chunks])
+
+
+@patch.object(chunker, "get_encoding", lambda name=None: WordEncoding())
+@patch.object(embedding_store, "embed_texts", side_effect=fake_embed)
+class IngestDocumentPipelineTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        owner = User.objects.create_superuser(email="owner@example.com", password="pass")
+        self.org = Organization.objects.create(name="PipelineOrg", created_by=owner)
+
+    def make_pdf(self, pages):
+        buf = io.BytesIO()
+        pdf = canvas.Canvas(buf)
+        for page in range(1, pages + 1):
+            for line in range(3):
+                pdf.drawString(72, 720 - 20 * line, f"page {page} line {line} results framework")
+            pdf.showPage()
+        pdf.save()
+        with self.settings(MEDIA_ROOT=self.media):
+            doc = KnowledgeDocument(organization=self.org, title="Report", status="processing")
+            doc.file.save("report.pdf", ContentFile(buf.getvalue()), save=True)
+        return doc
+
+    @override_settings(KB_CHUNK_TOKENS=12, KB_CHUNK_OVERLAP=0, KB_INGEST_WINDOW_CHUNKS=2)
+    def test_pdf_is_written_in_windows_with_pages(self, mock_embed):
+        doc = self.make_pdf(pages=4)
+        with self.settings(MEDIA_ROOT=self.media):
+            result = tasks.ingest_document(str(doc.id))
+
+        doc.refresh_from_db()
+        self.assertEqual(doc.status, "ready")
+        self.assertEqual(doc.pages, 4)
+        chunks = list(doc.chunks.order_by("chunk_index"))
+        self.assertEqual([c.chunk_index for c in chunks], list(range(len(chunks))))
+        self.assertEqual(result["chunks"], len(chunks))
+        self.assertEqual(chunks[0].page_start, 1)
+        self.assertEqual(chunks[-1].page_end, 4)
+        self.assertTrue(all(c.page_start <= c.page_end for c in chunks))
+        # one embedding call per window, never the whole document at once
+        self.assertTrue(all(len(call.args[0]) <= 2 for call in mock_embed.call_args_list))
+
+    @override_settings(KB_CHUNK_TOKENS=4, KB_CHUNK_OVERLAP=0, KB_INGEST_WINDOW_CHUNKS=4)
+    def test_batch_shares_embedding_windows_across_documents(self, mock_embed):
+        with self.settings(MEDIA_ROOT=self.media):
+            docs = []
+            for name, text in [("a.txt", "one two three four five six"), ("b.txt", "seven eight nine"),
+                               ("c.exe", "binary"), ("d.txt", "")]:
+                doc = KnowledgeDocument(organization=self.org, title=name, status="processing")
+                doc.file.save(name, ContentFile(text.encode()), save=True)
+                docs.append(doc)
+            result = tasks.ingest_documents.apply(args=([str(d.id) for d in docs],)).get()
+
+        statuses = {d.title: (d.status, d.chunks.count()) for d in KnowledgeDocument.objects.all()}
+        self.assertEqual(statuses, {"a.txt": ("ready", 2), "b.txt": ("ready", 1),
+                                    "c.exe": ("failed", 0), "d.txt": ("failed", 0)})
+        self.assertEqual(result["documents"][str(docs[1].id)], {"status": "ready", "chunks": 1, "unchanged": 0})
+        self.assertEqual(list(docs[1].chunks.values_list("chunk_index", flat=True)), [0])
+        # a's two chunks and b's one went out in a single embedding request
+        self.assertEqual(mock_embed.call_count, 1)
+        self.assertEqual(len(mock_embed.call_args.args[0]), 3)
+
+    @override_settings(KB_CHUNK_TOKENS=2, KB_CHUNK_OVERLAP=0, KB_INGEST_WINDOW_CHUNKS=2)
+    def test_extractor_error_fails_only_that_document(self, mock_embed):
+        real_extract = ingest.extract_pages
+
+        def extract(file_path, mime_type=""):
+            if not file_path.endswith("broken.txt"):
+                return real_extract(file_path, mime_type=mime_type)
+
+            def pages():  # a backend that breaks after its first page
+                yield 1, "one two three four five"
+                raise KeyError("word/document.xml")
+            return pages()
+
+        with self.settings(MEDIA_ROOT=self.media):
+            docs = []
+            for name, text in [("broken.txt", "x"), ("fine.txt", "six seven eight")]:
+                doc = KnowledgeDocument(organization=self.org, title=name, status="processing")
+                doc.file.save(name, ContentFile(text.encode()), save=True)
+                docs.append(doc)
+            with patch.object(ingest, "extract_pages", side_effect=extract):
+                tasks.ingest_documents.apply(args=([str(d.id) for d in docs],)).get()
+
+        broken, fine = [KnowledgeDocument.objects.get(id=d.id) for d in docs]
+        self.assertEqual((broken.status, broken.chunks.count()), ("failed", 0))
+        self.assertIn("word/document.xml", broken.error_message)
+        self.assertEqual((fine.status, fine.chunks.count()), ("ready", 2))
+
+
+@patch.object(chunker, "get_encoding", lambda name=None: WordEncoding())
+@patch.object(embedding_store, "embed_texts", side_effect=fake_embed)
+@override_settings(KB_CHUNK_TOKENS=3, KB_CHUNK_OVERLAP=0, KB_INGEST_WINDOW_CHUNKS=3)
+class IncrementalReingestTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.org = Organization.objects.create(name="ReingestOrg")
+        with self.settings(MEDIA_ROOT=self.media):
+            self.doc = KnowledgeDocument(organization=self.org, title="notes", status="processing")
+            self.doc.file.save("notes.txt", ContentFile(b""), save=True)
+
+    def reindex(self, text):
+        KnowledgeDocument.objects.filter(id=self.doc.id).update(status="uploaded")
+        with self.settings(MEDIA_ROOT=self.media):
+            with open(self.doc.file.path, "w") as f:
+                f.write(text)
+            return tasks.ingest_document(str(self.doc.id))
+
+    def test_only_changed_chunks_are_embedded_and_written(self, mock_embed):
+        self.reindex("a b c d e f g h i j k")
+        ids = dict(self.doc.chunks.values_list("text", "id"))
+        result = self.reindex("x y z a b c g h i j k")
+
+        chunks = list(self.doc.chunks.order_by("chunk_index").values_list("chunk_index", "text", "id"))
+        self.assertEqual([(i, t) for i, t, _ in chunks], [(0, "x y z"), (1, "a b c"), (2, "g h i"), (3, "j k")])
+        for _, text, chunk_id in chunks[1:]:
+            self.assertEqual(chunk_id, ids[text])
+        self.assertEqual(mock_embed.call_args.args[0], ["x y z"])
+        self.assertEqual((result["chunks"], result["unchanged"]), (4, 2))  # "a b c" moved
+
+    @patch.object(ingest, "bump_kb_generation")
+    def test_unchanged_file_rewrites_nothing(self, mock_bump, mock_embed):
+        self.reindex("a b c d e f g h i j k")
+        ids = dict(self.doc.chunks.values_list("text", "id"))
+        mock_embed.reset_mock()
+        mock_bump.reset_mock()
+        result = self.reindex("a b c d e f g h i j k")
+
+        self.assertEqual(result["unchanged"], 4)
+        self.assertEqual(dict(self.doc.chunks.values_list("text", "id")), ids)
+        mock_embed.assert_not_called()
+        mock_bump.assert_not_called()
+
+    @override_settings(KB_INCREMENTAL_REINGEST=False)
+    def test_full_reingest_replaces_every_chunk(self, mock_embed):
+        self.reindex("a b c d e f g h i j k")
+        ids = set(self.doc.chunks.values_list("id", flat=True))
+        self.reindex("a b c d e f g h i j k")
+        self.assertEqual(self.doc.chunks.count(), 4)
+        self.assertFalse(set(self.doc.chunks.values_list("id", flat=True)) & ids)
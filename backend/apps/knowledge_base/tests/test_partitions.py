@@ -0,0 +1,26 @@
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase
+from apps.accounts.models import Organization
+from apps.knowledge_base.models import DocumentChunk, KnowledgeDocument
+from apps.knowledge_base.partitions import drop_partition, ensure_partition, partition_name
+
+
+@skipUnless(connection.vendor == "postgresql", "chunk partitions are PostgreSQL only")
+class EnsurePartitionTest(TestCase):
+    def test_rows_in_default_partition_move_to_new_partition(self):
+        org = Organization.objects.create(name="Stray Org")
+        drop_partition(org.id)  # as if the organization predates its partition
+        doc = KnowledgeDocument.objects.create(organization=org, title="t", file_name="t.txt", status="ready")
+        chunk = DocumentChunk.objects.create(document=doc, organization=org, chunk_index=0,
+                                             text="budget framework", tokens=2)
+
+        ensure_partition(org.id)
+
+        with connection.cursor() as cur:
+            cur.execute(
+                f"SELECT id, search_vector @@ plainto_tsquery('english', 'budget') FROM {partition_name(org.id)}"
+            )
+            self.assertEqual(cur.fetchall(), [(chunk.id, True)])
+            cur.execute("SELECT count(*) FROM kb_chunk_org_default WHERE organization_id = %s", [org.id])
+            self.assertEqual(cur.fetchone()[0], 0)
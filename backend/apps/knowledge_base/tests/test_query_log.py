@@ -0,0 +1,150 @@
+import random
+from unittest import skipUnless
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from apps.accounts.models import Organization, Role, UserRole
+from apps.knowledge_base.models import SearchQueryLog
+from apps.knowledge_base import query_log
+from apps.knowledge_base.query_log import QueryLogBuffer, StageTimer, latency_summary, percentile
+
+User = get_user_model()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StageTimerTest(SimpleTestCase):
+    def test_stages_accumulate(self):
+        clock = FakeClock()
+        timer = StageTimer(clock=clock)
+        for seconds in (0.010, 0.005):
+            with timer.stage("sql"):
+                clock.now += seconds
+        with timer.stage("embed"):
+            clock.now += 0.120
+        clock.now += 0.001
+
+        self.assertEqual(timer.log_fields(), {"sql_ms": 15.0, "embed_ms": 120.0, "latency_ms": 136})
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, p) for p in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual(percentile([7], 99), 7)
+
+
+class QueryLogBufferTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create_superuser(email="owner@example.com", password="pass")
+        self.org = Organization.objects.create(name="LogOrg", created_by=owner)
+
+    def entry(self, **fields):
+        return SearchQueryLog(organization=self.org, query_text="water", **fields)
+
+    def test_flushes_in_batches(self):
+        clock = FakeClock()
+        buffer = QueryLogBuffer(batch_size=3, flush_seconds=5, clock=clock)
+        buffer.add(self.entry())
+        buffer.add(self.entry())
+        self.assertFalse(buffer.due())
+        buffer.add(self.entry())
+        self.assertTrue(buffer.due())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(SearchQueryLog.objects.count(), 3)
+        self.assertFalse(buffer.due())
+
+    def test_old_entries_become_due(self):
+        clock = FakeClock()
+        buffer = QueryLogBuffer(batch_size=100, flush_seconds=5, clock=clock)
+        buffer.add(self.entry())
+        clock.now += 5
+        self.assertTrue(buffer.due())
+
+    def test_full_buffer_drops_oldest(self):
+        buffer = QueryLogBuffer(max_pending=2)
+        for top_k in (1, 2, 3):
+            buffer.add(self.entry(top_k=top_k))
+        buffer.flush()
+        self.assertEqual(sorted(SearchQueryLog.objects.values_list("top_k", flat=True)), [2, 3])
+
+    def test_summary_per_stage(self):
+        SearchQueryLog.objects.bulk_create(
+            [self.entry(latency_ms=100 + i, embed_ms=80.0, sql_ms=float(i)) for i in range(1, 101)]
+            + [self.entry(latency_ms=5, sql_ms=1.0, cached=True)]
+        )
+        [summary] = latency_summary(SearchQueryLog.objects.all())
+
+        self.assertEqual(summary["organization_name"], "LogOrg")
+        self.assertEqual(summary["queries"], 101)
+        self.assertEqual(summary["cache_hit_rate"], round(1 / 101, 4))
+        self.assertEqual(summary["stages"]["sql"], {"count": 101, "p50": 50.0, "p95": 95.0, "p99": 99.0})
+        self.assertEqual(summary["stages"]["embed"]["count"], 100)
+        self.assertNotIn("llm", summary["stages"])
+
+    @skipUnless(connection.vendor == "postgresql", "percentile_disc is PostgreSQL only")
+    def test_database_percentiles_match_python(self):
+        other = Organization.objects.create(name="OtherLogOrg")
+        rng = random.Random(7)
+        SearchQueryLog.objects.bulk_create(
+            [self.entry(latency_ms=rng.randint(5, 900), sql_ms=rng.random() * 50, cached=rng.random() < 0.2)
+             for _ in range(257)]
+            + [SearchQueryLog(organization=other, query_text="x", latency_ms=12, llm_ms=700.5)]
+        )
+        logs = SearchQueryLog.objects.all()
+        self.assertEqual(sorted(query_log._timings_in_sql(logs), key=str),
+                         sorted(query_log._timings_in_python(logs), key=str))
+        with patch.object(query_log, "_timings_in_python") as python_path:
+            summary = latency_summary(logs)
+        python_path.assert_not_called()
+        self.assertEqual([org["queries"] for org in summary], [257, 1])
+        self.assertEqual(summary[1]["stages"]["llm"], {"count": 1, "p50": 700.5, "p95": 700.5, "p99": 700.5})
+
+
+class SearchAnalyticsAPITest(APITestCase):
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(email="root@example.com", password="pass")
+        self.org = Organization.objects.create(name="Org A", created_by=self.superuser)
+        other = Organization.objects.create(name="Org B", created_by=self.superuser)
+        self.admin = User.objects.create_user(email="admin@a.org", password="pass", organization=self.org)
+        UserRole.objects.create(user=self.admin, role=Role.objects.create(name="admin"))
+        self.member = User.objects.create_user(email="member@a.org", password="pass", organization=self.org)
+        SearchQueryLog.objects.bulk_create([
+            SearchQueryLog(organization=self.org, query_text="q", source="search", latency_ms=40, sql_ms=4.0),
+            SearchQueryLog(organization=self.org, query_text="q", source="chat", latency_ms=900, llm_ms=800.0),
+            SearchQueryLog(organization=other, query_text="q", source="search", latency_ms=60),
+        ])
+        self.url = reverse("search-analytics-list")
+
+    def test_org_admin_sees_own_organization(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(self.url, {"source": "chat"})
+        self.assertEqual(response.status_code, 200)
+        [org] = response.data["organizations"]
+        self.assertEqual((org["organization_name"], org["queries"]), ("Org A", 1))
+        self.assertEqual(org["stages"]["llm"]["p95"], 800.0)
+        self.assertNotIn("caches", response.data)  # deployment-wide, superusers only
+
+    def test_superuser_sees_every_organization(self):
+        self.client.force_authenticate(self.superuser)
+        with patch("apps.knowledge_base.views.ingest_stats", return_value={"enqueued": 3, "coalesced": 2}):
+            response = self.client.get(self.url)
+        self.assertEqual([o["organization_name"] for o in response.data["organizations"]], ["Org A", "Org B"])
+        self.assertIn("hit_rate", response.data["caches"]["query_embeddings"])
+        self.assertEqual(response.data["caches"]["ingestion"], {"enqueued": 3, "coalesced": 2})
+
+    def test_members_and_bad_parameters_are_rejected(self):
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(self.url, {"days": "week"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"source": "email"}).status_code, 400)
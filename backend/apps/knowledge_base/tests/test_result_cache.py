@@ -0,0 +1,127 @@
+from unittest.mock import AsyncMock, patch
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from apps.accounts.models import Organization
+from apps.knowledge_base import async_views, query_log, result_cache
+from apps.knowledge_base.models import KnowledgeDocument
+from apps.knowledge_base.result_cache import ResultCache, bump_kb_generation
+from apps.knowledge_base.retrieval import SearchFilters, SearchHit
+
+User = get_user_model()
+
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "result-tests"}}
+HITS = [SearchHit(chunk_id="c1", document_id="d1", document_title="Annual report", chunk_index=0,
+                  snippet="Boreholes serve 4,000 households.", score=0.2)]
+
+
+@override_settings(CACHES=LOCMEM)
+class ResultCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.cache = ResultCache(ttl=60)
+
+    def test_round_trip_and_normalized_query(self):
+        key, cached = self.cache.lookup("org", "boreholes  in Kisumu", top_k=6, mode="auto")
+        self.assertIsNone(cached)
+        self.cache.store(key, HITS, "hybrid")
+
+        _, cached = self.cache.lookup("org", " boreholes in Kisumu ", top_k=6, mode="auto")
+        self.assertEqual(cached, (HITS, "hybrid"))
+
+    def test_parameters_are_part_of_the_key(self):
+        key, _ = self.cache.lookup("org", "water", top_k=6, mode="auto")
+        self.cache.store(key, HITS, "hybrid")
+
+        for org, params in [("other", {"top_k": 6, "mode": "auto"}),
+                            ("org", {"top_k": 3, "mode": "auto"}),
+                            ("org", {"top_k": 6, "mode": "lexical"}),
+                            ("org", {"top_k": 6, "mode": "auto", "filters": SearchFilters(document_ids=["d1"])})]:
+            self.assertIsNone(self.cache.lookup(org, "water", **params)[1], (org, params))
+
+    def test_bump_invalidates_only_that_organization(self):
+        for org in ("org", "other"):
+            key, _ = self.cache.lookup(org, "water", top_k=6)
+            self.cache.store(key, HITS, "vector")
+
+        self.cache.bump("org")
+        self.cache.bump("never-searched")  # no counter yet
+
+        self.assertIsNone(self.cache.lookup("org", "water", top_k=6)[1])
+        self.assertIsNotNone(self.cache.lookup("other", "water", top_k=6)[1])
+
+    def test_disabled(self):
+        self.assertEqual(ResultCache(ttl=0).lookup("org", "water"), (None, None))
+
+
+@override_settings(CACHES=LOCMEM)
+class ResultCacheInvalidationTest(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        owner = User.objects.create_superuser(email="owner@example.com", password="pass")
+        self.org = Organization.objects.create(name="CacheOrg", created_by=owner)
+        self.user = User.objects.create_user(email="member@cache.org", password="pass", organization=self.org)
+        self.cache = ResultCache(ttl=60)
+        patcher = patch.object(result_cache, "get_result_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cached(self):
+        return self.cache.lookup(self.org.id, "water", top_k=6)[1]
+
+    def warm(self):
+        key, _ = self.cache.lookup(self.org.id, "water", top_k=6)
+        self.cache.store(key, HITS, "vector")
+
+    def test_document_changes_invalidate(self):
+        with patch("apps.knowledge_base.signals.enqueue_ingest"):
+            doc = KnowledgeDocument.objects.create(
+                organization=self.org, uploaded_by=self.user, title="Report",
+                file="knowledge_docs/report.txt", status="ready",
+            )
+        self.warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            doc.save(update_fields=["status"])
+        self.assertIsNotNone(self.cached())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            doc.is_active = False
+            doc.save(update_fields=["is_active"])
+        self.assertIsNone(self.cached())
+
+        self.warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            doc.delete()
+        self.assertIsNone(self.cached())
+
+    def test_bump_waits_for_commit(self):
+        self.warm()
+        with self.captureOnCommitCallbacks() as callbacks:
+            bump_kb_generation(self.org.id)
+            self.assertIsNotNone(self.cached())
+        callbacks[0]()
+        self.assertIsNone(self.cached())
+
+
+@override_settings(CACHES=LOCMEM)
+class CachedSearchViewTest(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        owner = User.objects.create_superuser(email="owner@example.com", password="pass")
+        self.org = Organization.objects.create(name="CacheViewOrg", created_by=owner)
+        self.user = User.objects.create_user(email="member@cacheview.org", password="pass", organization=self.org)
+        self.headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+        patcher = patch.object(query_log, "get_query_log", return_value=query_log.QueryLogBuffer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_repeated_search_is_served_from_cache(self):
+        with patch.object(async_views, "ahybrid_search", AsyncMock(return_value=(HITS, "hybrid"))) as search:
+            for query in ("households", "  households "):
+                response = await self.async_client.post(reverse("kb-search"), {"query": query},
+                                                        content_type="application/json", headers=self.headers)
+                self.assertEqual(response.json()["results"][0]["chunk_id"], "c1")
+                self.assertEqual(response.json()["mode"], "hybrid")
+        self.assertEqual(search.await_count, 1)
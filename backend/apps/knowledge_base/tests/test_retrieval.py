@@ -0,0 +1,116 @@
+import uuid
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+from django.test import SimpleTestCase
+from apps.knowledge_base import retrieval
+from apps.knowledge_base.retrieval import (
+    build_lexical_sql, build_search_sql, fuse_hits, hybrid_search, is_exact_lookup, SearchFilters, SearchHit,
+)
+
+
+def hit(chunk_id, score=None, lexical_rank=None):
+    return SearchHit(chunk_id=chunk_id, document_id="d", document_title="Doc", chunk_index=0,
+                     snippet="...", score=score, lexical_rank=lexical_rank)
+
+
+class BuildSearchSQLTest(SimpleTestCase):
+    def setUp(self):
+        self.org_id = uuid.uuid4()
+        self.vec = [0.1, 0.2, 0.3]
+
+    def test_ann_plan_with_snippet(self):
+        sql, params = build_search_sql(self.org_id, self.vec, 6)
+        self.assertIn("LEFT(dc.text, %s)", sql)
+        self.assertNotIn("MATERIALIZED", sql)
+        self.assertTrue(sql.rstrip().endswith("ORDER BY score ASC LIMIT %s"))
+        self.assertEqual(params, [600, str(self.vec), self.org_id, 6])
+        self.assertEqual(sql.count("%s"), len(params))
+
+    def test_exact_plan_with_filters(self):
+        doc_id = uuid.uuid4()
+        after = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        filters = SearchFilters(document_ids=[doc_id], mime_types=["application/pdf"], created_after=after)
+        sql, params = build_search_sql(self.org_id, self.vec, 3, filters, snippet_chars=None, exact=True)
+        self.assertIn("WITH candidates AS MATERIALIZED", sql)
+        self.assertIn("dc.text,", sql)
+        self.assertIn("dc.document_id = ANY(%s::uuid[])", sql)
+        self.assertIn("kd.mime_type = ANY(%s)", sql)
+        self.assertIn("kd.created_at >= %s", sql)
+        self.assertEqual(params, [str(self.vec), self.org_id, [str(doc_id)], ["application/pdf"], after, 3])
+        self.assertEqual(sql.count("%s"), len(params))
+
+    def test_document_filter_is_selective(self):
+        self.assertTrue(SearchFilters(document_ids=[uuid.uuid4()]).is_selective())
+        self.assertFalse(SearchFilters(mime_types=["text/plain"]).is_selective())
+
+
+class BuildLexicalSQLTest(SimpleTestCase):
+    def test_full_text_query_with_filters(self):
+        org_id, doc_id = uuid.uuid4(), uuid.uuid4()
+        sql, params = build_lexical_sql(org_id, '"MTP IV" targets', 5, SearchFilters(document_ids=[doc_id]))
+        self.assertIn("websearch_to_tsquery('english', %s)", sql)
+        self.assertIn("dc.search_vector @@ q.query", sql)
+        self.assertIn("dc.document_id = ANY(%s::uuid[])", sql)
+        self.assertTrue(sql.rstrip().endswith("ORDER BY rank DESC LIMIT %s"))
+        self.assertEqual(params, [600, '"MTP IV" targets', org_id, [str(doc_id)], 5])
+        self.assertEqual(sql.count("%s"), len(params))
+
+
+class HybridSearchTest(SimpleTestCase):
+    def test_fusion_rewards_chunks_found_by_both(self):
+        vector = [hit("a", 0.1), hit("b", 0.2), hit("c", 0.3)]
+        lexical = [hit("c", lexical_rank=0.9), hit("d", lexical_rank=0.5)]
+        fused = fuse_hits(vector, lexical, top_k=3)
+
+        self.assertEqual([h.chunk_id for h in fused], ["c", "a", "b"])
+        self.assertEqual((fused[0].score, fused[0].lexical_rank), (0.3, 0.9))
+        self.assertAlmostEqual(fused[0].fused_score, 1 / 63 + 1 / 61, places=6)
+
+    def test_exact_lookup_detection(self):
+        for query in ['"climate smart agriculture"', "MTP IV", "KE-2024/17", "SDG 6"]:
+            self.assertTrue(is_exact_lookup(query), query)
+        for query in ["water access in Kisumu", "MTP targets", ""]:
+            self.assertFalse(is_exact_lookup(query), query)
+
+    def test_auto_answers_exact_lookups_without_embedding(self):
+        embed = Mock()
+        with patch.object(retrieval, "lexical_search", return_value=[hit("a", lexical_rank=0.4)]) as lexical:
+            hits, mode = hybrid_search("org", "MTP IV", top_k=2, embed=embed)
+
+        self.assertEqual((mode, [h.chunk_id for h in hits]), ("lexical", ["a"]))
+        self.assertEqual(lexical.call_args.args[2], 8)  # top_k * HYBRID_CANDIDATES
+        embed.assert_not_called()
+
+    def test_auto_fuses_other_queries(self):
+        embed = Mock(return_value=[0.0])
+        with patch.object(retrieval, "lexical_search", return_value=[hit("b", lexical_rank=0.4)]), \
+                patch.object(retrieval, "search", return_value=[hit("a", 0.1), hit("b", 0.2)]) as vector:
+            hits, mode = hybrid_search("org", "how many households have water", top_k=2, embed=embed)
+
+        self.assertEqual((mode, [h.chunk_id for h in hits]), ("hybrid", ["b", "a"]))
+        self.assertEqual(vector.call_args.kwargs["top_k"], 8)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            hybrid_search("org", "water", mode="fuzzy")
+
+
+class EstimatedChunkCountTest(SimpleTestCase):
+    def setUp(self):
+        retrieval._chunk_counts.clear()
+        self.addCleanup(retrieval._chunk_counts.clear)
+
+    def test_reltuples_is_read_once_per_ttl(self):
+        cursor = Mock()
+        cursor.fetchone.side_effect = [(1234.0,), (-1.0,)]
+        connection = Mock()
+        connection.cursor.return_value.__enter__ = Mock(return_value=cursor)
+        connection.cursor.return_value.__exit__ = Mock(return_value=False)
+        org_a, org_b = uuid.uuid4(), uuid.uuid4()
+
+        with patch.object(retrieval, "connection", connection), \
+                patch.object(retrieval, "is_postgres", return_value=True):
+            counts = [retrieval.estimated_chunk_count(org) for org in (org_a, org_a, org_b, org_b)]
+
+        self.assertEqual(counts, [1234, 1234, None, None])  # never analyzed is remembered too
+        self.assertEqual(cursor.execute.call_count, 2)
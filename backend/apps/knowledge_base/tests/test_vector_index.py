@@ -0,0 +1,37 @@
+from django.test import SimpleTestCase, override_settings
+from apps.knowledge_base.vector_index import (
+    create_index_sql, drop_index_sql, index_params, maintenance_work_mem_sql, suggested_ivfflat_lists,
+)
+
+
+class VectorIndexSQLTest(SimpleTestCase):
+    @override_settings(KB_HNSW_M=16, KB_HNSW_EF_CONSTRUCTION=64)
+    def test_hnsw_params_and_overrides(self):
+        self.assertEqual(index_params("hnsw"), {"m": 16, "ef_construction": 64})
+        self.assertEqual(index_params("hnsw", m=32, lists=5), {"m": 32, "ef_construction": 64})
+
+    def test_create_index_sql(self):
+        sql = create_index_sql("hnsw", {"m": 16, "ef_construction": 64}, name="idx", table="t", concurrently=True)
+        self.assertEqual(
+            sql,
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx ON t USING hnsw "
+            "(embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)",
+        )
+        self.assertEqual(drop_index_sql("idx"), "DROP INDEX IF EXISTS idx")
+
+    def test_rejects_unknown_method(self):
+        with self.assertRaises(ValueError):
+            index_params("flat")
+
+    def test_ivfflat_lists_sizing(self):
+        self.assertEqual(suggested_ivfflat_lists(500), 10)
+        self.assertEqual(suggested_ivfflat_lists(200_000), 200)
+        self.assertEqual(suggested_ivfflat_lists(4_000_000), 2000)
+
+    def test_maintenance_work_mem_is_validated(self):
+        self.assertEqual(maintenance_work_mem_sql("2GB"), "SET maintenance_work_mem = '2GB'")
+        self.assertEqual(maintenance_work_mem_sql(" 512 MB", local=True), "SET LOCAL maintenance_work_mem = '512 MB'")
+        for bad in ("2GB'; DROP TABLE knowledge_base_documentchunk; --", "lots", "2 gb", ""):
+            with self.assertRaises(ValueError):
+                maintenance_work_mem_sql(bad)
+
@@ -1,12 +1,16 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DocumentViewSet, semantic_search, ChatSessionViewSet
+from .views import DocumentViewSet, ChatSessionViewSet, SearchAnalyticsViewSet
+from . import async_views
 
 router = DefaultRouter()
 router.register(r"documents", DocumentViewSet, basename="documents")
 router.register(r"chat/sessions", ChatSessionViewSet, basename="chat-sessions")
+router.register(r"search/analytics", SearchAnalyticsViewSet, basename="search-analytics")
 
 urlpatterns = [
+    # async views, ahead of the router so they take these routes
+    path("chat/sessions/<uuid:pk>/message/", async_views.post_message, name="chat-sessions-post-message"),
     path("", include(router.urls)),
-    path("search/", semantic_search, name="kb-search"),
+    path("search/", async_views.semantic_search, name="kb-search"),
 ]
@@ -0,0 +1,97 @@
+"""
+ANN index management for DocumentChunk.embedding (pgvector HNSW / IVFFlat).
+Builds the CREATE/DROP INDEX statements used by migrations and the
+`rebuild_vector_index` command, and applies per-query search settings.
+All helpers are no-ops on non-PostgreSQL databases (e.g. SQLite in tests).
+"""
+import math
+import logging
+import re
+from django.conf import settings
+from .embedding_storage import opclass
+from .models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "kb_chunk_embedding_ann_idx"
+METHODS = ("hnsw", "ivfflat")
+MEMORY_SIZE = re.compile(r"\d+\s*(kB|MB|GB|TB)?")  # a Postgres memory setting, e.g. "2GB"
+
+
+def is_postgres(connection) -> bool:
+    return connection.vendor == "postgresql"
+
+
+def index_params(method: str = None, **overrides) -> dict:
+    """
+    Returns the build parameters for the given method, taken from settings
+    and overridden by any non-None keyword argument.
+    """
+    method = method or getattr(settings, "KB_VECTOR_INDEX_METHOD", "hnsw")
+    if method not in METHODS:
+        raise ValueError(f"Unsupported vector index method: {method}")
+    if method == "hnsw":
+        params = {
+            "m": getattr(settings, "KB_HNSW_M", 16),
+            "ef_construction": getattr(settings, "KB_HNSW_EF_CONSTRUCTION", 64),
+        }
+    else:
+        params = {"lists": getattr(settings, "KB_IVFFLAT_LISTS", 100)}
+    for key, value in overrides.items():
+        if value is not None and key in params:
+            params[key] = int(value)
+    return params
+
+
+def suggested_ivfflat_lists(row_count: int) -> int:
+    """pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) above that."""
+    if row_count <= 1_000_000:
+        return max(row_count // 1000, 10)
+    return int(math.sqrt(row_count))
+
+
+def create_index_sql(method: str, params: dict, name: str = INDEX_NAME, table: str = None,
+                     concurrently: bool = False, only: bool = False, storage_type: str = None) -> str:
+    """
+    only=True creates the index on a partitioned parent without cascading to
+    its partitions; partition indexes are then attached one by one. The
+    operator class (cosine, as queries rank with <=>) follows the embedding
+    storage type, KB_EMBEDDING_STORAGE unless given.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unsupported vector index method: {method}")
+    table = table or DocumentChunk._meta.db_table
+    with_clause = ", ".join(f"{k} = {int(v)}" for k, v in params.items())
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+        f"ON {'ONLY ' if only else ''}{table} USING {method} (embedding {opclass(storage_type)}) WITH ({with_clause})"
+    )
+
+
+def maintenance_work_mem_sql(value: str, local: bool = False) -> str:
+    """SET maintenance_work_mem for an index build; value is checked, since it comes from the command line."""
+    value = value.strip()
+    if not MEMORY_SIZE.fullmatch(value):
+        raise ValueError(f"Invalid memory size {value!r}, expected e.g. '512MB' or '2GB'")
+    return f"SET {'LOCAL ' if local else ''}maintenance_work_mem = '{value}'"
+
+
+def drop_index_sql(name: str = INDEX_NAME, concurrently: bool = False) -> str:
+    return f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {name}"
+
+
+def apply_search_settings(cursor, top_k: int = None, ef_search: int = None, probes: int = None):
+    """
+    Sets hnsw.ef_search / ivfflat.probes for the current transaction.
+    Must be called inside transaction.atomic(), otherwise SET LOCAL has no effect.
+    ef_search is raised to top_k when needed, since HNSW never returns more
+    than ef_search candidates.
+    """
+    if not is_postgres(cursor.db):
+        return
+    ef_search = ef_search or getattr(settings, "KB_HNSW_EF_SEARCH", 40)
+    if top_k:
+        ef_search = max(ef_search, int(top_k))
+    probes = probes or getattr(settings, "KB_IVFFLAT_PROBES", 10)
+    cursor.execute("SELECT set_config('hnsw.ef_search', %s, true), set_config('ivfflat.probes', %s, true)",
+                   [str(int(ef_search)), str(int(probes))])
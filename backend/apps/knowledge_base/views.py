@@ -1,20 +1,36 @@
+import logging
 import os
+from datetime import timedelta
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, mixins, status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.shortcuts import get_object_or_404
 from django.conf import settings
-from .models import KnowledgeDocument, DocumentChunk, ChatSession, ChatMessage
+from django.db import transaction
+from django.utils import timezone
+from django.http import StreamingHttpResponse
+from .models import KnowledgeDocument, DocumentChunk, ChatSession, ChatMessage, SearchQueryLog
 from .serializers import (
     UploadDocumentSerializer, DocumentDetailSerializer,
-    ChunkSerializer, SearchHitSerializer, ChatSessionSerializer, ChatMessageSerializer
+    ChunkSerializer, ChatSessionSerializer, ChatMessageSerializer
 )
-from .permissions import CanUploadDocument, CanManageDocument
-from .tasks import ingest_document
-from .openai_client import embed_texts, chat_with_context
+from .permissions import CanUploadDocument, CanManageDocument, CanViewSearchAnalytics
+from .tasks import ingest_documents
+from .ingest_coordinator import enqueue_ingest, stats as ingest_stats
+from .embedding_cache import get_embedding_cache
+from .bulk_upload import BulkUploadError, collect_uploads
+from .openai_client import embed_query, stream_chat_with_context
 from .chunker import count_tokens
+from .retrieval import search
+from .query_log import StageTimer, latency_summary, record
+from .result_cache import get_result_cache
 from apps.accounts.permissions import IsSameOrganization
+from .sse import EventStreamRenderer, sse_event
+
+logger = logging.getLogger(__name__)
 
 # Upload / list documents
 class DocumentViewSet(mixins.CreateModelMixin,
@@ -39,7 +55,7 @@ class DocumentViewSet(mixins.CreateModelMixin,
         mime_type = f.content_type if hasattr(f, "content_type") else ""
         size_bytes = f.size if hasattr(f, "size") else None
         title = self.request.data.get("title") or file_name
-        doc = serializer.save(
+        serializer.save(
             uploaded_by=self.request.user,
             organization=self.request.user.organization,
             file_name=file_name,
@@ -47,78 +63,81 @@ class DocumentViewSet(mixins.CreateModelMixin,
             size_bytes=size_bytes,
             title=title
         )
-        # enqueue ingestion task
-        ingest_document.delay(str(doc.id))
+        # ingestion is enqueued by the post_save signal (signals.trigger_ingest_on_upload)
 
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated, CanManageDocument])
     def reindex(self, request, pk=None):
         doc = self.get_object()
         doc.status = "uploaded"
         doc.save(update_fields=["status"])
-        ingest_document.delay(str(doc.id))
+        transaction.on_commit(lambda: enqueue_ingest(doc.id))
         return Response({"detail": "Reindexing started"}, status=status.HTTP_202_ACCEPTED)
 
-
-# Search endpoint (semantic)
-from django.db import connection
-from django.db.models import F, Value
-import time
-
-@api_view(["POST"])
-@permission_classes([IsAuthenticated, IsSameOrganization])
-def semantic_search(request):
-    """
-    POST body: {"query": "...", "top_k": 6, "document_ids":[...]}
-    Returns top chunks with score (cosine distance).
-    """
-    query = request.data.get("query", "").strip()
-    if not query:
-        return Response({"detail": "query required"}, status=status.HTTP_400_BAD_REQUEST)
-    top_k = int(request.data.get("top_k", 6))
-    doc_ids = request.data.get("document_ids", None)
-
-    # Embed query
-    q_emb = embed_texts([query], batch_size=1)[0]
-
-    # Raw SQL using pgvector operator <=> (cosine distance) - lower is better
-    # Use dynamic table names to avoid hardcoding errors
-    user_org = request.user.organization
-    with connection.cursor() as cur:
-        # FIX: Convert the embedding list to a string to be interpreted as a vector literal
-        params = [str(q_emb), user_org.id]
-        doc_filter_sql = ""
-        if doc_ids:
-            doc_filter_sql = "AND document_id = ANY(%s)"
-            params.append(doc_ids)
-        sql = f"""
-        SELECT id, document_id, chunk_index, text, embedding <=> %s as score
-        FROM {DocumentChunk._meta.db_table}
-        WHERE document_id IN (
-            SELECT id FROM {KnowledgeDocument._meta.db_table} WHERE organization_id = %s AND is_active = true
-        )
-        {doc_filter_sql}
-        ORDER BY score ASC
-        LIMIT %s
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
         """
-        params.append(top_k)
-        cur.execute(sql, params)
-        rows = cur.fetchall()
-    hits = []
-    for r in rows:
-        chunk_id, document_id, chunk_idx, text, score = r[0], r[1], r[2], r[3], float(r[4])
-        snippet = text[:600]
-        hits.append({
-            "chunk_id": chunk_id,
-            "document_id": document_id,
-            "snippet": snippet,
-            "score": score,
-            "chunk_index": chunk_idx,
-        })
-
-    return Response({"results": hits})
+        Multipart upload of many documents: any number of "files" fields
+        and/or one zip "archive". Registers them in one insert and ingests
+        them in jobs of KB_BULK_INGEST_DOCUMENTS, whose embedding requests
+        and chunk inserts are shared across documents.
+        """
+        try:
+            accepted, skipped = collect_uploads(request.FILES.getlist("files"), request.FILES.get("archive"))
+        except BulkUploadError as e:
+            return Response({"detail": str(e)}, status=400)
+
+        docs = []
+        try:
+            # one file at a time, streamed to storage
+            for upload in accepted:
+                doc = KnowledgeDocument(
+                    uploaded_by=request.user, organization=request.user.organization, title=upload.name,
+                    file_name=upload.name, mime_type=upload.mime_type, size_bytes=upload.size,
+                )
+                with upload.open() as f:
+                    doc.file.save(upload.name, f, save=False)
+                docs.append(doc)
+            # bulk_create sends no post_save, so nothing is enqueued per document
+            with transaction.atomic():
+                KnowledgeDocument.objects.bulk_create(docs)
+                ids = [str(doc.id) for doc in docs]
+                per_job = getattr(settings, "KB_BULK_INGEST_DOCUMENTS", 50)
+                jobs = [ids[i:i + per_job] for i in range(0, len(ids), per_job)]
+                transaction.on_commit(lambda: [ingest_documents.delay(job) for job in jobs])
+        except Exception:
+            # don't leave stored files without a document
+            for doc in docs:
+                doc.file.delete(save=False)
+            raise
+
+        return Response({
+            "documents": UploadDocumentSerializer(docs, many=True).data,
+            "skipped": [{"name": s.name, "reason": s.reason} for s in skipped],
+            "ingestion_jobs": len(jobs),
+        }, status=status.HTTP_202_ACCEPTED)
 
 
 # Chat endpoints
+def chat_system_prompt() -> str:
+    return getattr(settings, "KB_SYSTEM_PROMPT", "You are a helpful assistant. Use the context to answer the user's question and cite sources.")
+
+
+def chat_context_chunks(hits) -> list:
+    return [
+        {"text": h.snippet, "source": str(h.document_id), "score": h.score}
+        for h in hits
+    ]
+
+
+def save_chat_exchange(session, question, answer, context_chunks):
+    # persist chat messages
+    with transaction.atomic():
+        ChatMessage.objects.create(session=session, role="user", content=question, citations=None)
+        assistant_msg = ChatMessage.objects.create(session=session, role="assistant", content=answer, citations=context_chunks)
+        session.save()  # update updated_at
+    return assistant_msg
+
+
 class ChatSessionViewSet(viewsets.ModelViewSet):
     serializer_class = ChatSessionSerializer
     queryset = ChatSession.objects.all()
@@ -131,51 +150,104 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user, organization=self.request.user.organization)
 
-    @action(detail=True, methods=["post"], url_path="message")
-    def post_message(self, request, pk=None):
-        session = self.get_object()
+    def _question_context(self, request, timer: StageTimer):
+        """The question, the KB chunks to answer it from, and whether they came from the result cache."""
         question = request.data.get("question", "").strip()
         if not question:
-            return Response({"detail": "question required"}, status=400)
+            return None, None, False
         top_k = int(request.data.get("top_k", 6))
 
-        # embed query and pull top chunks
-        q_emb = embed_texts([question], batch_size=1)[0]
-
-        from django.db import connection
-        with connection.cursor() as cur:
-            # FIX: Use dynamic table names from model metadata, just like in semantic_search
-            sql = f"""
-            SELECT id, document_id, chunk_index, text, embedding <=> %s as score
-            FROM {DocumentChunk._meta.db_table}
-            WHERE document_id IN (
-                SELECT id FROM {KnowledgeDocument._meta.db_table} WHERE organization_id = %s AND is_active = true
-            )
-            ORDER BY score ASC
-            LIMIT %s
-            """
-            cur.execute(sql, [str(q_emb), request.user.organization.id, top_k])
-            rows = cur.fetchall()
-
-        context_chunks = []
-        for r in rows:
-            chunk_id, document_id, chunk_idx, text, score = r[0], r[1], r[2], r[3], float(r[4])
-            context_chunks.append({
-                "text": text,
-                "source": str(document_id),
-                "score": score
-            })
-
-        system_prompt = getattr(settings, "KB_SYSTEM_PROMPT", "You are a helpful assistant. Use the context to answer the user's question and cite sources.")
-        answer = chat_with_context(system_prompt, question, context_chunks)
-
-        # persist chat messages
-        user_msg = ChatMessage.objects.create(session=session, role="user", content=question, citations=None)
-        assistant_msg = ChatMessage.objects.create(session=session, role="assistant", content=answer, citations=context_chunks)
-
-        session.save()  # update updated_at
-        return Response({
-            "answer": answer,
-            "citations": context_chunks,
-            "assistant_message_id": str(assistant_msg.id)
-        }, status=200)
\ No newline at end of file
+        org_id = request.user.organization_id
+        cache = get_result_cache()
+        key, cached = cache.lookup(org_id, question, top_k=top_k, snippet_chars=1000, mode="vector")
+        if cached:
+            hits = cached[0]
+        else:
+            # embed query and pull top chunks
+            with timer.stage("embed"):
+                q_emb = embed_query(question)
+            with timer.stage("sql"):
+                hits = search(org_id, q_emb, top_k=top_k, snippet_chars=1000)
+            cache.store(key, hits, "vector")
+        return question, chat_context_chunks(hits), bool(cached)
+
+    # POST <pk>/message/ is served by async_views.post_message
+
+    @action(detail=True, methods=["post"], url_path="message/stream",
+            renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [EventStreamRenderer])
+    def stream_message(self, request, pk=None):
+        """
+        post_message answered as server-sent events: "citations" once the KB
+        has been searched, a "token" event per piece of the answer, then
+        "done" with the stored message id, or "error". The messages are only
+        stored once the answer is complete.
+        """
+        session = self.get_object()
+        timer = StageTimer()
+        question, context_chunks, cached = self._question_context(request, timer)
+        if not question:
+            return Response({"detail": "question required"}, status=400)
+        system_prompt = chat_system_prompt()
+
+        async def events():
+            yield sse_event("citations", context_chunks)
+            parts = []
+            try:
+                with timer.stage("llm"):
+                    async for delta in stream_chat_with_context(system_prompt, question, context_chunks):
+                        parts.append(delta)
+                        yield sse_event("token", {"delta": delta})
+            except Exception as e:
+                logger.error(f"Streaming chat answer failed for session {session.id}: {e}", exc_info=True)
+                yield sse_event("error", {"detail": "Answer generation failed"})
+                return
+            assistant_msg = await sync_to_async(save_chat_exchange)(session, question, "".join(parts), context_chunks)
+            record(request, "chat_stream", question, int(request.data.get("top_k", 6)), timer, len(context_chunks),
+                   mode="vector", cached=cached)
+            yield sse_event("done", {"assistant_message_id": str(assistant_msg.id)})
+
+        response = StreamingHttpResponse(events(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # don't let nginx hold events back
+        return response
+
+
+class SearchAnalyticsViewSet(viewsets.ViewSet):
+    """
+    Where search and chat latency goes: p50/p95/p99 of the total and of each
+    stage (embed, sql, llm, serialize) per organization, from SearchQueryLog.
+    ?days=7 (up to 90), ?source=search|chat|chat_stream; superusers see every
+    organization or one via ?organization=<id>, org admins their own.
+    Superusers also get the deployment-wide counters: query embedding cache
+    hits (this web process) and ingestion runs coalesced or skipped (all workers).
+    """
+    permission_classes = [IsAuthenticated, CanViewSearchAnalytics]
+
+    def list(self, request):
+        try:
+            days = min(max(int(request.query_params.get("days", 7)), 1), 90)
+        except ValueError:
+            return Response({"detail": "days must be an integer"}, status=400)
+        since = timezone.now() - timedelta(days=days)
+        logs = SearchQueryLog.objects.filter(created_at__gte=since)
+        if not request.user.is_superuser:
+            logs = logs.filter(organization=request.user.organization)
+        elif request.query_params.get("organization"):
+            logs = logs.filter(organization_id=request.query_params["organization"])
+        source = request.query_params.get("source")
+        if source:
+            if source not in dict(SearchQueryLog.SOURCE_CHOICES):
+                return Response({"detail": "unknown source"}, status=400)
+            logs = logs.filter(source=source)
+        data = {"since": since, "days": days, "organizations": latency_summary(logs)}
+        if request.user.is_superuser:
+            data["caches"] = {"query_embeddings": get_embedding_cache().stats(), "ingestion": self._ingest_stats()}
+        return Response(data)
+
+    @staticmethod
+    def _ingest_stats():
+        try:
+            return ingest_stats()
+        except Exception as e:  # counters live in Redis; analytics must not fail without it
+            logger.warning(f"Ingestion counters unavailable: {e}")
+            return None
@@ -73,6 +73,11 @@ DOC_SYSTEM_PROMPT = (
     "   - Keep paragraphs short (3–5 sentences max).\n"
     "   - Where possible, cross-link sections (e.g., 'As outlined in the Budget section...').\n"
 )
+# Sections drafted concurrently by ai_generate_document (see apps/documents/services/generation.py)
+DOC_GENERATION_MAX_WORKERS = config('DOC_GENERATION_MAX_WORKERS', default=4, cast=int)
+# Token ceiling for a section prompt before KB sources are added, and the size of section summaries used to fit it
+DOC_PROMPT_TOKEN_BUDGET = config('DOC_PROMPT_TOKEN_BUDGET', default=6000, cast=int)
+DOC_SECTION_SUMMARY_TOKENS = config('DOC_SECTION_SUMMARY_TOKENS', default=250, cast=int)
 KB_CHUNK_TOKENS = 900
 KB_CHUNK_OVERLAP = 150
 
@@ -91,6 +96,15 @@ CORS_ALLOWED_ORIGINS = config(
 
 CELERY_BROKER_URL = "redis://redis:6379/0"   # match your docker service name
 CELERY_RESULT_BACKEND = "redis://redis:6379/0"
+# Tasks each worker runs at once (unset: one per CPU). PDF extraction splits the remaining CPUs, see KB_PDF_EXTRACT_WORKERS
+CELERY_WORKER_CONCURRENCY = config('CELERY_WORKER_CONCURRENCY', default='', cast=lambda v: int(v) if v else None)
+CELERY_BEAT_SCHEDULE = {
+    # ChunkEmbedding rows are shared across tenants, so they are pruned once unreferenced, not on delete
+    "prune-chunk-embeddings": {
+        "task": "apps.knowledge_base.tasks.prune_chunk_embeddings",
+        "schedule": 24 * 3600,
+    },
+}
 
 OPENAI_API_KEY = config("OPENAI_API_KEY", default=None)
 
@@ -145,8 +159,58 @@ KB_EMBEDDING_MODEL = config('KB_EMBEDDING_MODEL', default='text-embedding-3-smal
 KB_CHAT_MODEL = config('KB_CHAT_MODEL', default='gpt-3.5-turbo')
 KB_CHUNK_TOKENS = config('KB_CHUNK_TOKENS', default=900, cast=int)
 KB_CHUNK_OVERLAP = config('KB_CHUNK_OVERLAP', default=150, cast=int)
+# Chunks embedded and written per step of the streaming ingestion pipeline (bounds worker memory)
+KB_INGEST_WINDOW_CHUNKS = config('KB_INGEST_WINDOW_CHUNKS', default=256, cast=int)
+# Reindexing keeps chunks whose text is unchanged (same ids) and rewrites only the rest; False replaces all
+KB_INCREMENTAL_REINGEST = config('KB_INCREMENTAL_REINGEST', default=True, cast=bool)
+# Bulk uploads (documents/bulk/): limits, and documents per ingest_documents job
+KB_BULK_UPLOAD_MAX_FILES = config('KB_BULK_UPLOAD_MAX_FILES', default=500, cast=int)
+KB_BULK_UPLOAD_MAX_BYTES = config('KB_BULK_UPLOAD_MAX_BYTES', default=500 * 1024 * 1024, cast=int)
+KB_BULK_INGEST_DOCUMENTS = config('KB_BULK_INGEST_DOCUMENTS', default=50, cast=int)
+DATA_UPLOAD_MAX_NUMBER_FILES = KB_BULK_UPLOAD_MAX_FILES + 1  # Django's default of 100 would cap bulk uploads
+# Single-flight ingestion (ingest_coordinator): how long a queued run or a running one blocks duplicates
+KB_INGEST_QUEUED_TTL = config('KB_INGEST_QUEUED_TTL', default=600, cast=int)
+KB_INGEST_LOCK_TTL = config('KB_INGEST_LOCK_TTL', default=3600, cast=int)
+KB_INGEST_LOCK_ALIAS = 'default'
+# Embedding requests: tokens per request (the API allows up to 300k) and requests in flight at once
+KB_EMBEDDING_BATCH_TOKENS = config('KB_EMBEDDING_BATCH_TOKENS', default=32000, cast=int)
+KB_EMBEDDING_MAX_CONCURRENCY = config('KB_EMBEDDING_MAX_CONCURRENCY', default=4, cast=int)
+# PDF text extraction: shards of KB_PDF_SHARD_PAGES pages across a process pool
+# (0 workers = CPUs // CELERY_WORKER_CONCURRENCY, 1 = in-process)
+KB_PDF_EXTRACT_WORKERS = config('KB_PDF_EXTRACT_WORKERS', default=0, cast=int)
+KB_PDF_SHARD_PAGES = config('KB_PDF_SHARD_PAGES', default=16, cast=int)
+# Extraction backend order per format, overriding the speed ranking, e.g. {"pdf": ["pdfplumber", "pymupdf"]};
+# see apps/knowledge_base/extractor_registry.py and `manage.py benchmark_extractors`
+KB_EXTRACTOR_BACKENDS = {}
 KB_SYSTEM_PROMPT = config('KB_SYSTEM_PROMPT', default='You are an assistant that answers based on provided context and cites sources.')
 
+# ANN index on DocumentChunk.embedding ("hnsw" or "ivfflat"), see apps/knowledge_base/vector_index.py
+KB_VECTOR_INDEX_METHOD = config('KB_VECTOR_INDEX_METHOD', default='hnsw')
+KB_HNSW_M = config('KB_HNSW_M', default=16, cast=int)
+KB_HNSW_EF_CONSTRUCTION = config('KB_HNSW_EF_CONSTRUCTION', default=64, cast=int)
+KB_HNSW_EF_SEARCH = config('KB_HNSW_EF_SEARCH', default=40, cast=int)
+KB_IVFFLAT_LISTS = config('KB_IVFFLAT_LISTS', default=100, cast=int)
+KB_IVFFLAT_PROBES = config('KB_IVFFLAT_PROBES', default=10, cast=int)
+# Stored chunk embeddings: "vector" (float32) or "halfvec" (float16, pgvector >= 0.7), keeping the first
+# KB_EMBEDDING_DIMENSIONS dimensions; apply changes with `manage.py convert_embedding_storage`
+KB_EMBEDDING_STORAGE = config('KB_EMBEDDING_STORAGE', default='vector')
+KB_EMBEDDING_DIMENSIONS = config('KB_EMBEDDING_DIMENSIONS', default=1536, cast=int)
+# Organizations with at most this many chunks are searched exactly (no ANN recall loss)
+KB_EXACT_SEARCH_MAX_ROWS = config('KB_EXACT_SEARCH_MAX_ROWS', default=20000, cast=int)
+# Seconds each process reuses an organization's chunk count estimate (pg_class.reltuples)
+KB_CHUNK_COUNT_CACHE_TTL = config('KB_CHUNK_COUNT_CACHE_TTL', default=300, cast=int)
+# Query embedding cache: in-process LRU in front of CACHES['default']
+KB_EMBEDDING_CACHE_MAX_ENTRIES = config('KB_EMBEDDING_CACHE_MAX_ENTRIES', default=2048, cast=int)
+KB_EMBEDDING_CACHE_TTL = config('KB_EMBEDDING_CACHE_TTL', default=7 * 24 * 3600, cast=int)
+KB_EMBEDDING_CACHE_ALIAS = 'default'
+# Search/chat retrieval results, invalidated per organization on any KB change; 0 disables
+KB_RESULT_CACHE_TTL = config('KB_RESULT_CACHE_TTL', default=600, cast=int)
+KB_RESULT_CACHE_ALIAS = 'default'
+# SearchQueryLog entries are buffered per process and bulk-inserted after a response is sent
+KB_QUERY_LOG_ENABLED = config('KB_QUERY_LOG_ENABLED', default=True, cast=bool)
+KB_QUERY_LOG_BATCH = config('KB_QUERY_LOG_BATCH', default=200, cast=int)
+KB_QUERY_LOG_FLUSH_SECONDS = config('KB_QUERY_LOG_FLUSH_SECONDS', default=5.0, cast=float)
+
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -177,6 +241,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+# Served by uvicorn (see docker-compose.yml) so the async KB views don't hold a thread while waiting on OpenAI
+ASGI_APPLICATION = 'core.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path, include
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -20,3 +21,6 @@ urlpatterns = [
     # Documents app
     path("api/documents/", include("apps.documents.urls")),
 ]
+
+# uvicorn doesn't serve static files the way runserver does (no-op unless DEBUG)
+urlpatterns += staticfiles_urlpatterns()